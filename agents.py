@@ -1,16 +1,29 @@
 import numpy as np
+import pandas as pd
 import random
 import datetime
-from datetime import timedelta
 import json
 import logging
-from dataclasses import asdict
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait, FIRST_COMPLETED
+from typing import Dict, Optional
 
 from config import (
-    SAMPLES, WORKSHOPS, FLEET_SIZE, 
+    DB_PATH, BLACKBOX_DIR, SAMPLES, WORKSHOPS, FLEET_SIZE, GEO_K_NEAREST,
+    FAULT_PARTS, ECU_VERSIONS, RECALL_UNIT_COST_INR, RECALL_DEFAULT_UNIT_COST_INR, SERVICE_LABOR_INR,
+    INVENTORY_LOW_STOCK, INVENTORY_BACKORDER_LEAD_DAYS, BATTERY_RANGE_KM,
+    GENAI_WORKFLOW_BUDGET_S, GENAI_CALL_TIMEOUT_S, GENAI_MAX_INFLIGHT, GENAI_HEDGE_AFTER_S, GENAI_MODEL,
     SYSTEM_INSTRUCTION_DIAGNOSIS, SYSTEM_INSTRUCTION_RCA
 )
-from core import TelemetryFrame, AgentLogStep, PipelineResult, DatabaseManager
+from core import TelemetryFrame, AgentLogStep, PipelineResult, DatabaseManager, Deadline, CircuitBreaker, to_json
+from blackbox import BlackboxArchive
+from fleet import FleetSnapshot, FleetIndex, RecallScopeEngine
+from geo import WorkshopIndex, region_of
+from logistics import SlotAllocator, InventoryStore
+from streaming import UEBAStreamDetector, DriverScoreStream, BatterySOHEstimator, FleetAnomalyScorer
+from dsp import extract_features, envelope_features, is_knock, clip_events, FEATURE_NAMES
 
 # Check for GenAI capability
 try:
@@ -55,6 +68,7 @@ class TelematicsAgent:
         except:
             vid_num = 0
         batch_id = "Batch-2023-A" if vid_num % 2 == 0 else "Batch-2023-B"
+        ecu_version = ECU_VERSIONS[vid_num % len(ECU_VERSIONS)]
         
         # 4. Fault Injection Logic
         if scenario == "Rod Knock":
@@ -93,11 +107,37 @@ class TelematicsAgent:
             temperature=temp, coolant_temp=coolant, oil_pressure=oil, battery_volts=batt,
             brake_wear_pct=brake, tire_pressure=32.0,
             can_codes=codes, batch_id=batch_id, 
-            _secure_lat=secure_lat, _secure_lon=secure_lon
+            _secure_lat=secure_lat, _secure_lon=secure_lon, ecu_version=ecu_version
         )
 
 class DriverBehaviorAgent:
     """Analyzes driving patterns for insurance and safety scoring."""
+    # Tag bit codes for the batch path (scalar tag order is bit order)
+    TAG_AGGRESSIVE = 1
+    TAG_ROUGH = 2
+    TAG_INEFFICIENT = 4
+    TAG_SPEEDING = 8
+    TAG_GENERAL = 16
+    TAGS = {
+        TAG_AGGRESSIVE: {"reason": "Aggressive Acceleration", "impact": -15},
+        TAG_ROUGH: {"reason": "Rough Terrain/Suspension", "impact": -10},
+        TAG_INEFFICIENT: {"reason": "Inefficient Gear Usage", "impact": -5},
+        TAG_SPEEDING: {"reason": "High Speed Violation", "impact": -15},
+        TAG_GENERAL: {"reason": "General Irregularities", "impact": -5},
+    }
+    STATUSES = np.array(["Risky", "Moderate", "Good Driver"])
+    BATCH_COLUMNS = ["speed_kmh", "throttle_pos", "rpm", "temperature", "rms", "brake_wear_pct"]
+
+    def __init__(self):
+        # Per-VIN trip/EWMA aggregates so one harsh frame doesn't define a driver
+        self.stream = DriverScoreStream()
+
+    @staticmethod
+    def status_for(score):
+        if score < 50: return "Risky"
+        if score < 75: return "Moderate"
+        return "Good Driver"
+
     def analyze(self, telemetry: TelemetryFrame):
         # 1. Base Metrics
         t = telemetry
@@ -130,22 +170,20 @@ class DriverBehaviorAgent:
         # 4. Semantic Tagging with Quantification
         tags = []
         if aggression_score > 60: 
-            tags.append({"reason": "Aggressive Acceleration", "impact": -15})
+            tags.append(dict(self.TAGS[self.TAG_AGGRESSIVE]))
         if stability_score < 75: 
-            tags.append({"reason": "Rough Terrain/Suspension", "impact": -10})
+            tags.append(dict(self.TAGS[self.TAG_ROUGH]))
         if eco_index < 50: 
-            tags.append({"reason": "Inefficient Gear Usage", "impact": -5})
+            tags.append(dict(self.TAGS[self.TAG_INEFFICIENT]))
         if t.speed_kmh > 100: 
-            tags.append({"reason": "High Speed Violation", "impact": -15})
+            tags.append(dict(self.TAGS[self.TAG_SPEEDING]))
             final_score -= 10 
 
         # Catch-all
         if final_score < 80 and not tags:
-            tags.append({"reason": "General Irregularities", "impact": -5})
+            tags.append(dict(self.TAGS[self.TAG_GENERAL]))
 
-        status = "Good Driver"
-        if final_score < 75: status = "Moderate"
-        if final_score < 50: status = "Risky"
+        status = self.status_for(final_score)
         
         return {
             "safety_score": final_score, 
@@ -160,57 +198,230 @@ class DriverBehaviorAgent:
             }
         }
 
+    def observe(self, telemetry: TelemetryFrame, analysis=None, ts=None):
+        """Feeds one frame into the driver's streaming aggregates; returns the smoothed trip view."""
+        a = analysis or self.analyze(telemetry)
+        dna = a["dna"]
+        metrics = [dna["efficiency"], dna["aggression"], dna["stability"], dna["braking"], a["safety_score"]]
+        self.stream.update(telemetry.vehicle_id, metrics, telemetry.speed_kmh > 100, ts)
+        trend = self.stream.score(telemetry.vehicle_id)
+        trend["status"] = self.status_for(trend["trip"]["safety"])
+        return trend
+
+    def analyze_batch(self, frames):
+        """
+        Vectorized analyze(): `frames` maps BATCH_COLUMNS (TelemetryFrame field names) to
+        equal-length arrays, e.g. a DataFrame. Returns int score arrays, a status array and a
+        uint8 tag bitmask per row; row i matches analyze() exactly.
+        """
+        speed, throttle, rpm, temp, rms, brake = (np.asarray(frames[c], dtype=np.float64) for c in self.BATCH_COLUMNS)
+
+        eco_index = np.minimum(100, (speed / (throttle + 1)) * 50)
+        agg_raw = (rpm / 6000) * 100 + np.where((temp < 70) & (rpm > 3000), 20, 0)
+        aggression_score = np.minimum(100, agg_raw)
+        stability_score = np.maximum(0, 100 - (rms * 15))
+        braking_score = np.maximum(0, 100 - (brake * 2))
+
+        weighted_score = (0.4 * stability_score) + \
+                         (0.3 * (100 - aggression_score)) + \
+                         (0.2 * braking_score) + \
+                         (0.1 * eco_index)
+        final_score = np.trunc(np.clip(weighted_score, 0, 100)).astype(np.int64)
+
+        speeding = speed > 100
+        codes = (aggression_score > 60) * self.TAG_AGGRESSIVE | (stability_score < 75) * self.TAG_ROUGH | \
+                (eco_index < 50) * self.TAG_INEFFICIENT | speeding * self.TAG_SPEEDING
+        final_score -= speeding * 10
+        codes |= ((final_score < 80) & (codes == 0)) * self.TAG_GENERAL
+
+        return {
+            "safety_score": final_score,
+            "status": self.STATUSES[(final_score >= 50).astype(np.int64) + (final_score >= 75)],
+            "tag_codes": codes.astype(np.uint8),
+            "efficiency": np.trunc(eco_index).astype(np.int64),
+            "aggression": np.trunc(aggression_score).astype(np.int64),
+            "stability": np.trunc(stability_score).astype(np.int64),
+            "braking": np.trunc(braking_score).astype(np.int64),
+        }
+
+    @classmethod
+    def tags_from_codes(cls, code):
+        """Decodes one tag bitmask into the scalar tags list."""
+        return [dict(tag) for bit, tag in cls.TAGS.items() if code & bit]
+
+    def observe_batch(self, vins, frames, ts):
+        """Fleet rescoring + streaming update in one pass; returns the analyze_batch() arrays."""
+        out = self.analyze_batch(frames)
+        metrics = np.column_stack([out["efficiency"], out["aggression"], out["stability"], out["braking"], out["safety_score"]])
+        self.stream.update_batch(vins, metrics, (out["tag_codes"] & self.TAG_SPEEDING) > 0, ts)
+        return out
+
 class BatteryHealthAgent:
     """Deep analysis of EV/Hybrid battery systems."""
+    def __init__(self):
+        # Per-VIN online SOH from the voltage / load / temperature history
+        self.estimator = BatterySOHEstimator()
+
     def check_health(self, telemetry: TelemetryFrame):
-        soh = 98.5
-        if telemetry.battery_volts < 12.5: soh = 82.0 
-        estimated_range = 320 
-        if soh < 90: estimated_range = 280
-        return {"soh_percentage": soh, "estimated_range_km": estimated_range, "cell_imbalance": "None" if telemetry.battery_volts > 13.0 else "Detected (Cell 4)", "charging_cycles": 142}
+        est = self.estimator.update(telemetry.vehicle_id, telemetry.battery_volts, telemetry.throttle_pos / 100, telemetry.temperature)
+        soh = est["soh_percentage"]
+        return {
+            "soh_percentage": soh, "estimated_range_km": int(BATTERY_RANGE_KM * soh / 100),
+            "cell_imbalance": "None" if telemetry.battery_volts > 13.0 else "Detected (Cell 4)",
+            "charging_cycles": est["charge_events"], "ocv_v": est["ocv_v"], "load_drop_v": est["load_drop_v"]
+        }
+
+    def check_health_batch(self, vins, frames):
+        """Fleet update from columnar battery_volts / throttle_pos / temperature; returns SOH % per row."""
+        load = np.asarray(frames["throttle_pos"], dtype=np.float64) / 100
+        return self.estimator.update_batch(vins, frames["battery_volts"], load, frames["temperature"])
 
 class InventoryAgent:
-    """Checks supply chain for parts based on diagnosis."""
-    def check_stock(self, diagnosis):
+    """Checks supply chain for parts based on diagnosis and holds one unit per vehicle."""
+    def __init__(self, store=None):
+        self.store = store or InventoryStore()
+
+    def check_stock(self, diagnosis, vin=None):
         fault = diagnosis.get("fault_type")
         if fault == "Normal": return {"status": "NA", "part": "None", "lead_time_days": 0}
-        if fault == "Rod Knock":
-            in_stock = random.choice([True, False])
-            return {"status": "Available" if in_stock else "Backordered", "part": "Connecting Rod Bearing Kit (Gen3)", "lead_time_days": 1 if in_stock else 14, "warehouse": "Regional Hub - Chennai"}
-        elif fault == "Misfire":
-            return {"status": "Available", "part": "Ignition Coil Pack", "lead_time_days": 0, "warehouse": "Local Dealer"}
-        elif fault == "Mount Failure":
-             return {"status": "Low Stock", "part": "Hydraulic Engine Mount", "lead_time_days": 3, "warehouse": "Regional Hub - Chennai"}
-        return {"status": "Unknown", "part": "General Diagnostics", "lead_time_days": 0}
+        part = FAULT_PARTS.get(fault)
+        if part is None: return {"status": "Unknown", "part": "General Diagnostics", "lead_time_days": 0}
+
+        # Keyed by VIN: a repeat diagnosis reuses the vehicle's hold instead of stacking another
+        rsv = self.store.reserve(part, ref=vin)
+        if rsv is None:
+            return {"status": "Backordered", "part": part, "lead_time_days": INVENTORY_BACKORDER_LEAD_DAYS, "warehouse": "Supplier"}
+        status = "Low Stock" if rsv["remaining"] < INVENTORY_LOW_STOCK else "Available"
+        return {"status": status, "part": part, "lead_time_days": rsv["lead_time_days"], "warehouse": rsv["warehouse"], "reservation_id": rsv["reservation_id"]}
+
+    def release(self, vin) -> bool:
+        """Returns the vehicle's held part to stock (OTA fix, no bay, or no longer faulty)."""
+        rsv = self.store.reservation_for(vin)
+        return rsv is not None and self.store.release(rsv["reservation_id"])
+
+    def complete(self, vin) -> bool:
+        """Job done: the vehicle's held part becomes a sale."""
+        rsv = self.store.reservation_for(vin)
+        return rsv is not None and self.store.fulfil(rsv["reservation_id"])
 
 class GenAIAgent:
-    """Reasoning: Wraps Gemini API."""
-    def __init__(self, name, db, instruction):
+    """
+    Reasoning: Wraps Gemini API.
+    Model calls run on a small worker pool and are abandoned once their deadline (the smaller
+    of GENAI_CALL_TIMEOUT_S and what is left of the workflow budget) passes, so a slow or dead
+    endpoint costs at most that long before the heuristic answers. A circuit breaker skips the
+    model entirely during outages and probes recovery in the background. Optionally hedges:
+    a second request goes out if the first is slower than GENAI_HEDGE_AFTER_S.
+    Every request also carries its deadline as the HTTP client timeout, so an abandoned call
+    (running futures can't be cancelled) still frees its worker once the deadline passes.
+    """
+    def __init__(self, name, db, instruction, hedge_after_s=GENAI_HEDGE_AFTER_S, call_timeout_s=GENAI_CALL_TIMEOUT_S):
         self.name = name
         self.db = db
         self.instruction = instruction
-    
-    def execute(self, inputs, api_key):
+        self.hedge_after_s = hedge_after_s
+        self.call_timeout_s = call_timeout_s
+        self.breaker = CircuitBreaker(name, probe=self._probe)
+        self._pool = ThreadPoolExecutor(max_workers=GENAI_MAX_INFLIGHT, thread_name_prefix=name)
+        self._api_key = None
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    def _log(self, action, details):
+        if self.db is not None:
+            self.db.log_async(self.name, action, details)
+
+    def _count(self, *keys):
+        with self._stats_lock:
+            self._stats.update(keys)
+
+    @staticmethod
+    def _client(api_key, timeout):
+        from google.genai import Client, types
+        return Client(api_key=api_key, http_options=types.HttpOptions(timeout=max(1, int(timeout * 1000))))
+
+    def _call_model(self, inputs, api_key, timeout):
+        client = self._client(api_key, timeout)
+        prompt = f"{self.instruction}\n\nINPUT DATA:\n{to_json(inputs)}"
+        response = client.models.generate_content(model=GENAI_MODEL, contents=prompt)
+        text = response.text
+        if "json" in text: text = text.split("json")[1].split("```")[0]
+        return json.loads(text)
+
+    def _ping(self, api_key, timeout):
+        self._client(api_key, timeout).models.generate_content(model=GENAI_MODEL, contents="ping")
+        return True
+
+    def _probe(self):
+        """Recovery probe for the breaker: one cheap request with the last key seen, same timeout as a call."""
+        if not (HAS_GENAI_LIB and self._api_key):
+            return True
+        return self._pool.submit(self._ping, self._api_key, self.call_timeout_s).result(timeout=self.call_timeout_s)
+
+    def _call_with_deadline(self, inputs, api_key, timeout):
+        # One deadline for the whole call, hedge wait included
+        end = time.monotonic() + timeout
+        futures = [self._pool.submit(self._call_model, inputs, api_key, timeout)]
+        if 0 < self.hedge_after_s < timeout:
+            done, _ = wait(futures, timeout=self.hedge_after_s)
+            if not done:
+                self._count("hedges")
+                futures.append(self._pool.submit(self._call_model, inputs, api_key, end - time.monotonic()))
+        pending = list(futures)
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for f in done:
+                pending.remove(f)
+                if f.exception() is None:
+                    if f is not futures[0]:
+                        self._count("hedge_wins")
+                    return f.result()
+                error = f.exception()
+        for f in pending:
+            f.cancel()
+        raise error or FuturesTimeout(f"no answer within {timeout:.2f}s")
+
+    def execute(self, inputs, api_key, deadline: Optional[Deadline] = None):
+        self._count("calls")
         if HAS_GENAI_LIB and api_key:
-            try:
-                from google.genai import Client
-                client = Client(api_key=api_key)
-                prompt = f"{self.instruction}\n\nINPUT DATA:\n{json.dumps(inputs)}"
-                response = client.models.generate_content(model="gemini-2.0-flash", contents=prompt)
-                self.db.log(self.name, "INFERENCE_SUCCESS", "Gemini 2.0 Flash")
-                text = response.text
-                if "json" in text: text = text.split("json")[1].split("```")[0]
-                return json.loads(text)
-            except Exception as e:
-                self.db.log(self.name, "API_ERROR", str(e))
-                logger.error(f"GenAI Error: {e}")
+            self._api_key = api_key
+            timeout = min(self.call_timeout_s, deadline.remaining() if deadline else self.call_timeout_s)
+            if not self.breaker.allow():
+                self._count("short_circuits")
+            elif timeout <= 0:
+                self._count("budget_exhausted")
+            else:
+                try:
+                    out = self._call_with_deadline(inputs, api_key, timeout)
+                    self.breaker.record_success()
+                    self._count("model_ok")
+                    self._log("INFERENCE_SUCCESS", "Gemini 2.0 Flash")
+                    return out
+                except Exception as e:
+                    self._count("timeouts" if isinstance(e, FuturesTimeout) else "errors")
+                    self.breaker.record_failure()
+                    self._log("API_ERROR", str(e) or type(e).__name__)
+                    logger.error(f"GenAI Error: {e!r}")
         
-        self.db.log(self.name, "FALLBACK_MODE", "Heuristics Applied")
+        self._count("fallbacks")
+        self._log("FALLBACK_MODE", "Heuristics Applied")
         return self._heuristic(inputs)
 
+    def metrics(self) -> Dict:
+        """Call counters plus breaker state, trip count and fallback rate."""
+        with self._stats_lock:
+            m = dict(self._stats)
+        m.update(breaker=self.breaker.state, breaker_trips=self.breaker.trips,
+                 fallback_rate=round(m.get("fallbacks", 0) / max(m.get("calls", 0), 1), 3))
+        return m
+
     def _heuristic(self, inputs):
         if self.name == "DiagnosisAgent":
-            is_fault = inputs.get("rms") > 1.0 or "P0301" in inputs.get("can_codes") or "P0300" in inputs.get("can_codes")
+            knock = "burst_prominence" in inputs and bool(is_knock(inputs["burst_prominence"], inputs.get("band_rms", 0.0)))
+            is_fault = inputs.get("rms") > 1.0 or knock or "P0301" in inputs.get("can_codes") or "P0300" in inputs.get("can_codes")
             f_type = "Normal"
             driver_msg = "Systems nominal."
             safety_tips = ["Maintain regular service intervals.", "Check tire pressure monthly."]
@@ -231,10 +442,26 @@ class GenAIAgent:
                 driver_msg = "Excessive vibration detected. Drive cautiously."
                 safety_tips = ["Avoid rough roads.", "Drive smoothly to minimize vibration."]
                 upload = True
+            elif knock:
+                f_type = "Rod Knock"
+                driver_msg = f"Periodic engine knocking detected ({inputs.get('burst_rate_hz', 0):.0f} Hz). Please pull over safely."
+                safety_tips = ["Do not exceed 30 km/h.", "Avoid highway driving.", "Watch engine temperature gauge."]
+                upload = True
             
             return {"fault_detected": is_fault, "fault_type": f_type, "severity": "Critical" if f_type == "Rod Knock" else ("Medium" if f_type != "Normal" else "Low"), "driver_friendly_message": driver_msg, "safety_tips": safety_tips, "upload_required": upload, "confidence": 0.99 if is_fault else 1.0}
         elif self.name == "RCAAgent":
             ft = inputs.get("fault_type")
+            evidence = inputs.get("fleet_evidence") or []
+            if evidence:
+                # Statistically flagged cluster for this vehicle's batch / ECU version / region
+                # evidence() never offers ECU versions for mechanical faults and ranks unresolved
+                # (confounded) software causes behind physical ones
+                top = evidence[0]
+                ota = top["dimension"] == "ecu_version" and top.get("identified", False)
+                action = "OTA Patch" if ota else {"region": "Regional Service Campaign"}.get(top["dimension"], "Supplier Audit")
+                # Parts only: FinancialAgent adds the labour (RECALL_UNIT_COST_INR is the full service)
+                cost = 0 if ota else RECALL_UNIT_COST_INR.get(ft, RECALL_DEFAULT_UNIT_COST_INR) - SERVICE_LABOR_INR
+                return {"is_batch_defect": True, "batch_id": top["level"], "manufacturing_action": action, "estimated_cost_per_unit": cost, "ota_eligible": ota, "evidence": top}
             if ft == "Rod Knock": return {"is_batch_defect": True, "batch_id": "Batch-2023-A", "manufacturing_action": "Supplier Audit", "estimated_cost_per_unit": 12500, "ota_eligible": False}
             if ft == "Misfire": return {"is_batch_defect": True, "batch_id": "Soft-ECU-v1.2", "manufacturing_action": "OTA Patch", "estimated_cost_per_unit": 0, "ota_eligible": True}
             return {"is_batch_defect": False, "batch_id": None, "manufacturing_action": "None", "estimated_cost_per_unit": 0, "ota_eligible": False}
@@ -243,24 +470,84 @@ class GenAIAgent:
 class FinancialAgent:
     def compute(self, diagnosis, rca):
         raw_cost = rca.get("estimated_cost_per_unit", 0)
-        labor_cost = 1500 if raw_cost > 0 else 0
+        labor_cost = SERVICE_LABOR_INR if raw_cost > 0 and not rca.get("ota_eligible") else 0
         total_estimate = raw_cost + labor_cost
         return {"parts_cost": raw_cost, "labor_cost": labor_cost, "total_estimate_inr": total_estimate, "impact_level": "High" if total_estimate > 5000 else "Low"}
 
 class GPSAgent:
-    def find_nearest_workshop(self, lat, lon):
-        best = min(WORKSHOPS, key=lambda w: abs(w['lat'] - lat) + abs(w['lon'] - lon))
-        dist = round(random.uniform(1.2, 5.5), 1)
-        return {"workshop": best["name"], "coordinates": (best["lat"], best["lon"]), "distance_km": dist, "rating": best["rating"], "eta_mins": int(dist * 4)}
+    """Routes vehicles to workshops via a spatial index built once over the network."""
+    def __init__(self, workshops=WORKSHOPS):
+        self.index = WorkshopIndex(workshops)
+
+    def find_nearest_workshop(self, lat, lon, k=GEO_K_NEAREST):
+        nearby = self.index.nearest(lat, lon, k)
+        best = nearby[0]
+        dist = round(best["distance_km"], 1)
+        return {
+            "workshop": best["name"], "coordinates": (best["lat"], best["lon"]), "distance_km": dist,
+            "rating": best["rating"], "eta_mins": int(dist * 4),
+            "nearby": [{"workshop": w["name"], "distance_km": round(w["distance_km"], 1)} for w in nearby]
+        }
+
+    def find_nearest_batch(self, lats, lons, k=1):
+        """Fleet-wide routing: (workshop indices, haversine km), each shaped (N, k)."""
+        return self.index.query(lats, lons, k)
 
 class SecureSchedulingAgent:
-    def find_slot(self, gps_data):
-        return {"center": gps_data["workshop"], "distance": gps_data["distance_km"], "slot": (datetime.datetime.now() + timedelta(hours=2)).strftime("%Y-%m-%d %H:%M"), "service_id": f"SRV-{random.randint(1000,9999)}"}
+    """Books service bays through the shared capacity-aware slot allocator."""
+    def __init__(self, allocator=None):
+        self.allocator = allocator or SlotAllocator(WORKSHOPS)
+
+    def find_slot(self, gps_data, vin=None):
+        nearby = gps_data.get("nearby") or [{"workshop": gps_data["workshop"], "distance_km": gps_data["distance_km"]}]
+        # Keyed by VIN: a repeat diagnosis keeps the vehicle's booking instead of taking another bay
+        booking = self.allocator.allocate([w["workshop"] for w in nearby], ref=vin)
+        if booking is None:
+            return {"center": gps_data["workshop"], "distance": gps_data["distance_km"], "slot": None, "service_id": None, "status": "NO_CAPACITY"}
+        dist = next(w["distance_km"] for w in nearby if w["workshop"] == booking["workshop"])
+        return {"center": booking["workshop"], "distance": dist, "slot": booking["slot"], "service_id": booking["service_id"], "status": "HELD", "bays_free": booking["bays_free"], "reused": booking["reused"]}
+
+    def release(self, vin) -> bool:
+        """Frees the vehicle's bay (OTA fix, blocked job, no longer faulty, or job done)."""
+        booking = self.allocator.booking_for(vin)
+        return booking is not None and self.allocator.release(booking["service_id"])
+
+    def book_recall(self, gps_list, vins=None):
+        """Batch booking for a recall: one gps_data dict per vehicle, allocated atomically."""
+        candidates = [[w["workshop"] for w in (g.get("nearby") or [g])] for g in gps_list]
+        return self.allocator.allocate_batch(candidates, refs=vins)
 
 class OTAAgent:
     def deploy(self): return "PATCH_V1.3_SUCCESS"
 
 class ComplianceAgent:
+    HIGH_VALUE_INR = 20000
+    OPEN_HOUR, CLOSE_HOUR = 9, 19
+
+    # Alert bit codes for the batch path (scalar alert order is bit order)
+    ALERT_CRITICAL = 1
+    ALERT_HIGH_VALUE = 2
+    ALERT_OUT_OF_HOURS = 4
+    ALERT_MESSAGES = {
+        ALERT_CRITICAL: "Severity Critical Violation",
+        ALERT_HIGH_VALUE: "UEBA: High-Value Transaction Flagged",
+        ALERT_OUT_OF_HOURS: "UEBA: Suspicious Out-of-Hours Booking",
+    }
+    STATUSES = np.array(["COMPLIANT", "VIOLATION", "REVIEW_REQUIRED", "BLOCKED"])
+
+    def __init__(self):
+        self.stream = UEBAStreamDetector(high_value_inr=self.HIGH_VALUE_INR)
+
+    def observe(self, vid, financial, scheduling):
+        """Streaming UEBA: feeds this transaction into the sliding-window detector."""
+        scheduling = scheduling or {}
+        return self.stream.observe(
+            vid,
+            workshop=scheduling.get("center") if scheduling.get("slot") else None,
+            service_id=scheduling.get("service_id"),
+            estimate_inr=(financial or {}).get("total_estimate_inr", 0)
+        )
+
     def check(self, diagnosis, financial, scheduling):
         alerts = []
         status = "COMPLIANT"
@@ -268,21 +555,21 @@ class ComplianceAgent:
         # 1. Base Compliance Check
         if diagnosis.get("severity") == "Critical":
             status = "VIOLATION"
-            alerts.append("Severity Critical Violation")
+            alerts.append(self.ALERT_MESSAGES[self.ALERT_CRITICAL])
 
         # 2. Financial UEBA
-        if financial and financial.get("total_estimate_inr", 0) > 20000:
+        if financial and financial.get("total_estimate_inr", 0) > self.HIGH_VALUE_INR:
             status = "REVIEW_REQUIRED"
-            alerts.append("UEBA: High-Value Transaction Flagged")
+            alerts.append(self.ALERT_MESSAGES[self.ALERT_HIGH_VALUE])
 
         # 3. Scheduling UEBA
         if scheduling and scheduling.get("slot"):
             try:
                 # Parse "YYYY-MM-DD HH:MM"
                 slot_time = datetime.datetime.strptime(scheduling["slot"], "%Y-%m-%d %H:%M")
-                if slot_time.hour < 9 or slot_time.hour >= 19:
+                if slot_time.hour < self.OPEN_HOUR or slot_time.hour >= self.CLOSE_HOUR:
                     status = "BLOCKED"
-                    alerts.append("UEBA: Suspicious Out-of-Hours Booking")
+                    alerts.append(self.ALERT_MESSAGES[self.ALERT_OUT_OF_HOURS])
             except ValueError:
                 pass # Ignore parsing errors
 
@@ -292,29 +579,71 @@ class ComplianceAgent:
             "checked_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
 
+    def check_batch(self, severity, estimate, slot):
+        """
+        Vectorized audit path: one row per transaction.
+        severity: array of str, estimate: total_estimate_inr (NaN = no financial record),
+        slot: datetime64 (NaT = no / unparseable booking).
+        Returns {"status": str array, "alert_codes": uint8 bitmask array}; row i matches check() exactly.
+        """
+        severity = np.asarray(severity, dtype=object)
+        estimate = np.nan_to_num(np.asarray(estimate, dtype=np.float64), nan=0.0)
+        slot = np.asarray(slot, dtype="datetime64[m]")
+
+        critical = severity == "Critical"
+        high_value = estimate > self.HIGH_VALUE_INR
+        hour = (slot - slot.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
+        out_of_hours = ~np.isnat(slot) & ((hour < self.OPEN_HOUR) | (hour >= self.CLOSE_HOUR))
+
+        codes = (critical * self.ALERT_CRITICAL) | (high_value * self.ALERT_HIGH_VALUE) | (out_of_hours * self.ALERT_OUT_OF_HOURS)
+        # Later checks override earlier ones, exactly as in check()
+        status_idx = np.where(out_of_hours, 3, np.where(high_value, 2, np.where(critical, 1, 0)))
+        return {"status": self.STATUSES[status_idx], "alert_codes": codes.astype(np.uint8)}
+
+    @staticmethod
+    def parse_slots(slots):
+        """Slot strings ("YYYY-MM-DD HH:MM", None allowed) -> datetime64 array, NaT where check() would skip."""
+        return pd.to_datetime(pd.Series(slots, dtype=object), format="%Y-%m-%d %H:%M", errors="coerce").to_numpy(dtype="datetime64[m]")
+
+    @classmethod
+    def alerts_from_codes(cls, code):
+        """Decodes one alert bitmask into the scalar ue_alerts list."""
+        return [msg for bit, msg in cls.ALERT_MESSAGES.items() if code & bit]
+
 class CommsModule:
     """Handles logic for packet sizing and data security."""
     def create_payload(self, telemetry, diagnosis):
         upload_required = diagnosis.get('upload_required', False)
         payload = {"v": telemetry.vehicle_id, "ts": telemetry.timestamp, "stat": "OK" if not upload_required else "FAULT", "bat": telemetry.battery_volts, "dtc": []}
-        size_kb = 0.5 
         if upload_required:
             payload["gps"] = {"lat": round(telemetry._secure_lat, 4), "lon": round(telemetry._secure_lon, 4)}
-            payload["waveform_dump"] = telemetry.raw_waveform 
+            # Event-triggered clipping: only transient segments + context; full dump if nothing transient
+            clip = clip_events(telemetry.raw_waveform)
+            if clip["events"]:
+                payload["waveform_events"] = clip
+            else:
+                payload["waveform_dump"] = telemetry.raw_waveform
             payload["dtc"] = telemetry.can_codes
             payload["eng_params"] = {"rpm": telemetry.rpm, "load": telemetry.throttle_pos, "temp": telemetry.temperature}
-            size_kb = 1540.2 
+        size_kb = round(len(to_json(payload)) / 1024, 1)
         return payload, size_kb
 
+    @staticmethod
+    def describe(payload):
+        """Short label for what an uplink packet carries."""
+        if "waveform_events" in payload:
+            return f"Event Clip ({len(payload['waveform_events']['events'])} events)"
+        return "Full Dump" if "waveform_dump" in payload else "Status Packet"
+
 class MasterAgent:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db_path=DB_PATH, archive_dir=BLACKBOX_DIR):
+        self.db = DatabaseManager(db_path)
         self.telematics = TelematicsAgent()
         
         # New Agents
         self.driver_agent = DriverBehaviorAgent()
         self.battery_agent = BatteryHealthAgent()
-        self.inventory_agent = InventoryAgent()
+        self.inventory_agent = InventoryAgent(InventoryStore(db_path))
         
         self.diag = GenAIAgent("DiagnosisAgent", self.db, SYSTEM_INSTRUCTION_DIAGNOSIS)
         self.rca = GenAIAgent("RCAAgent", self.db, SYSTEM_INSTRUCTION_RCA)
@@ -324,6 +653,14 @@ class MasterAgent:
         self.sched = SecureSchedulingAgent()
         self.ota = OTAAgent()
         self.comms = CommsModule()
+        self.blackbox = BlackboxArchive(archive_dir)
+        self.anomaly = FleetAnomalyScorer(len(FEATURE_NAMES))
+
+        # Shared fleet state (built lazily, updated by every workflow result)
+        self.fleet = None
+        self.fleet_index = None
+        self.recall_scope = None
+        self._fleet_lock = threading.Lock()
 
     def execute_workflow(self, vid, scenario, toggles, api_key):
         logs = []
@@ -331,22 +668,47 @@ class MasterAgent:
             ts = datetime.datetime.now().strftime("%H:%M:%S")
             logs.append(AgentLogStep(agent, location, action, status, details, ts))
 
+        # Every model call in this run draws from one latency budget
+        deadline = Deadline(GENAI_WORKFLOW_BUDGET_S)
+
         # 1. PERCEPTION (EDGE)
         log_step("TelematicsAgent", "🚗 EDGE", "Acquire Sensor Data", "RUNNING", f"Target: {vid}")
         t = self.telematics.read_sensors(vid, scenario, toggles)
         
         # 1.5 DRIVER BEHAVIOR (EDGE) - NEW
         driver_out = self.driver_agent.analyze(t)
-        log_step("DriverBehaviorAgent", "🚗 EDGE", "Driving Style Analysis", "OK", f"Score: {driver_out['safety_score']} ({driver_out['status']})")
+        driver_out["trend"] = self.driver_agent.observe(t, driver_out)
+        log_step("DriverBehaviorAgent", "🚗 EDGE", "Driving Style Analysis", "OK", f"Score: {driver_out['safety_score']} ({driver_out['status']}) | Trip: {driver_out['trend']['trip']['safety']} over {driver_out['trend']['trip_frames']} frames")
         
         # 2. DIAGNOSIS (EDGE)
-        diag_in = {k:v for k,v in asdict(t).items() if k not in ['raw_waveform', '_secure_lat', '_secure_lon']}
-        d_out = self.diag.execute(diag_in, api_key)
+        # Envelope burst signature: separates periodic knock impacts from steady tones
+        diag_in = t.diagnosis_view({k: round(float(v[0]), 3) for k, v in envelope_features(t.raw_waveform).items()})
+        d_out = self.diag.execute(diag_in, api_key, deadline)
         
         fault_found = d_out.get('fault_detected', False)
+
+        # 2.5 FLEET-RELATIVE ANOMALY (catches failure modes with no DTC / fixed cut-off yet)
+        known = d_out.get("fault_type", "Normal") != "Normal"
+        a_out = self.anomaly.score(t.batch_id, t.rpm, extract_features(t.raw_waveform)[0], learn=not (fault_found or known))
+        d_out["anomaly_score"] = a_out["score"]
+        if a_out["anomalous"] and not fault_found:
+            if known:
+                # Type already identified (e.g. by DTC) but below its own cut-off: escalate, keep the label
+                d_out.update({"fault_detected": True, "upload_required": True})
+            else:
+                d_out.update({
+                    "fault_detected": True, "fault_type": "Unknown Anomaly", "severity": "Medium", "upload_required": True,
+                    "driver_friendly_message": "Unusual vibration pattern detected. Service check recommended.",
+                    "safety_tips": ["Drive smoothly and avoid high RPM.", "Book an inspection at the nearest workshop."],
+                    "confidence": round(min(0.99, 1 - self.anomaly.threshold / (2 * a_out["score"])), 2)
+                })
+            fault_found = True
+        log_step("AnomalyScorer", "🚗 EDGE", "Fleet-Relative Scoring", "ANOMALY" if a_out["anomalous"] else ("OK" if a_out["warm"] else "WARMING UP"), f"Mahalanobis² {a_out['score']} (threshold {self.anomaly.threshold})")
         
         status = "CRITICAL" if fault_found else "NORMAL"
         log_step("DiagnosisAgent", "🚗 EDGE", "Local Classification", status, f"Type: {d_out.get('fault_type')}")
+
+        levels = {"batch_id": t.batch_id, "ecu_version": t.ecu_version, "region": region_of(t._secure_lat, t._secure_lon)}
         
         # 3. COMMS MODULE (Data Minimization Logic)
         payload, data_size = self.comms.create_payload(t, d_out)
@@ -355,14 +717,20 @@ class MasterAgent:
 
         # 4. DATA TRANSMISSION LOGIC
         if fault_found:
-            log_step("CommsModule", "📡 UP-LINK", "Blackbox Upload", "TRIGGERED", f"Sending {data_size}KB Full Dump to Cloud...")
+            log_step("CommsModule", "📡 UP-LINK", "Blackbox Upload", "TRIGGERED", f"Sending {data_size}KB {self.comms.describe(payload)} to Cloud...")
+            if self.blackbox.ingest(payload, t.batch_id, d_out.get("fault_type")):
+                log_step("BlackboxArchive", "☁ CLOUD", "Archive Waveform", "STORED", f"{t.batch_id} / {d_out.get('fault_type')}")
             
             # 5. CLOUD PROCESSING (OEM SIDE)
-            r_out = self.rca.execute(d_out, api_key)
-            log_step("RCAAgent", "☁ CLOUD", "Root Cause Analysis", "DONE", f"Batch: {r_out.get('batch_id')}")
+            # Fleet statistics are per VIN (the fleet snapshot); this run lands in them once it completes
+            defects = self.defects
+            evidence = defects.evidence(d_out.get("fault_type"), levels) if defects is not None else []
+            r_out = self.rca.execute(dict(d_out, **levels, fleet_evidence=evidence), api_key, deadline)
+            basis = f" | Fleet evidence: {evidence[0]['dimension']} lift {evidence[0]['lift']}x, q={evidence[0]['q_value']:.1e}" if evidence else ""
+            log_step("RCAAgent", "☁ CLOUD", "Root Cause Analysis", "DONE", f"Batch: {r_out.get('batch_id')}{basis}")
             
             # Inventory Check - NEW
-            inv_out = self.inventory_agent.check_stock(d_out)
+            inv_out = self.inventory_agent.check_stock(d_out, vid)
             log_step("InventoryAgent", "☁ CLOUD", "Supply Chain Check", "DONE", f"Part: {inv_out['part']} ({inv_out['status']})")
             
             # Battery Health Check - NEW
@@ -374,41 +742,84 @@ class MasterAgent:
             if r_out.get("ota_eligible"):
                 log_step("OTAAgent", "☁ CLOUD", "Software Patch", "DEPLOYING", "Version 1.3")
                 o_out = self.ota.deploy()
+                self._release_part(vid, inv_out, "Not Required (OTA)", log_step)
+                self._release_slot(vid, log_step, "Not Required (OTA)")
             else:
                 log_step("GPSAgent", "☁ CLOUD", "Geospatial Query", "RUNNING", f"Loc: {t._secure_lat:.4f}, {t._secure_lon:.4f}")
                 gps_out = self.gps.find_nearest_workshop(t._secure_lat, t._secure_lon)
-                s_out = self.sched.find_slot(gps_out)
-                log_step("SecureSchedulingAgent", "☁ CLOUD", "Provisional Booking", "HELD", f"Slot: {s_out['slot']}")
+                s_out = self.sched.find_slot(gps_out, vid)
+                log_step("SecureSchedulingAgent", "☁ CLOUD", "Provisional Booking", s_out["status"], f"Slot: {s_out['slot']} @ {s_out['center']}")
+                if s_out["service_id"] is None:
+                    self._release_part(vid, inv_out, "Released (No Capacity)", log_step)
             
             
             # Compliance / Security Check (Late Binding)
             c_out = self.comp.check(d_out, f_out, s_out)
+            stream_alerts = self.comp.observe(vid, f_out, s_out)
+            if stream_alerts:
+                c_out["ue_alerts"] += stream_alerts
+                if c_out["status"] != "BLOCKED": c_out["status"] = "REVIEW_REQUIRED"
             
             if c_out["status"] == "BLOCKED":
                 log_step("ComplianceAgent", "☁ CLOUD", "Security Protocol", "SECURITY", f"Blocked: {c_out.get('ue_alerts')}")
+                if s_out and s_out["service_id"] and self._release_slot(vid, log_step, "Blocked"):
+                    s_out.update(status="RELEASED", slot=None)
             else:
                 log_step("MasterAgent", "☁ CLOUD", "Driver Notification", "SENT", "Action Plan Dispatched to App")
             
         else:
             bat_out = self.battery_agent.check_health(t)
             log_step("CommsModule", "📡 UP-LINK", "Heartbeat Sync", "SENT", f"Routine Packet ({data_size}KB)")
+            if self.inventory_agent.release(vid):
+                log_step("InventoryAgent", "☁ CLOUD", "Release Part Hold", "DONE", "Vehicle back to normal")
+            self._release_slot(vid, log_step, "Vehicle back to normal")
         
-        return PipelineResult(vid, t, d_out, r_out, f_out, c_out, gps_out, s_out, o_out, driver_out, bat_out, inv_out, logs, data_size, payload)
+        result = PipelineResult(vid, t, d_out, r_out, f_out, c_out, gps_out, s_out, o_out, driver_out, bat_out, inv_out, logs, data_size, payload)
+        fleet, fleet_index = self.fleet, self.fleet_index
+        if fleet is not None:
+            fleet.apply_result(result)
+            fleet_index.apply_result(result)
+        return result
+
+    def _release_part(self, vid, inv_out, status, log_step):
+        """Drops the vehicle's part hold when no physical repair will use it."""
+        if inv_out.get("reservation_id") and self.inventory_agent.release(vid):
+            inv_out.update(status=status, reservation_id=None)
+            log_step("InventoryAgent", "☁ CLOUD", "Release Part Hold", "DONE", f"Part: {inv_out['part']} ({status})")
+
+    def _release_slot(self, vid, log_step, reason) -> bool:
+        """Frees the vehicle's service bay when no workshop visit will use it."""
+        if not self.sched.release(vid):
+            return False
+        log_step("SecureSchedulingAgent", "☁ CLOUD", "Release Booking", "DONE", reason)
+        return True
+
+    def complete_service(self, vid) -> bool:
+        """Marks the vehicle's repair done: its held part is booked as a sale and its bay freed."""
+        self.sched.release(vid)
+        return self.inventory_agent.complete(vid)
+
+    def get_fleet_snapshot(self, size=FLEET_SIZE):
+        """Columnar fleet state, generated once and then updated incrementally."""
+        with self._fleet_lock:
+            if self.fleet is None:
+                # Build everything first and publish `fleet` last: workflows check it without the lock
+                fleet = FleetSnapshot.generate(size)
+                self.fleet_index = FleetIndex(fleet)
+                self.recall_scope = RecallScopeEngine(fleet)
+                self.fleet = fleet
+            return self.fleet
+
+    @property
+    def defects(self):
+        """Batch-defect scan over the fleet's per-VIN tables (None until the fleet is built)."""
+        scope = self.recall_scope
+        return scope.defects if scope is not None else None
+
+    def genai_metrics(self):
+        """Per-agent GenAI counters: breaker trips, timeouts, fallback rate."""
+        return {agent.name: agent.metrics() for agent in (self.diag, self.rca)}
 
     def get_fleet_data(self):
-        fleet = []
-        for i in range(FLEET_SIZE):
-            vid = f"VIN-{10000+i}"
-            batch = "Batch-2023-A" if i % 2 == 0 else "Batch-2023-B"
-            is_fault = (batch == "Batch-2023-A" and random.random() < 0.3)
-            fault_type = "Rod Knock" if is_fault else "Healthy"
-            fleet.append({
-                "Vehicle ID": vid,
-                "Batch ID": batch,
-                "Health Status": "Critical" if is_fault else "Healthy",
-                "Fault Type": fault_type,
-                "RMS": round(random.uniform(1.5, 3.0) if is_fault else random.uniform(0.1, 0.6), 2),
-                "Peak": round(random.uniform(3.0, 5.0) if is_fault else random.uniform(0.5, 1.5), 2),
-                "Frequency": random.uniform(380, 420) if is_fault else random.uniform(40, 80)
-            })
-        return fleet
+        """Legacy list-of-dicts view of the fleet snapshot."""
+        return self.get_fleet_snapshot().to_records()
@@ -0,0 +1,175 @@
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Mapping, Sequence
+
+from config import DEFECT_FDR_ALPHA, RECALL_MIN_CASES, RECALL_MIN_LIFT, RECALL_OTA_FAULTS
+
+HEALTHY = ("Normal", "Healthy")
+
+# --- STATISTICS ---
+
+def erfc(x):
+    """Complementary error function for x >= 0 (Abramowitz & Stegun 7.1.26, |error| < 1.5e-7)."""
+    x = np.asarray(x, dtype=np.float64)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x * x)
+
+
+def chi2_one_vs_rest(counts):
+    """
+    One-vs-rest 2x2 tests for every cell of a (levels, faults) count table at once.
+    For cell (i, j): a = counts[i, j] against the rest of row i, column j and the table.
+    Returns (Yates-corrected chi-square, one-sided p-value for an excess of a, expected a).
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    n = counts.sum()
+    rows = counts.sum(axis=1, keepdims=True)
+    cols = counts.sum(axis=0, keepdims=True)
+    expected = rows * cols / max(n, 1.0)
+    denom = rows * (n - rows) * cols * (n - cols)
+    dev = np.maximum(np.abs(counts * n - rows * cols) - n / 2, 0.0)  # |ad - bc| - n/2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        chi2 = np.where(denom > 0, n * dev * dev / denom, 0.0)
+    tail = 0.5 * erfc(np.sqrt(chi2 / 2))  # df = 1: P(Z > sqrt(chi2))
+    p = np.where(counts > expected, tail, 1.0 - tail)
+    return chi2, p, expected
+
+
+def cmh_one_sided(both, exposed, faulted, n):
+    """
+    Cochran-Mantel-Haenszel test across strata of 2x2 tables given by their margins
+    (both = exposed & faulted, per stratum). One-sided p-value for an excess of `both`,
+    continuity-corrected. Strata without variation carry no information; if none has any,
+    the association cannot be separated from the stratifier and p is 1.
+    """
+    both, exposed, faulted, n = (np.asarray(a, dtype=np.float64) for a in (both, exposed, faulted, n))
+    ok = n > 1
+    both, exposed, faulted, n = both[ok], exposed[ok], faulted[ok], n[ok]
+    expected = exposed * faulted / n
+    var = exposed * (n - exposed) * faulted * (n - faulted) / (n * n * (n - 1))
+    if var.sum() <= 0:
+        return 1.0
+    dev = both.sum() - expected.sum()
+    z = max(abs(dev) - 0.5, 0.0) / np.sqrt(var.sum())
+    tail = 0.5 * float(erfc(z / np.sqrt(2)))
+    return tail if dev > 0 else 1.0 - tail
+
+
+def benjamini_hochberg(p):
+    """BH-adjusted q-values (false discovery rate) for a flat array of p-values."""
+    p = np.asarray(p, dtype=np.float64)
+    if p.size == 0:
+        return p
+    order = np.argsort(p)
+    scaled = p[order] * p.size / np.arange(1, p.size + 1)
+    q = np.empty_like(p)
+    q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
+
+# --- BATCH DEFECT DISCOVERY ---
+
+class BatchDefectMonitor:
+    """
+    Batch-defect significance scan over fleet (level x fault type) tables, one per dimension
+    (manufacturing batch, ECU software version, region). The tables come from `source`
+    (the fleet RecallScopeEngine): one row per VIN, so every count is a distinct vehicle and
+    a repeat diagnosis only moves that vehicle between cells. scan() tests every cell against
+    the rest of the fleet in one vectorized pass, applies Benjamini-Hochberg across all cells
+    of all dimensions, and flags cells that clear the FDR plus the recall thresholds
+    (RECALL_MIN_CASES, RECALL_MIN_LIFT). Scans are cached per source cursor.
+    """
+    COLUMNS = ["dimension", "level", "fault_type", "cases", "exposed", "rate", "baseline_rate", "expected", "lift", "chi2", "p_value"]
+
+    def __init__(self, source, dimensions: Sequence[str], alpha=DEFECT_FDR_ALPHA,
+                 min_cases=RECALL_MIN_CASES, min_lift=RECALL_MIN_LIFT):
+        self.source = source
+        self.dimensions = tuple(dimensions)
+        self.alpha = alpha
+        self.min_cases = min_cases
+        self.min_lift = min_lift
+        self._lock = threading.Lock()
+        self._scan = (-1, None)
+
+    def scan(self) -> pd.DataFrame:
+        """
+        Every tested (dimension, level, fault) cell with its rate, lift, chi-square, p and
+        BH q-value, most significant first. Cached until the fleet changes.
+        """
+        cursor, tables, faults = self.source.crosstabs()
+        with self._lock:
+            if self._scan[0] == cursor:
+                return self._scan[1]
+
+        parts = []
+        for dim in self.dimensions:
+            counts, levels = tables[dim]
+            if counts.size == 0 or len(levels) < 2:
+                continue
+            chi2, p, expected = chi2_one_vs_rest(counts)
+            rows = counts.sum(axis=1, keepdims=True)
+            cols = counts.sum(axis=0, keepdims=True)
+            n = counts.sum()
+            rate = counts / np.maximum(rows, 1)
+            rest = (cols - counts) / np.maximum(n - rows, 1)
+            lift = rate / np.maximum(rest, 0.5 / max(n, 1))  # no cases elsewhere: cap with half a case
+            li, fi = np.nonzero(counts > 0)
+            keep = ~np.isin(faults[fi], HEALTHY)
+            li, fi = li[keep], fi[keep]
+            parts.append(pd.DataFrame({
+                "dimension": dim, "level": levels[li], "fault_type": faults[fi],
+                "cases": counts[li, fi], "exposed": rows[li, 0], "rate": rate[li, fi], "baseline_rate": rest[li, fi],
+                "expected": expected[li, fi], "lift": lift[li, fi], "chi2": chi2[li, fi], "p_value": p[li, fi],
+            }))
+        out = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=self.COLUMNS)
+        out["q_value"] = benjamini_hochberg(out["p_value"].to_numpy(dtype=np.float64))
+        out["flagged"] = (out["q_value"] <= self.alpha) & (out["cases"] >= self.min_cases) & (out["lift"] >= self.min_lift)
+        out = out.sort_values(["flagged", "q_value", "lift"], ascending=[False, True, False], ignore_index=True)
+        with self._lock:
+            if cursor >= self._scan[0]:
+                self._scan = (cursor, out)
+        return out
+
+    def flagged(self) -> pd.DataFrame:
+        """Emerging defects: flagged cells only."""
+        scan = self.scan()
+        return scan[scan["flagged"]].reset_index(drop=True)
+
+    def is_flagged(self, dimension, level, fault_type) -> bool:
+        hits = self.flagged()
+        return bool(((hits["dimension"] == dimension) & (hits["level"] == level) & (hits["fault_type"] == fault_type)).any())
+
+    def evidence(self, fault_type, levels: Mapping[str, str]) -> List[Dict]:
+        """
+        RCA query: flagged cells for `fault_type` among this vehicle's own levels (its batch,
+        ECU version, region). ECU-version cells only count for faults software can cause
+        (RECALL_OTA_FAULTS). A vehicle's levels are confounded with each other, so each
+        candidate is re-tested within the strata of every other candidate's dimension (CMH):
+        `conditional_p` is the worst of those tests (the cell's own q-value when there is no
+        other candidate), and `identified` means it still holds after conditioning. Identified candidates come first, then the strongest conditional
+        effect; ties between unresolved candidates go to physical (non-ECU) causes.
+        """
+        hits = self.flagged()
+        hits = hits[hits["fault_type"] == fault_type]
+        mine = np.zeros(len(hits), dtype=bool)
+        for dim in self.dimensions:
+            if levels.get(dim) is not None and (dim != "ecu_version" or fault_type in RECALL_OTA_FAULTS):
+                mine |= ((hits["dimension"] == dim) & (hits["level"] == levels[dim])).to_numpy()
+        cols = ["dimension", "level", "cases", "exposed", "rate", "baseline_rate", "lift", "q_value"]
+        rows = hits.loc[mine, cols].round({"rate": 4, "baseline_rate": 4, "lift": 2}).to_dict("records")
+
+        for row in rows:
+            worst, confounded = None, []
+            for other in rows:
+                if other["dimension"] == row["dimension"]:
+                    continue
+                p = cmh_one_sided(*self.source.strata(row["dimension"], row["level"], fault_type, other["dimension"]))
+                worst = p if worst is None else max(worst, p)
+                if p > self.alpha:
+                    confounded.append(other["dimension"])
+            row["conditional_p"] = float(row["q_value"] if worst is None else worst)
+            row["identified"] = not confounded
+            row["confounded_with"] = confounded
+        rows.sort(key=lambda r: (not r["identified"], r["dimension"] == "ecu_version", r["conditional_p"], r["q_value"]))
+        return [{k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items()} for row in rows]
@@ -0,0 +1,212 @@
+import datetime
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Sequence, Tuple
+
+from config import BLACKBOX_DIR, BLACKBOX_SEGMENT_FRAMES, SAMPLES
+from dsp import reconstruct_timeline
+
+logger = logging.getLogger(__name__)
+
+# --- BLACKBOX ARCHIVE ---
+
+class BlackboxArchive:
+    """
+    Append-only cloud archive of uploaded fault waveforms.
+    Waveforms are float32 rows of a fixed `samples` stride, appended to segment files of
+    `segment_frames` rows each (shorter waveforms are NaN-padded, longer ones truncated).
+    A SQLite index maps (vin, batch_id, fault_type, ts) to (segment, row); rows are written
+    to the segment before they are indexed, so the index never points past the data.
+    Reads go through read-only np.memmap views, one gather per segment file.
+    Single writer: the current segment and row are held in memory (read from the files once
+    at open) and appends are serialized by a per-instance lock, so exactly one archive object
+    in one process may append to a directory. A second writer (another process, or another
+    instance over the same root) would reuse the same (segment, row) slots and corrupt the
+    index. Any number of readers may query concurrently.
+    """
+    def __init__(self, root=BLACKBOX_DIR, samples=SAMPLES, segment_frames=BLACKBOX_SEGMENT_FRAMES):
+        self.root = root
+        self.samples = samples
+        self.segment_frames = segment_frames
+        self.stride = samples * np.dtype(np.float32).itemsize
+        self._lock = threading.Lock()
+        self._maps = {}  # segment -> (rows, memmap)
+        os.makedirs(root, exist_ok=True)
+        self._init_index()
+        self._segment, self._rows = self._tail()
+
+    def _get_conn(self):
+        return sqlite3.connect(os.path.join(self.root, "index.db"), timeout=10, check_same_thread=False)
+
+    def _init_index(self):
+        conn = self._get_conn()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS waveforms (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, vin TEXT, batch_id TEXT, fault_type TEXT,
+                    ts REAL, segment INTEGER, row INTEGER, n_samples INTEGER
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_wf_fault ON waveforms (fault_type, batch_id, ts)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_wf_vin ON waveforms (vin, ts)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _path(self, segment):
+        return os.path.join(self.root, f"seg-{segment:06d}.f32")
+
+    def _tail(self) -> Tuple[int, int]:
+        """Current segment and its row count; a torn trailing row from a crash is cut off."""
+        segments = sorted(int(os.path.basename(p)[4:10]) for p in glob.glob(os.path.join(self.root, "seg-*.f32")))
+        if not segments:
+            return 0, 0
+        path = self._path(segments[-1])
+        rows, torn = divmod(os.path.getsize(path), self.stride)
+        if torn:
+            with open(path, "r+b") as f:
+                f.truncate(rows * self.stride)
+        return segments[-1], rows
+
+    def _fit(self, waveform) -> Tuple[np.ndarray, int]:
+        w = np.asarray(waveform, dtype=np.float32).ravel()
+        row = np.full(self.samples, np.nan, dtype=np.float32)
+        n = min(w.size, self.samples)
+        row[:n] = w[:n]
+        return row, n
+
+    def append_many(self, records: Sequence[Dict]) -> int:
+        """
+        Archives records with keys vin, batch_id, fault_type, waveform and optional ts (epoch s).
+        One file write per touched segment and one index transaction. Returns the rows added.
+        """
+        if not records:
+            return 0
+        now = time.time()
+        with self._lock:
+            index, block = [], []
+            for rec in records:
+                if self._rows >= self.segment_frames:
+                    self._write(block)
+                    block = []
+                    self._segment, self._rows = self._segment + 1, 0
+                row, n = self._fit(rec["waveform"])
+                block.append(row)
+                index.append((rec["vin"], rec.get("batch_id"), rec.get("fault_type"), rec.get("ts", now), self._segment, self._rows, n))
+                self._rows += 1
+            self._write(block)
+            conn = self._get_conn()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT INTO waveforms (vin, batch_id, fault_type, ts, segment, row, n_samples) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        index
+                    )
+            finally:
+                conn.close()
+        return len(records)
+
+    def _write(self, block):
+        if block:
+            with open(self._path(self._segment), "ab") as f:
+                f.write(np.stack(block).tobytes())
+
+    def append(self, vin, batch_id, fault_type, waveform, ts=None) -> int:
+        rec = {"vin": vin, "batch_id": batch_id, "fault_type": fault_type, "waveform": waveform}
+        if ts is not None:
+            rec["ts"] = ts
+        return self.append_many([rec])
+
+    def ingest(self, payload: Dict, batch_id, fault_type, ts=None) -> bool:
+        """
+        Archives the waveform carried by an uplink payload: the full dump, or the event clip
+        laid back on its timeline (NaN where nothing was transmitted). False if there is none.
+        """
+        if "waveform_events" in payload:
+            waveform = reconstruct_timeline(payload["waveform_events"])[0]
+        elif "waveform_dump" in payload:
+            waveform = payload["waveform_dump"]
+        else:
+            return False
+        self.append(payload["v"], batch_id, fault_type, waveform, ts)
+        return True
+
+    @staticmethod
+    def _where(vin, batch_id, fault_type, since, until):
+        where, args = [], []
+        for col, val in (("vin", vin), ("batch_id", batch_id), ("fault_type", fault_type)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(val)
+        for op, val in ((">=", since), ("<", until)):
+            if val is not None:
+                where.append(f"ts {op} ?")
+                args.append(val.timestamp() if isinstance(val, datetime.datetime) else float(val))
+        return (" WHERE " + " AND ".join(where) if where else ""), args
+
+    def index(self, vin=None, batch_id=None, fault_type=None, since=None, until=None, limit=None, newest=False) -> pd.DataFrame:
+        """
+        Index rows matching every given filter (datetimes or epoch seconds), oldest first.
+        With `newest`, `limit` keeps the most recent rows instead of the oldest.
+        """
+        where, args = self._where(vin, batch_id, fault_type, since, until)
+        order = "ts DESC, id DESC" if newest else "ts, id"
+        sql = f"SELECT id, vin, batch_id, fault_type, ts, segment, row, n_samples FROM waveforms{where} ORDER BY {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        conn = self._get_conn()
+        try:
+            meta = pd.read_sql_query(sql, conn, params=args)
+        finally:
+            conn.close()
+        return meta.iloc[::-1].reset_index(drop=True) if newest else meta
+
+    def count(self, vin=None, batch_id=None, fault_type=None, since=None, until=None) -> int:
+        """Number of archived waveforms matching the filters (index only, no sample reads)."""
+        where, args = self._where(vin, batch_id, fault_type, since, until)
+        conn = self._get_conn()
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM waveforms{where}", args).fetchone()[0]
+        finally:
+            conn.close()
+
+    def _map(self, segment, rows_needed):
+        """Read-only memmap of a segment, remapped only when the segment has grown."""
+        with self._lock:
+            hit = self._maps.get(segment)
+            if hit is None or hit[0] < rows_needed:
+                rows = os.path.getsize(self._path(segment)) // self.stride
+                hit = (rows, np.memmap(self._path(segment), dtype=np.float32, mode="r", shape=(rows, self.samples)))
+                self._maps[segment] = hit
+            return hit[1]
+
+    def read(self, index: pd.DataFrame) -> np.ndarray:
+        """Waveforms for index rows as one (N, samples) float32 array, in index order."""
+        out = np.empty((len(index), self.samples), dtype=np.float32)
+        if out.size == 0:
+            return out
+        segs = index["segment"].to_numpy()
+        rows = index["row"].to_numpy()
+        for seg in np.unique(segs):
+            at = np.flatnonzero(segs == seg)
+            out[at] = self._map(int(seg), int(rows[at].max()) + 1)[rows[at]]
+        return out
+
+    def query(self, vin=None, batch_id=None, fault_type=None, since=None, until=None, limit=None, newest=False) -> Tuple[pd.DataFrame, np.ndarray]:
+        """(index rows, waveforms), e.g. query(fault_type="Rod Knock", batch_id="Batch-2023-A", since=last_week)."""
+        meta = self.index(vin, batch_id, fault_type, since, until, limit, newest)
+        return meta, self.read(meta)
+
+    def stats(self) -> Dict:
+        conn = self._get_conn()
+        try:
+            n, segments = conn.execute("SELECT COUNT(*), COUNT(DISTINCT segment) FROM waveforms").fetchone()
+        finally:
+            conn.close()
+        return {"waveforms": n, "segments": segments, "bytes": n * self.stride}
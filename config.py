@@ -5,12 +5,167 @@ SAMPLE_RATE = 2000  # Hz
 SAMPLES = 1000      # 0.5s window
 FLEET_SIZE = 50
 
+# Vibration feature bands (Hz): low / mid / high share of spectral power
+DSP_BAND_EDGES_HZ = (0, 100, 300, SAMPLE_RATE // 2 + 1)
+DSP_CHUNK_FRAMES = 4096          # frames per FFT block in batched feature extraction
+
+# Envelope analysis for impacting faults: band-pass around the knock resonance, Hilbert
+# envelope, then the envelope's spectrum within the burst-rate search range
+DSP_KNOCK_BAND_HZ = (300, 500)
+DSP_BURST_RATE_HZ = (3, 120)
+DSP_BURST_MIN_PROMINENCE = 10.0  # envelope peak / median in the search range (noise: 2-5)
+DSP_BURST_MIN_BAND_RMS = 0.2     # g inside the band; below this there is nothing to knock
+
+# Event clipping for blackbox uploads: short-time RMS envelope vs the frame's own noise floor
+DSP_ENVELOPE_MS = 5
+DSP_EVENT_FACTOR = 3.0         # event when envelope > factor x median envelope
+DSP_EVENT_MIN_RMS = 0.2        # ... and above this absolute level (g)
+DSP_EVENT_MARGIN_MS = 10       # pre/post margin kept around each event
+DSP_CONTEXT_RATE_HZ = 50       # low-rate RMS context summary sent with the clips
+
+# Live fleet feed: bounded per-VIN change log and UI polling interval
+FLEET_CHANGELOG_CAPACITY = 100_000
+FLEET_POLL_INTERVAL_S = 2.0
+FLEET_PAGE_ROWS = 200            # rows per page of the live fleet table
+FLEET_RECENT_CHANGES = 100       # most recently changed VINs kept per session
+
+# Fleet scatter level-of-detail: a status group with more points in view than its
+# budget is drawn as aggregated voxels (at most LOD_VOXEL_BINS^3 markers)
+LOD_POINT_BUDGET = 2000       # Healthy vehicles
+LOD_FAULT_POINT_BUDGET = 5000 # Warning / Critical vehicles (kept individual up to this)
+LOD_VOXEL_BINS = 16
+
+# Known DTC signature for each fault type (used to seed fleet indexes)
+FAULT_DTC_CODES = {
+    "Rod Knock": "P0301",
+    "Misfire": "P0300",
+    "Mount Failure": "C1234",
+}
+
+# Recall scoping: per-VIN cost of a physical service vs an OTA fix, and the evidence
+# needed before a whole batch is recalled instead of individual VINs
+RECALL_UNIT_COST_INR = {"Rod Knock": 14000, "Misfire": 9500, "Mount Failure": 6500}
+RECALL_DEFAULT_UNIT_COST_INR = 5000
+RECALL_OTA_FAULTS = ("Misfire",)
+RECALL_OTA_UNIT_COST_INR = 40
+SERVICE_LABOR_INR = 1500  # workshop labour, included in RECALL_UNIT_COST_INR; none for an OTA fix
+RECALL_MIN_CASES = 3
+RECALL_MIN_LIFT = 1.5
+
+# Batch-defect discovery over the fleet's per-VIN tables: one-vs-rest 2x2 chi-square per
+# (dimension level, fault type), Benjamini-Hochberg across all cells; flagged at FDR <= alpha
+# with at least RECALL_MIN_CASES vehicles and RECALL_MIN_LIFT (shared with recall scoping)
+ECU_VERSIONS = ("ECU-v1.1", "ECU-v1.2", "ECU-v1.3")
+DEFECT_FDR_ALPHA = 0.05
+
+# Driver companion app: phone frame width (px); image assets are downscaled to this at load time
+MOBILE_FRAME_WIDTH = 320
+
 WORKSHOPS = [
-    {"name": "Hero Hub - Indiranagar", "lat": 12.9716, "lon": 77.5946, "rating": 4.8},
-    {"name": "Hero Hub - Koramangala", "lat": 12.9352, "lon": 77.6245, "rating": 4.5},
-    {"name": "Hero Hub - Whitefield", "lat": 12.9698, "lon": 77.7500, "rating": 4.2},
-    {"name": "Hero Hub - Central", "lat": 28.6139, "lon": 77.2090, "rating": 4.9},
+    {"name": "Hero Hub - Indiranagar", "lat": 12.9716, "lon": 77.5946, "rating": 4.8, "bays": 6},
+    {"name": "Hero Hub - Koramangala", "lat": 12.9352, "lon": 77.6245, "rating": 4.5, "bays": 4},
+    {"name": "Hero Hub - Whitefield", "lat": 12.9698, "lon": 77.7500, "rating": 4.2, "bays": 3},
+    {"name": "Hero Hub - Central", "lat": 28.6139, "lon": 77.2090, "rating": 4.9, "bays": 8},
+]
+
+# Workshop spatial index: grid cell size (degrees) and how many nearby workshops to consider
+GEO_CELL_DEG = 0.5
+GEO_K_NEAREST = 3
+GEO_REGION_DEG = 1.0  # coarse lat/lon cells used as "region" in fleet defect statistics
+
+# Workshop scheduling: bookable hours match the ComplianceAgent UEBA window (09:00-19:00)
+SCHED_OPEN_HOUR = 9
+SCHED_CLOSE_HOUR = 19
+SCHED_SLOT_MINUTES = 60
+SCHED_HORIZON_DAYS = 30
+SCHED_LEAD_TIME_HOURS = 2
+SCHED_DEFAULT_BAYS = 4
+
+# Parts inventory: replacement part per fault type and initial stock
+# (part, warehouse, on_hand, lead_time_days), seeded into SQLite on first run
+FAULT_PARTS = {
+    "Rod Knock": "Connecting Rod Bearing Kit (Gen3)",
+    "Misfire": "Ignition Coil Pack",
+    "Mount Failure": "Hydraulic Engine Mount",
+}
+INVENTORY_SEED = [
+    ("Connecting Rod Bearing Kit (Gen3)", "Regional Hub - Chennai", 40, 1),
+    ("Connecting Rod Bearing Kit (Gen3)", "Central Warehouse - Pune", 250, 4),
+    ("Ignition Coil Pack", "Local Dealer", 25, 0),
+    ("Ignition Coil Pack", "Regional Hub - Chennai", 150, 1),
+    ("Ignition Coil Pack", "Regional Hub - Delhi NCR", 150, 2),
+    ("Hydraulic Engine Mount", "Regional Hub - Chennai", 8, 3),
+    ("Hydraulic Engine Mount", "Central Warehouse - Pune", 60, 5),
 ]
+INVENTORY_LOW_STOCK = 5
+INVENTORY_BACKORDER_LEAD_DAYS = 14
+
+# Streaming UEBA: sliding window of UEBA_WINDOW_MIN minutes in UEBA_BUCKETS ring buckets
+UEBA_WINDOW_MIN = 10
+UEBA_BUCKETS = 10
+UEBA_SKETCH_WIDTH = 4096
+UEBA_SKETCH_DEPTH = 4
+UEBA_WORKSHOP_BURST = 30        # bookings per workshop per window
+UEBA_VIN_REPEAT = 3             # bookings per VIN per window
+UEBA_HIGH_VALUE_REPEAT = 3      # high-value estimates per workshop per window
+UEBA_VELOCITY_FACTOR = 4.0      # newest bucket vs window average per bucket
+UEBA_VELOCITY_MIN = 10          # minimum bookings in the newest bucket to call a spike
+
+# Streaming driver scoring: per-VIN EWMA plus trip aggregates (a gap ends the trip)
+DRIVER_EWMA_HALFLIFE_S = 60.0
+DRIVER_TRIP_GAP_S = 300.0
+DRIVER_STREAM_CAPACITY = 1024   # initial per-VIN slots; grows by doubling
+
+# Battery SOH: per-VIN RLS fit of V = ocv + r * load + k * temp_norm; EOL is 80% SOH
+BATTERY_RLS_FORGETTING = 0.995
+BATTERY_STREAM_CAPACITY = 1024  # initial per-VIN slots; grows by doubling
+BATTERY_RLS_P_MAX = 10.0        # covariance trace cap (stops wind-up at constant load)
+BATTERY_NOMINAL_V = 13.8        # healthy no-load charging-system voltage at 25 degC
+BATTERY_EOL_V = 12.6            # no-load voltage treated as end of life
+BATTERY_R_NEW_V = 0.4           # voltage drop at full load, new pack
+BATTERY_R_EOL_V = 0.8           # voltage drop at full load, end of life
+BATTERY_CHARGE_ON_V = 13.2      # charge event hysteresis
+BATTERY_CHARGE_OFF_V = 12.9
+BATTERY_RANGE_KM = 320
+
+# Fleet-relative anomaly scoring: Mahalanobis distance of frame features against streaming
+# per-(batch, RPM band) statistics; threshold is the chi-square 99.9% quantile for 7 features
+ANOMALY_RPM_BAND = 1000
+ANOMALY_MIN_SAMPLES = 30        # below this a group defers to the fleet-wide statistics
+ANOMALY_MAX_WEIGHT = 5000       # sample-count cap: older frames then fade out (EWMA-like)
+ANOMALY_RIDGE = 1e-3            # covariance regularisation, relative to mean variance
+ANOMALY_THRESHOLD = 24.32
+
+# Load generator: default fault mix (share of frames) and the achieved/offered throughput
+# ratio under which a step counts as saturated
+LOADGEN_FAULT_MIX = {"Rod Knock": 0.05, "Misfire": 0.03, "Loose Mount": 0.02}
+LOADGEN_SATURATION_RATIO = 0.95
+
+# Shared-memory waveform transport: a pool of fixed segments, each holding one (N, SAMPLES) block
+TRANSPORT_SEGMENT_FRAMES = 1024  # frames per segment (float64: 8 MB at SAMPLES=1000)
+TRANSPORT_POOL_SEGMENTS = 8      # blocks in flight at once; producers wait when all are out
+TRANSPORT_ACQUIRE_TIMEOUT_S = 30.0
+
+# Cloud-side blackbox archive: append-only float32 segment files (fixed SAMPLES stride) plus a
+# SQLite index by VIN / batch / fault / time, next to the files
+BLACKBOX_DIR = "blackbox_archive"
+BLACKBOX_SEGMENT_FRAMES = 4096   # waveforms per segment file (16 MB at SAMPLES=1000)
+
+# GenAI resilience: the workflow's total model budget, the per-call cap, and the circuit
+# breaker (opens after N consecutive failures, probes recovery every cooldown seconds)
+GENAI_WORKFLOW_BUDGET_S = 8.0
+GENAI_CALL_TIMEOUT_S = 4.0
+GENAI_MAX_INFLIGHT = 4          # worker threads per agent; calls carry their deadline as the HTTP timeout
+GENAI_HEDGE_AFTER_S = 0.0       # >0: send a second request if the first hasn't answered by then
+GENAI_BREAKER_FAILURES = 3
+GENAI_BREAKER_COOLDOWN_S = 30.0
+GENAI_MODEL = "gemini-2.0-flash"
+
+# Per-VIN result history shared by all UI sessions: last N runs per vehicle under one global
+# byte budget (LRU across vehicles); waveforms are kept as float16 and dropped after the TTL
+RESULT_HISTORY_PER_VIN = 5
+RESULT_STORE_BUDGET_MB = 64
+RESULT_WAVEFORM_TTL_S = 900.0
 
 # ---- SYSTEM INSTRUCTIONS (ADK) ----
 SYSTEM_INSTRUCTION_DIAGNOSIS = """
@@ -18,6 +173,7 @@ ROLE: You are the 'DiagnosisAgent' (Edge Compute Node).
 OBJECTIVE: Analyze real-time sensor streams to detect immediate failure modes.
 CONTEXT:
 - Rod Knock: RMS > 1.2G, Dominant Freq ~400Hz. Code P0301.
+- Envelope: burst_prominence >= 10 with band_rms >= 0.2 means periodic impacts in the 300-500Hz band at burst_rate_hz (knock); a steady 400Hz tone has low prominence.
 - Misfire: RMS < 0.6G, Irregular peaks. Code P0300.
 - Mount Failure: Low freq wobble (<20Hz). Code C1234.
 
@@ -38,5 +194,9 @@ CONTEXT:
 - Batch-2023-A: Known defect in Connecting Rod Bearings.
 - Batch-2023-B: Known defect in O2 Sensors.
 - Software-ECU-v1.2: Bug causing phantom misfires.
+- fleet_evidence (list): clusters flagged by fleet statistics for this vehicle's batch_id / ecu_version / region
+  (distinct vehicles, one-vs-rest chi-square, Benjamini-Hochberg q_value, lift vs rest of fleet), strongest first.
+  identified=false means the cluster cannot be separated from the dimensions in confounded_with. When present it
+  outranks the list above. Mechanical faults are never OTA-eligible.
 OUTPUT: JSON with keys: is_batch_defect(bool), batch_id(str), manufacturing_action(str), estimated_cost_per_unit(int), ota_eligible(bool).
 """
@@ -1,13 +1,33 @@
 
 import os
+import io
 import base64
+import json
+import mimetypes
+import queue
+import threading
+import time
 import sqlite3
 import pandas as pd
 import datetime
 import logging
-from dataclasses import dataclass
+import pickle
+import numpy as np
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from dataclasses import dataclass, fields, replace
 from typing import List, Dict, Any, Optional
-from config import DB_PATH
+from config import (
+    DB_PATH, GENAI_BREAKER_FAILURES, GENAI_BREAKER_COOLDOWN_S,
+    RESULT_HISTORY_PER_VIN, RESULT_STORE_BUDGET_MB, RESULT_WAVEFORM_TTL_S, ECU_VERSIONS
+)
+
+# Optional: Pillow for downscaling image assets (ships with Streamlit)
+try:
+    from PIL import Image
+    HAS_PIL = True
+except ImportError:
+    HAS_PIL = False
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR)
@@ -25,6 +45,61 @@ def load_asset_as_base64(file_path):
         return None
     return None
 
+class AssetCache:
+    """
+    Process-wide cache for static assets: encoded data URIs (invalidated on file mtime)
+    and rendered text blocks such as CSS.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def data_uri(self, file_path, max_width=None):
+        """Returns the file as a data URI, optionally downscaled to `max_width` px. None if unreadable."""
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            return None
+        key = ("uri", os.path.abspath(file_path), max_width)
+        with self._lock:
+            hit = self._entries.get(key)
+        if hit and hit[0] == mtime:
+            return hit[1]
+
+        uri = self._encode(file_path, max_width)
+        with self._lock:
+            self._entries[key] = (mtime, uri)
+        return uri
+
+    def text(self, key, builder):
+        """Memoizes a rendered text block (e.g. a <style> string) for the process lifetime."""
+        key = ("text", key)
+        with self._lock:
+            hit = self._entries.get(key)
+        if hit:
+            return hit[1]
+        value = builder()
+        with self._lock:
+            self._entries[key] = (None, value)
+        return value
+
+    def _encode(self, file_path, max_width):
+        mime = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        if max_width and HAS_PIL and mime.startswith("image/"):
+            try:
+                with Image.open(file_path) as img:
+                    if img.width > max_width:
+                        img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+                    buf = io.BytesIO()
+                    img.save(buf, format="PNG", optimize=True)
+                return f"data:image/png;base64,{base64.b64encode(buf.getvalue()).decode()}"
+            except Exception as e:
+                logger.error(f"Asset downscale failed for {file_path}: {e}")
+        encoded = load_asset_as_base64(file_path)
+        return f"data:{mime};base64,{encoded}" if encoded else None
+
+ASSET_CACHE = AssetCache()
+
 # --- MODELS ---
 
 @dataclass
@@ -51,6 +126,64 @@ class TelemetryFrame:
     batch_id: str
     _secure_lat: float
     _secure_lon: float
+    ecu_version: str = ECU_VERSIONS[-1]
+
+    def diagnosis_view(self, extra: Optional[Dict] = None) -> "FrameView":
+        """Everything but the waveform and GPS, as a read-only mapping (no copies; `extra` keys added on top)."""
+        return FrameView(self, DIAGNOSIS_FIELDS, extra)
+
+DIAGNOSIS_FIELDS = dict.fromkeys(f.name for f in fields(TelemetryFrame) if f.name not in ("raw_waveform", "_secure_lat", "_secure_lon"))
+
+
+class FrameView(Mapping):
+    """
+    Read-only mapping over chosen attributes of a frame, plus optional extra keys.
+    Values are read from the frame when accessed, so building a view costs one small object
+    however large the frame is (asdict() deep-copies every field, waveform included).
+    """
+    __slots__ = ("_frame", "_fields", "_extra")
+
+    def __init__(self, frame, field_names: Dict[str, None], extra: Optional[Dict] = None):
+        self._frame = frame
+        self._fields = field_names
+        self._extra = extra or {}
+
+    def __getitem__(self, key):
+        if key in self._extra:
+            return self._extra[key]
+        if key in self._fields:
+            return getattr(self._frame, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._extra or key in self._fields
+
+    def __iter__(self):
+        yield from self._fields
+        yield from (k for k in self._extra if k not in self._fields)
+
+    def __len__(self):
+        return len(self._fields) + sum(k not in self._fields for k in self._extra)
+
+    def __repr__(self):
+        return f"FrameView({dict(self)!r})"
+
+
+def _json_default(obj):
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+_JSON_ENCODER = json.JSONEncoder(separators=(",", ":"), default=_json_default)
+
+def to_json(obj) -> str:
+    """Compact JSON for prompts and uplink payloads; also takes FrameViews and NumPy values."""
+    return _JSON_ENCODER.encode(obj)
+
 
 @dataclass
 class AgentLogStep:
@@ -81,14 +214,222 @@ class PipelineResult:
     data_upload_size_kb: float 
     transmitted_payload: Dict # The actual JSON sent over the air
 
+# --- RESULT HISTORY ---
+
+def _compact(obj, min_len=64):
+    """Sample lists (waveforms, uplink clips) become float16 arrays; everything else is kept."""
+    if isinstance(obj, dict):
+        return {k: _compact(v, min_len) for k, v in obj.items()}
+    if isinstance(obj, list) and len(obj) >= min_len and isinstance(obj[0], (int, float)):
+        return np.asarray(obj, dtype=np.float16)
+    if isinstance(obj, list):
+        return [_compact(v, min_len) for v in obj]
+    return obj
+
+def _expand(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.astype(np.float64).tolist()
+    if isinstance(obj, dict):
+        return {k: _expand(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_expand(v) for v in obj]
+    return obj
+
+def _drop_samples(obj):
+    """Same structure with every compacted sample array emptied."""
+    if isinstance(obj, np.ndarray):
+        return np.empty(0, obj.dtype)  # not obj[:0]: a view would keep the samples alive
+    if isinstance(obj, dict):
+        return {k: _drop_samples(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_drop_samples(v) for v in obj]
+    return obj
+
+
+class ResultStore:
+    """
+    Process-wide history of PipelineResults: the last `per_vin` runs of each vehicle.
+    Sample lists are stored as float16 arrays (a 1000-sample waveform is 2 KB instead of ~32 KB
+    of Python floats) and emptied `waveform_ttl_s` after the run; the summary fields stay.
+    Entry size is the pickled size of the compacted result. When the total passes the byte
+    budget, the oldest run of the least recently used vehicle is evicted first.
+    """
+    def __init__(self, per_vin=RESULT_HISTORY_PER_VIN, budget_bytes=RESULT_STORE_BUDGET_MB * 2**20,
+                 waveform_ttl_s=RESULT_WAVEFORM_TTL_S, clock=time.monotonic):
+        self.per_vin = per_vin
+        self.budget_bytes = budget_bytes
+        self.waveform_ttl_s = waveform_ttl_s
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._vins = OrderedDict()  # vin -> deque of entries, least recently used first
+        self._by_age = deque()      # entries still holding samples, oldest first
+        self._dead = 0              # forgotten entries not yet dropped from _by_age
+        self._bytes = 0
+        self._counts = {"stored": 0, "evicted": 0, "waveforms_expired": 0}
+
+    @staticmethod
+    def _entry(res, at):
+        t = res.telemetry
+        compact = replace(
+            res, telemetry=replace(t, raw_waveform=_compact(t.raw_waveform, 1)),
+            transmitted_payload=_compact(res.transmitted_payload)
+        )
+        return {"result": compact, "at": at, "samples": True, "live": True,
+                "bytes": len(pickle.dumps(compact, pickle.HIGHEST_PROTOCOL))}
+
+    def put(self, res: PipelineResult):
+        """Stores a compacted copy of `res` (the caller's object is not modified)."""
+        now = self.clock()
+        entry = self._entry(res, now)
+        with self._lock:
+            runs = self._vins.pop(res.vehicle_id, None) or deque()
+            self._vins[res.vehicle_id] = runs
+            runs.append(entry)
+            self._by_age.append(entry)
+            self._bytes += entry["bytes"]
+            self._counts["stored"] += 1
+            if len(runs) > self.per_vin:
+                self._forget(runs.popleft())
+            self._expire(now)
+            self._evict()
+
+    def _forget(self, entry):
+        # Release the result now; the age queue is compacted once half of it is forgotten entries
+        entry.update(live=False, result=None)
+        self._bytes -= entry["bytes"]
+        if entry["samples"]:
+            self._dead += 1
+            if self._dead * 2 > len(self._by_age):
+                self._by_age = deque(e for e in self._by_age if e["live"])
+                self._dead = 0
+
+    def _evict(self):
+        while self._bytes > self.budget_bytes and self._vins:
+            vin, runs = next(iter(self._vins.items()))
+            self._forget(runs.popleft())
+            self._counts["evicted"] += 1
+            if not runs:
+                del self._vins[vin]
+
+    def _expire(self, now):
+        while self._by_age and now - self._by_age[0]["at"] >= self.waveform_ttl_s:
+            entry = self._by_age.popleft()
+            if not entry["live"]:
+                self._dead -= 1
+                continue
+            res = entry["result"]
+            res = replace(res, telemetry=replace(res.telemetry, raw_waveform=_drop_samples(res.telemetry.raw_waveform)),
+                          transmitted_payload=_drop_samples(res.transmitted_payload))
+            size = len(pickle.dumps(res, pickle.HIGHEST_PROTOCOL))
+            self._bytes += size - entry["bytes"]
+            entry.update(result=res, bytes=size, samples=False)
+            self._counts["waveforms_expired"] += 1
+        while self._by_age and not self._by_age[0]["live"]:
+            self._by_age.popleft()
+            self._dead -= 1
+
+    def history(self, vin) -> List[PipelineResult]:
+        """Stored runs of `vin`, newest first, with sample lists restored ([] once expired)."""
+        with self._lock:
+            self._expire(self.clock())
+            runs = self._vins.get(vin)
+            if runs is None:
+                return []
+            self._vins.move_to_end(vin)
+            stored = [e["result"] for e in reversed(runs)]
+        return [
+            replace(r, telemetry=replace(r.telemetry, raw_waveform=_expand(r.telemetry.raw_waveform)),
+                    transmitted_payload=_expand(r.transmitted_payload))
+            for r in stored
+        ]
+
+    def stats(self) -> Dict:
+        """Occupancy: vehicles, runs, bytes against the budget, and eviction/expiry counters."""
+        with self._lock:
+            self._expire(self.clock())
+            runs = sum(len(r) for r in self._vins.values())
+            return dict(
+                self._counts, vehicles=len(self._vins), results=runs,
+                with_waveform=sum(e["samples"] for r in self._vins.values() for e in r),
+                bytes=self._bytes, budget_bytes=self.budget_bytes,
+                utilization=round(self._bytes / self.budget_bytes, 4) if self.budget_bytes else 0.0
+            )
+
+# --- RESILIENCE ---
+
+class Deadline:
+    """Latency budget shared by every remote call in one workflow run."""
+    def __init__(self, budget_s):
+        self.expires = time.monotonic() + budget_s
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failures` consecutive failures. While open, allow() is False and
+    callers go straight to their fallback; a background thread calls `probe()` every
+    `cooldown_s` and closes the breaker on the first success.
+    """
+    def __init__(self, name, failures=GENAI_BREAKER_FAILURES, cooldown_s=GENAI_BREAKER_COOLDOWN_S, probe=None):
+        self.name = name
+        self.failures = failures
+        self.cooldown_s = cooldown_s
+        self.probe = probe
+        self.state = "closed"
+        self.trips = 0
+        self._streak = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._closed.set()
+
+    def allow(self) -> bool:
+        return self._closed.is_set()
+
+    def record_success(self):
+        with self._lock:
+            self._streak = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._streak += 1
+            if self.state != "closed" or self._streak < self.failures:
+                return
+            self.state = "open"
+            self.trips += 1
+            self._closed.clear()
+        logger.error(f"Circuit breaker '{self.name}' opened after {self.failures} failures")
+        threading.Thread(target=self._probe_loop, name=f"{self.name}-probe", daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.cooldown_s)
+            try:
+                if self.probe is None or self.probe():
+                    break
+            except Exception as e:
+                logger.warning(f"Circuit breaker '{self.name}' probe failed: {e}")
+        with self._lock:
+            self.state = "closed"
+            self._streak = 0
+            self._closed.set()
+
 # --- DATABASE ---
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
         self._init_db()
+        self._pending = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
 
     def _get_conn(self):
-        return sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
+        return sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
 
     def _init_db(self):
         conn = self._get_conn()
@@ -126,6 +467,38 @@ class DatabaseManager:
         finally:
             conn.close()
 
+    def log_async(self, agent, action, details):
+        """Queues an audit row for the background writer (hot paths must not wait on SQLite)."""
+        self._pending.put((datetime.datetime.utcnow().isoformat(), agent, action, str(details)))
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._drain, name="audit-log-writer", daemon=True)
+                    self._writer.start()
+
+    def _drain(self):
+        while True:
+            rows = [self._pending.get()]
+            while True:
+                try:
+                    rows.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+            conn = self._get_conn()
+            try:
+                conn.executemany("INSERT INTO audit_log (timestamp, agent, action, details) VALUES (?, ?, ?, ?)", rows)
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Async logging error ({len(rows)} rows dropped): {e}")
+            finally:
+                conn.close()
+                for _ in rows:
+                    self._pending.task_done()
+
+    def flush(self):
+        """Blocks until every queued audit row is written."""
+        self._pending.join()
+
     def get_logs(self, limit=20):
         conn = self._get_conn()
         try:
@@ -146,15 +519,22 @@ class DatabaseManager:
         finally:
             conn.close()
 
-def calculate_oem_strategy(vin: str, fault_type: str) -> dict:
+def calculate_oem_strategy(vin: str, fault_type: str, scope_engine=None, batch_id: Optional[str] = None) -> dict:
     """
     Logic Engine for Strategic Decisions.
     Determines IF a card should be shown and WHAT the context (batch_id) is.
+    With a fleet RecallScopeEngine the batch and blast radius come from the live fleet
+    aggregates ("scope"), evaluated for the vehicle's own `batch_id` (the fleet's
+    highest-rate batch only when none is given); otherwise the static fault -> batch mapping is used.
     Does NOT handle text generation (View concern).
     """
     if not fault_type or "Normal" in fault_type:
         return {"show_card": False, "batch_id": None}
 
+    if scope_engine is not None:
+        scope = scope_engine.scope(fault_type, batch_id)
+        return {"show_card": True, "batch_id": scope["batch_id"], "scope": scope}
+
     if "Knock" in fault_type:
         return {"show_card": True, "batch_id": "Batch-2023-A"}
     elif "Misfire" in fault_type:
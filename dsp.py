@@ -0,0 +1,188 @@
+import numpy as np
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from config import (
+    SAMPLE_RATE, DSP_BAND_EDGES_HZ, DSP_CHUNK_FRAMES,
+    DSP_KNOCK_BAND_HZ, DSP_BURST_RATE_HZ, DSP_BURST_MIN_PROMINENCE, DSP_BURST_MIN_BAND_RMS,
+    DSP_ENVELOPE_MS, DSP_EVENT_FACTOR, DSP_EVENT_MIN_RMS, DSP_EVENT_MARGIN_MS, DSP_CONTEXT_RATE_HZ
+)
+
+# --- FRAME FEATURES ---
+
+FEATURE_NAMES = ["log_rms", "crest", "kurtosis", "centroid_khz", "band_low", "band_mid", "band_high"]
+
+
+def as_frames(waveforms) -> np.ndarray:
+    """One waveform (S,) or a stack (N, S) -> float64 (N, S)."""
+    return np.atleast_2d(np.asarray(waveforms, dtype=np.float64))
+
+
+def extract_features(waveforms, sample_rate=SAMPLE_RATE, chunk=DSP_CHUNK_FRAMES) -> np.ndarray:
+    """
+    Per-frame vibration feature vectors, (N, len(FEATURE_NAMES)).
+    Time domain: log RMS, crest factor, kurtosis. Frequency domain: spectral centroid and the
+    share of power in the DSP_BAND_EDGES_HZ bands. Frames go through the FFT in chunks of
+    `chunk`, so fleet-sized stacks stay within a bounded working set.
+    """
+    frames = np.atleast_2d(waveforms)
+    if len(frames) > chunk:
+        return np.concatenate([extract_features(frames[i:i + chunk], sample_rate, chunk) for i in range(0, len(frames), chunk)])
+    x = as_frames(frames)
+    centered = x - x.mean(axis=1, keepdims=True)
+    rms = np.sqrt(np.einsum("ns,ns->n", x, x) / x.shape[1])
+    crest = np.abs(x).max(axis=1) / np.maximum(rms, 1e-12)
+    sq = centered * centered  # explicit products: float ** 4 goes through pow() and is ~10x slower
+    var = sq.mean(axis=1)
+    kurtosis = np.einsum("ns,ns->n", sq, sq) / x.shape[1] / np.maximum(var * var, 1e-24)
+
+    spectrum = np.fft.rfft(x, axis=1)
+    spec = spectrum.real ** 2 + spectrum.imag ** 2
+    freqs = np.fft.rfftfreq(x.shape[1], 1 / sample_rate)
+    total = np.maximum(spec.sum(axis=1), 1e-24)
+    centroid = (spec @ freqs) / total
+    edges = np.searchsorted(freqs, DSP_BAND_EDGES_HZ)
+    bands = [spec[:, lo:hi].sum(axis=1) / total for lo, hi in zip(edges[:-1], edges[1:])]
+
+    return np.column_stack([np.log(rms + 1e-6), crest, kurtosis, centroid / 1000, *bands])
+
+
+# --- ENVELOPE ANALYSIS ---
+
+ENVELOPE_NAMES = ["burst_rate_hz", "burst_prominence", "modulation", "band_rms"]
+
+
+@lru_cache(maxsize=32)
+def _analytic_band(n, sample_rate, lo, hi) -> np.ndarray:
+    """
+    rfft-bin weights: raised-cosine band-pass over [lo, hi] Hz, doubled for the analytic signal.
+    Placing rfft(x) * weights in the positive half of an n-point spectrum and inverting gives
+    the band-passed analytic signal; its magnitude is the Hilbert envelope.
+    """
+    freqs = np.fft.rfftfreq(n, 1 / sample_rate)
+    taper = 0.1 * (hi - lo)
+    ramp = np.clip(np.minimum(freqs - lo, hi - freqs) / taper + 0.5, 0.0, 1.0)
+    w = 2.0 * np.sin(0.5 * np.pi * ramp) ** 2
+    w.flags.writeable = False
+    return w
+
+
+def _envelopes(x, sample_rate, band):
+    n = x.shape[1]
+    w = _analytic_band(n, sample_rate, *band)
+    spectrum = np.zeros((len(x), n), dtype=np.complex128)
+    spectrum[:, :w.size] = np.fft.rfft(x, axis=1) * w
+    return np.abs(np.fft.ifft(spectrum, axis=1))
+
+
+def envelope_spectrum(waveforms, sample_rate=SAMPLE_RATE, band=DSP_KNOCK_BAND_HZ) -> Tuple[np.ndarray, np.ndarray]:
+    """(freqs, amplitudes): spectrum of each frame's band-passed envelope, (N, S // 2 + 1)."""
+    x = as_frames(waveforms)
+    env = _envelopes(x, sample_rate, band)
+    env -= env.mean(axis=1, keepdims=True)
+    return np.fft.rfftfreq(x.shape[1], 1 / sample_rate), np.abs(np.fft.rfft(env, axis=1)) * 2 / x.shape[1]
+
+
+def envelope_features(waveforms, sample_rate=SAMPLE_RATE, band=DSP_KNOCK_BAND_HZ,
+                      rates=DSP_BURST_RATE_HZ, chunk=DSP_CHUNK_FRAMES) -> Dict[str, np.ndarray]:
+    """
+    Per-frame burst signature, arrays keyed by ENVELOPE_NAMES.
+    A periodic impact (knock) rings the band in bursts: its envelope has a strong line at the
+    burst repetition rate (high prominence) and a large modulation depth. A steady tone in the
+    same band has the same band RMS but a flat envelope, so a plain FFT peak can't tell them apart.
+    """
+    frames = np.atleast_2d(waveforms)
+    if len(frames) > chunk:
+        parts = [envelope_features(frames[i:i + chunk], sample_rate, band, rates, chunk) for i in range(0, len(frames), chunk)]
+        return {k: np.concatenate([p[k] for p in parts]) for k in ENVELOPE_NAMES}
+    x = as_frames(frames)
+    env = _envelopes(x, sample_rate, band)
+    mean = env.mean(axis=1)
+    centered = env - mean[:, None]
+    power = np.einsum("ns,ns->n", env, env) / x.shape[1]
+
+    freqs = np.fft.rfftfreq(x.shape[1], 1 / sample_rate)
+    search = np.flatnonzero((freqs >= rates[0]) & (freqs <= rates[1]))
+    spec = np.abs(np.fft.rfft(centered, axis=1)[:, search])
+    peak = spec.argmax(axis=1)
+    top = spec[np.arange(len(spec)), peak]
+    return {
+        "burst_rate_hz": freqs[search][peak],
+        "burst_prominence": top / np.maximum(np.median(spec, axis=1), 1e-12),
+        "modulation": centered.std(axis=1) / np.maximum(mean, 1e-12),
+        "band_rms": np.sqrt(power / 2),
+    }
+
+
+def is_knock(burst_prominence, band_rms):
+    """Periodic impacts in the knock band (scalars or arrays)."""
+    return (np.asarray(burst_prominence) >= DSP_BURST_MIN_PROMINENCE) & (np.asarray(band_rms) >= DSP_BURST_MIN_BAND_RMS)
+
+
+# --- TRANSIENT EVENTS ---
+
+def rms_envelope(waveform, sample_rate=SAMPLE_RATE, window_ms=DSP_ENVELOPE_MS) -> np.ndarray:
+    """Centred moving-RMS envelope (same length as the input), via a cumulative sum."""
+    x = np.asarray(waveform, dtype=np.float64)
+    w = max(1, int(sample_rate * window_ms / 1000))
+    csum = np.concatenate([[0.0], np.cumsum(x * x)])
+    lo = np.clip(np.arange(x.size) - w // 2, 0, x.size)
+    hi = np.clip(lo + w, 0, x.size)
+    return np.sqrt((csum[hi] - csum[lo]) / np.maximum(hi - lo, 1))
+
+
+def find_events(waveform, sample_rate=SAMPLE_RATE, margin_ms=DSP_EVENT_MARGIN_MS) -> List[Tuple[int, int]]:
+    """
+    Transient events as [start, end) sample ranges, margins included and overlaps merged.
+    A sample is "hot" when its envelope exceeds DSP_EVENT_FACTOR x the frame's median
+    envelope and DSP_EVENT_MIN_RMS; steady-state vibration therefore never triggers.
+    """
+    env = rms_envelope(waveform, sample_rate)
+    if env.size == 0:
+        return []
+    hot = env > max(DSP_EVENT_FACTOR * np.median(env), DSP_EVENT_MIN_RMS)
+    if not hot.any():
+        return []
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], hot.astype(np.int8), [0]])))
+    margin = int(sample_rate * margin_ms / 1000)
+    events = []
+    for start, end in zip(edges[::2] - margin, edges[1::2] + margin):
+        start, end = max(0, int(start)), min(env.size, int(end))
+        if events and start <= events[-1][1]:
+            events[-1] = (events[-1][0], max(events[-1][1], end))
+        else:
+            events.append((start, end))
+    return events
+
+
+def clip_events(waveform, sample_rate=SAMPLE_RATE) -> Dict:
+    """
+    Edge-side blackbox clip: raw samples only inside event windows, plus a low-rate RMS
+    context track for the whole frame. `events` is empty when nothing transient was found.
+    """
+    x = np.asarray(waveform, dtype=np.float64)
+    block = max(1, sample_rate // DSP_CONTEXT_RATE_HZ)
+    n_blocks = -(-x.size // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:x.size] = x * x
+    context = np.sqrt(padded.reshape(n_blocks, block).sum(axis=1) / np.minimum(block, x.size - np.arange(n_blocks) * block))
+    return {
+        "sample_rate": sample_rate, "n_samples": int(x.size),
+        "events": [{"start": s, "samples": np.round(x[s:e], 4).tolist()} for s, e in find_events(x, sample_rate)],
+        "context": {"rate_hz": sample_rate / block, "rms": np.round(context, 3).tolist()},
+    }
+
+
+def reconstruct_timeline(clip: Dict) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cloud side: (signal, envelope), both n_samples long. `signal` holds the uploaded event
+    samples and NaN elsewhere; `envelope` is the context RMS track held over each block.
+    """
+    n = clip["n_samples"]
+    signal = np.full(n, np.nan)
+    for ev in clip["events"]:
+        seg = np.asarray(ev["samples"], dtype=np.float64)
+        signal[ev["start"]:ev["start"] + seg.size] = seg
+    block = int(round(clip["sample_rate"] / clip["context"]["rate_hz"]))
+    envelope = np.repeat(np.asarray(clip["context"]["rms"], dtype=np.float64), block)[:n]
+    return signal, envelope
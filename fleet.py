@@ -0,0 +1,590 @@
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence
+
+from config import (
+    FLEET_SIZE, SAMPLE_RATE, FAULT_DTC_CODES, FLEET_CHANGELOG_CAPACITY, WORKSHOPS, ECU_VERSIONS,
+    RECALL_UNIT_COST_INR, RECALL_DEFAULT_UNIT_COST_INR, RECALL_OTA_FAULTS, RECALL_OTA_UNIT_COST_INR
+)
+from geo import region_of
+from analytics import BatchDefectMonitor
+
+# --- FLEET SCHEMA ---
+
+FLEET_COLUMNS = ["Vehicle ID", "Batch ID", "ECU Version", "Region", "Health Status", "Fault Type", "RMS", "Peak", "Frequency"]
+BATCH_CATEGORIES = ["Batch-2023-A", "Batch-2023-B"]
+# Synthetic vehicles start where the telematics simulator places them (the first workshop's area)
+HOME_REGION = region_of(WORKSHOPS[0]["lat"], WORKSHOPS[0]["lon"])
+HEALTH_CATEGORIES = ["Healthy", "Warning", "Critical"]
+FAULT_CATEGORIES = ["Healthy", "Rod Knock", "Misfire", "Mount Failure"]
+CATEGORICAL_COLUMNS = {
+    "Batch ID": BATCH_CATEGORIES,
+    "ECU Version": list(ECU_VERSIONS),
+    "Region": [HOME_REGION],
+    "Health Status": HEALTH_CATEGORIES,
+    "Fault Type": FAULT_CATEGORIES,
+}
+NUMERIC_COLUMNS = {"RMS": np.float32, "Peak": np.float32, "Frequency": np.float32}
+SMALL_UPDATE = 64  # rows; below this, lookups and encoding skip pandas' vectorized paths (fixed cost ~100 us)
+
+
+def dominant_frequency(waveform, sample_rate=SAMPLE_RATE):
+    """Dominant FFT bin (Hz) of a single waveform window."""
+    sig = np.asarray(waveform, dtype=np.float64)
+    if sig.size == 0:
+        return 0.0
+    amps = np.abs(np.fft.rfft(sig))
+    return float(np.fft.rfftfreq(sig.size, d=1 / sample_rate)[np.argmax(amps)])
+
+
+def result_status(res):
+    """(Health Status, Fault Type) fleet labels for a PipelineResult."""
+    diag = res.final_diagnosis or {}
+    fault = diag.get("fault_type") or "Normal"
+    if not diag.get("fault_detected") or fault == "Normal":
+        return "Healthy", "Healthy"
+    return ("Critical" if diag.get("severity") == "Critical" else "Warning"), fault
+
+
+# --- LIVE CHANGE FEED ---
+
+class FleetChangeLog:
+    """
+    Bounded in-process log of per-VIN row changes.
+    Every row write gets the next version number; readers keep a cursor (the last version
+    they applied) and pull only newer changes. A reader that falls behind the retained
+    window is told to resync from a full snapshot.
+    """
+    def __init__(self, capacity=FLEET_CHANGELOG_CAPACITY):
+        self._entries = deque(maxlen=capacity)  # (version, position, {col: value})
+        self._lock = threading.Lock()
+        self.cursor = 0
+
+    def publish(self, positions, values: Dict[str, Sequence]) -> np.ndarray:
+        """Appends one entry per row; returns the row versions assigned."""
+        cols = list(values)
+        with self._lock:
+            versions = np.arange(self.cursor + 1, self.cursor + 1 + len(positions), dtype=np.int64)
+            for i, (version, pos) in enumerate(zip(versions, positions)):
+                self._entries.append((int(version), int(pos), {c: values[c][i] for c in cols}))
+            if len(versions):
+                self.cursor = int(versions[-1])
+        return versions
+
+    def since(self, cursor):
+        """
+        Changes newer than `cursor`, collapsed to the latest version of each row.
+        Returns (new_cursor, positions, {col: values}) or (new_cursor, None, None) if the
+        cursor predates the retained window and the caller must resync.
+        """
+        with self._lock:
+            new_cursor = self.cursor
+            if cursor >= new_cursor:
+                return new_cursor, np.empty(0, dtype=np.int64), {}
+            oldest = self._entries[0][0] if self._entries else new_cursor + 1
+            if cursor < oldest - 1:
+                return new_cursor, None, None
+            n = new_cursor - cursor
+            pending = [self._entries[i] for i in range(len(self._entries) - n, len(self._entries))]
+
+        latest = {}
+        for _, pos, row in pending:
+            latest[pos] = row
+        positions = np.fromiter(latest, dtype=np.int64, count=len(latest))
+        cols = next(iter(latest.values())).keys()
+        return new_cursor, positions, {c: [row[c] for row in latest.values()] for c in cols}
+
+
+# --- COLUMNAR SNAPSHOT ---
+
+class FleetSnapshot:
+    """
+    Columnar fleet state (one row per VIN).
+    Columns are typed NumPy arrays: Batch ID, ECU Version, Region, Health Status and Fault
+    Type are int32 category codes plus their label lists, the measurements are float32, so a
+    1M-row fleet stays in tens of MB. Updates write the arrays in place (O(rows written));
+    DataFrames are only built when a caller reads a table, page or column.
+    """
+    def __init__(self, frame: pd.DataFrame):
+        self._vins = frame["Vehicle ID"].to_numpy(dtype=object, copy=True)
+        self._positions = pd.Index(self._vins)
+        self._labels, self._code_of, self._codes, self._values = {}, {}, {}, {}
+        for col in CATEGORICAL_COLUMNS:
+            cat = frame[col].astype("category")
+            self._labels[col] = list(cat.cat.categories)
+            self._code_of[col] = {v: i for i, v in enumerate(self._labels[col])}
+            self._codes[col] = cat.cat.codes.to_numpy().astype(np.int32)
+        for col, dtype in NUMERIC_COLUMNS.items():
+            self._values[col] = frame[col].to_numpy(dtype=dtype, copy=True)
+        self._lock = threading.RLock()
+        self.changes = FleetChangeLog()
+        self.row_versions = np.zeros(len(self._vins), dtype=np.int64)
+
+    @property
+    def version(self):
+        """Latest row version written (the change log cursor)."""
+        return self.changes.cursor
+
+    @classmethod
+    def generate(cls, size=FLEET_SIZE, seed=None):
+        """Builds a synthetic fleet in one vectorized pass (same distribution as the legacy loop)."""
+        rng = np.random.default_rng(seed)
+        idx = np.arange(size)
+        is_a = idx % 2 == 0
+        is_fault = is_a & (rng.random(size) < 0.3)
+
+        rms = np.where(is_fault, rng.uniform(1.5, 3.0, size), rng.uniform(0.1, 0.6, size)).round(2)
+        peak = np.where(is_fault, rng.uniform(3.0, 5.0, size), rng.uniform(0.5, 1.5, size)).round(2)
+        freq = np.where(is_fault, rng.uniform(380, 420, size), rng.uniform(40, 80, size))
+
+        frame = pd.DataFrame({
+            "Vehicle ID": np.char.add("VIN-", (10000 + idx).astype(str)).astype(object),
+            "Batch ID": pd.Categorical.from_codes(np.where(is_a, 0, 1), categories=BATCH_CATEGORIES),
+            "ECU Version": pd.Categorical.from_codes((10000 + idx) % len(ECU_VERSIONS), categories=list(ECU_VERSIONS)),
+            "Region": pd.Categorical.from_codes(np.zeros(size, dtype=np.int8), categories=[HOME_REGION]),
+            "Health Status": pd.Categorical.from_codes(np.where(is_fault, 2, 0), categories=HEALTH_CATEGORIES),
+            "Fault Type": pd.Categorical.from_codes(np.where(is_fault, 1, 0), categories=FAULT_CATEGORIES),
+            "RMS": rms.astype(np.float32),
+            "Peak": peak.astype(np.float32),
+            "Frequency": freq.astype(np.float32),
+        })
+        return cls(frame)
+
+    def __len__(self):
+        return len(self._vins)
+
+    def positions(self, vins: Sequence[str]) -> np.ndarray:
+        """Row positions for the given VINs (-1 for unknown VINs)."""
+        vins = list(vins)
+        if len(vins) > SMALL_UPDATE:
+            return self._positions.get_indexer(vins)
+        # Per-vehicle lookups: scalar hash probes, without building an Index for the query
+        out = np.full(len(vins), -1, dtype=np.int64)
+        for i, vin in enumerate(vins):
+            try:
+                out[i] = self._positions.get_loc(vin)
+            except KeyError:
+                pass
+        return out
+
+    def _build(self, rows, index=None) -> pd.DataFrame:
+        """DataFrame of the selected rows (a slice or positions); caller holds the lock."""
+        data = {"Vehicle ID": self._vins[rows]}
+        for col in FLEET_COLUMNS[1:]:
+            if col in self._codes:
+                data[col] = pd.Categorical.from_codes(self._codes[col][rows], categories=self._labels[col])
+            else:
+                data[col] = self._values[col][rows]
+        return pd.DataFrame(data, index=index, copy=True)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Consistent copy of the fleet table, safe to hand to the UI."""
+        return self.checkout()[0]
+
+    def checkout(self):
+        """(copy of the fleet table, cursor) taken atomically; feed the cursor to changes.since()."""
+        with self._lock:
+            return self._build(slice(None)), self.changes.cursor
+
+    def page(self, start, stop) -> pd.DataFrame:
+        """Copy of rows [start, stop) only (paged views of large fleets)."""
+        with self._lock:
+            rows = range(len(self._vins))[start:stop]
+            return self._build(slice(start, stop), index=pd.RangeIndex(rows.start, rows.stop))
+
+    def to_records(self) -> List[Dict]:
+        """Legacy list-of-dicts view (small fleets / JSON export only)."""
+        return self.to_frame().to_dict("records")
+
+    def _encode(self, col, vals) -> np.ndarray:
+        """Category codes for `vals`, registering unseen labels (-1 for missing)."""
+        labels, code_of = self._labels[col], self._code_of[col]
+        if len(vals) > SMALL_UPDATE:
+            found, uniques = pd.factorize(vals)  # -1 for missing values
+        else:
+            found, uniques = None, vals
+        lut = np.empty(len(uniques) + 1, dtype=np.int32)
+        lut[-1] = -1
+        for i, v in enumerate(uniques):
+            if v is None or v != v:
+                lut[i] = -1
+                continue
+            code = code_of.get(v)
+            if code is None:
+                code = code_of[v] = len(labels)
+                labels.append(v)
+            lut[i] = code
+        return lut[:-1] if found is None else lut[found]
+
+    def _row_values(self, pos) -> Dict[str, list]:
+        """Every column but the VIN at `pos`, as plain Python values (change-log payload)."""
+        out = {}
+        for col in FLEET_COLUMNS[1:]:
+            if col in self._codes:
+                labels = self._labels[col]
+                out[col] = [labels[c] if c >= 0 else None for c in self._codes[col][pos]]
+            else:
+                out[col] = self._values[col][pos].tolist()
+        return out
+
+    def update(self, vins: Sequence[str], values: Dict[str, Sequence]) -> int:
+        """
+        Incremental update for the vehicles whose status changed.
+        `values` maps column name -> one value per VIN. Unknown VINs are skipped.
+        Each written row is published to the change log with its new row version.
+        Returns the number of rows written.
+        """
+        for col in values:
+            if col not in self._codes and col not in self._values:
+                raise KeyError(f"Unknown or read-only fleet column: {col}")
+        pos = self.positions(vins)
+        known = pos >= 0
+        if not known.any():
+            return 0
+        pos = pos[known]
+        values = {col: np.asarray(vals, dtype=object)[known] for col, vals in values.items()}
+
+        with self._lock:
+            for col, vals in values.items():
+                if col in self._codes:
+                    self._codes[col][pos] = self._encode(col, vals)
+                else:
+                    self._values[col][pos] = np.asarray(vals, dtype=NUMERIC_COLUMNS[col])
+            self.row_versions[pos] = self.changes.publish(pos, self._row_values(pos))
+        return int(pos.size)
+
+    def vins(self, positions) -> np.ndarray:
+        """VIN strings for the given row positions."""
+        return self._positions.to_numpy()[np.asarray(positions, dtype=np.int64)]
+
+    def column(self, col) -> np.ndarray:
+        """Copy of a single column (categoricals as their string values)."""
+        with self._lock:
+            if col == "Vehicle ID":
+                return self._vins.copy()
+            if col in self._codes:
+                codes = self._codes[col]
+                labels = np.array(self._labels[col] + [np.nan], dtype=object)
+                return labels[codes]  # code -1 picks the trailing NaN
+            return self._values[col].copy()
+
+    def apply_result(self, res) -> bool:
+        """Projects a PipelineResult onto its fleet row. Returns False if the VIN is not in the fleet."""
+        health, fault = result_status(res)
+        t = res.telemetry
+        written = self.update([res.vehicle_id], {
+            "ECU Version": [t.ecu_version],
+            "Region": [region_of(t._secure_lat, t._secure_lon)],
+            "Health Status": [health],
+            "Fault Type": [fault],
+            "RMS": [round(t.rms, 2)],
+            "Peak": [round(t.peak, 2)],
+            "Frequency": [dominant_frequency(t.raw_waveform)],
+        })
+        return written > 0
+
+
+# --- SECONDARY INDEXES ---
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class VinBitmap:
+    """
+    Packed bitset over fleet row positions (1 bit per VIN, 125 KB per 1M vehicles).
+    Supports set algebra with `&`, `|` and `-`.
+    """
+    __slots__ = ("bits", "size")
+
+    def __init__(self, size, bits=None):
+        self.size = size
+        self.bits = np.zeros((size + 7) // 8, dtype=np.uint8) if bits is None else bits
+
+    @classmethod
+    def from_mask(cls, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return cls(mask.size, np.packbits(mask))
+
+    def add(self, positions):
+        pos = np.atleast_1d(np.asarray(positions, dtype=np.int64))
+        np.bitwise_or.at(self.bits, pos >> 3, (128 >> (pos & 7)).astype(np.uint8))
+
+    def discard(self, positions):
+        pos = np.atleast_1d(np.asarray(positions, dtype=np.int64))
+        np.bitwise_and.at(self.bits, pos >> 3, ~(128 >> (pos & 7)).astype(np.uint8))
+
+    def __contains__(self, position):
+        return bool(self.bits[position >> 3] & (128 >> (position & 7)))
+
+    def __and__(self, other):
+        return VinBitmap(self.size, self.bits & other.bits)
+
+    def __or__(self, other):
+        return VinBitmap(self.size, self.bits | other.bits)
+
+    def __sub__(self, other):
+        return VinBitmap(self.size, self.bits & ~other.bits)
+
+    def __len__(self):
+        return int(_POPCOUNT[self.bits].sum(dtype=np.int64))
+
+    def copy(self):
+        return VinBitmap(self.size, self.bits.copy())
+
+    def positions(self) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(self.bits, count=self.size))
+
+
+class FleetIndex:
+    """
+    Inverted indexes (batch_id, fault_type, dtc) -> VinBitmap over a FleetSnapshot.
+    Built once from the snapshot, then updated per workflow result.
+    """
+    DIMENSIONS = ("batch_id", "fault_type", "dtc")
+
+    def __init__(self, snapshot: FleetSnapshot):
+        self.snapshot = snapshot
+        self.size = len(snapshot)
+        self._lock = threading.RLock()
+        self._maps = {dim: {} for dim in self.DIMENSIONS}
+        self._fault_of = np.empty(self.size, dtype=object)
+        self._dtcs_of = {}  # position -> tuple of DTCs (only vehicles that have any)
+
+        for dim, col in (("batch_id", "Batch ID"), ("fault_type", "Fault Type")):
+            values = snapshot.column(col)
+            for value in pd.unique(values):
+                self._maps[dim][value] = VinBitmap.from_mask(values == value)
+        self._fault_of[:] = snapshot.column("Fault Type")
+
+        # Seed DTCs from the fault signature until a real frame arrives for the VIN
+        for fault, code in FAULT_DTC_CODES.items():
+            bm = self._maps["fault_type"].get(fault)
+            if bm is not None:
+                self._maps["dtc"][code] = bm.copy()
+                for p in bm.positions():
+                    self._dtcs_of[int(p)] = self._dtcs_of.get(int(p), ()) + (code,)
+
+    def _bitmap(self, dim, value):
+        maps = self._maps[dim]
+        if value not in maps:
+            maps[value] = VinBitmap(self.size)
+        return maps[value]
+
+    def update(self, vin, fault_type, dtcs=()) -> bool:
+        """Moves one VIN to a new fault type / DTC set. Returns False for VINs outside the fleet."""
+        pos = int(self.snapshot.positions([vin])[0])
+        if pos < 0:
+            return False
+        with self._lock:
+            old_fault = self._fault_of[pos]
+            if old_fault != fault_type:
+                if old_fault in self._maps["fault_type"]:
+                    self._maps["fault_type"][old_fault].discard(pos)
+                self._bitmap("fault_type", fault_type).add(pos)
+                self._fault_of[pos] = fault_type
+
+            new_dtcs = tuple(dtcs)
+            old_dtcs = self._dtcs_of.get(pos, ())
+            for code in set(old_dtcs) - set(new_dtcs):
+                self._maps["dtc"][code].discard(pos)
+            for code in set(new_dtcs) - set(old_dtcs):
+                self._bitmap("dtc", code).add(pos)
+            if new_dtcs:
+                self._dtcs_of[pos] = new_dtcs
+            else:
+                self._dtcs_of.pop(pos, None)
+        return True
+
+    def apply_result(self, res) -> bool:
+        _, fault = result_status(res)
+        return self.update(res.vehicle_id, fault, res.telemetry.can_codes)
+
+    def get(self, dim, value) -> VinBitmap:
+        """Bitmap for one indexed value (empty if unseen). Returned bitmaps are copies."""
+        with self._lock:
+            bm = self._maps[dim].get(value)
+            return bm.copy() if bm is not None else VinBitmap(self.size)
+
+    def values(self, dim) -> List[str]:
+        with self._lock:
+            return [v for v, bm in self._maps[dim].items() if bm.bits.any()]
+
+    def query(self, batch_id=None, fault_type=None, dtc=None) -> VinBitmap:
+        """
+        Intersection of the given filters. Each filter is a value or a list of values (union).
+        e.g. query(batch_id="Batch-2023-A", dtc="P0301")
+        """
+        result = None
+        with self._lock:
+            for dim, wanted in (("batch_id", batch_id), ("fault_type", fault_type), ("dtc", dtc)):
+                if wanted is None:
+                    continue
+                if isinstance(wanted, str):
+                    wanted = [wanted]
+                union = VinBitmap(self.size)
+                for value in wanted:
+                    bm = self._maps[dim].get(value)
+                    if bm is not None:
+                        union = union | bm
+                result = union if result is None else result & union
+        if result is None:
+            return VinBitmap.from_mask(np.ones(self.size, dtype=bool))
+        return result
+
+    def query_vins(self, **filters) -> np.ndarray:
+        return self.snapshot.vins(self.query(**filters).positions())
+
+
+# --- RECALL SCOPING ---
+
+class RecallScopeEngine:
+    """
+    Recall blast-radius queries over the whole fleet without scanning it.
+    Keeps a (level x fault type) count matrix per defect dimension (batch, ECU version,
+    region) plus each row's current codes. The snapshot holds one row per VIN, so every
+    count is a distinct vehicle. The matrices are built once from the snapshot and then kept
+    current by replaying the snapshot's change log (old codes out, new codes in), so a query
+    costs O(changes since the last query) + O(levels x faults). `defects` runs the batch-defect
+    significance scan over these same tables, and scope() uses its verdict.
+    """
+    DIMENSIONS = {"batch_id": "Batch ID", "ecu_version": "ECU Version", "region": "Region"}
+
+    def __init__(self, snapshot: FleetSnapshot):
+        self.snapshot = snapshot
+        self._lock = threading.Lock()
+        self._rebuild()
+        self.defects = BatchDefectMonitor(self, tuple(self.DIMENSIONS))
+
+    def _rebuild(self):
+        frame, cursor = self.snapshot.checkout()
+        fault = frame["Fault Type"]
+        self.faults = {v: i for i, v in enumerate(fault.cat.categories)}
+        self._fault_of = fault.cat.codes.to_numpy().astype(np.int32)
+        self.labels, self._codes_of, self.tables = {}, {}, {}
+        for dim, col in self.DIMENSIONS.items():
+            level = frame[col]
+            self.labels[dim] = {v: i for i, v in enumerate(level.cat.categories)}
+            self._codes_of[dim] = level.cat.codes.to_numpy().astype(np.int32)
+            self.tables[dim] = np.zeros((len(self.labels[dim]), len(self.faults)), dtype=np.int64)
+            self._count(dim, self._codes_of[dim], self._fault_of, 1)
+        self.cursor = cursor
+
+    @property
+    def batches(self):
+        return self.labels["batch_id"]
+
+    def _count(self, dim, levels, faults, sign):
+        ok = (levels >= 0) & (faults >= 0)
+        np.add.at(self.tables[dim], (levels[ok], faults[ok]), sign)
+
+    def _encode(self, labels, values):
+        """Codes for label strings, registering unseen labels."""
+        out = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            if v is None or v != v:
+                out[i] = -1
+                continue
+            if v not in labels:
+                labels[v] = len(labels)
+            out[i] = labels[v]
+        return out
+
+    def _fit(self):
+        """Grows every matrix to the labels registered so far."""
+        for dim, counts in self.tables.items():
+            grow = (len(self.labels[dim]) - counts.shape[0], len(self.faults) - counts.shape[1])
+            if grow[0] or grow[1]:
+                self.tables[dim] = np.pad(counts, ((0, grow[0]), (0, grow[1])))
+
+    def sync(self):
+        """Folds pending snapshot changes into the aggregates."""
+        with self._lock:
+            cursor, pos, vals = self.snapshot.changes.since(self.cursor)
+            if pos is None:
+                self._rebuild()
+                return
+            if pos.size:
+                new_f = self._encode(self.faults, vals["Fault Type"])
+                new_codes = {dim: self._encode(self.labels[dim], vals[col]) for dim, col in self.DIMENSIONS.items()}
+                self._fit()
+                for dim, codes in new_codes.items():
+                    self._count(dim, self._codes_of[dim][pos], self._fault_of[pos], -1)
+                    self._count(dim, codes, new_f, 1)
+                    self._codes_of[dim][pos] = codes
+                self._fault_of[pos] = new_f
+            self.cursor = cursor
+
+    def crosstabs(self):
+        """(cursor, {dimension: (counts copy, level labels)}, fault labels), synced first."""
+        self.sync()
+        with self._lock:
+            faults = np.array(list(self.faults), dtype=object)
+            tables = {dim: (counts.copy(), np.array(list(self.labels[dim]), dtype=object)) for dim, counts in self.tables.items()}
+            return self.cursor, tables, faults
+
+    def strata(self, dim, level, fault_type, given):
+        """
+        Per-level-of `given` 2x2 margins for "vehicle has `level`" vs "vehicle has `fault_type`":
+        (both, exposed, faulted, vehicles) arrays, one entry per stratum. Zero arrays if unseen.
+        """
+        with self._lock:
+            x, f = self.labels[dim].get(level), self.faults.get(fault_type)
+            k = len(self.labels[given])
+            if x is None or f is None or k == 0:
+                return tuple(np.zeros(max(k, 1)) for _ in range(4))
+            s = self._codes_of[given]
+            ok = s >= 0
+            s, exposed, faulted = s[ok], self._codes_of[dim][ok] == x, self._fault_of[ok] == f
+        return (np.bincount(s, weights=exposed & faulted, minlength=k), np.bincount(s, weights=exposed, minlength=k),
+                np.bincount(s, weights=faulted, minlength=k), np.bincount(s, minlength=k).astype(np.float64))
+
+    @staticmethod
+    def unit_cost(fault_type):
+        """(per-VIN remedy cost, per-VIN physical service cost) in INR."""
+        physical = RECALL_UNIT_COST_INR.get(fault_type, RECALL_DEFAULT_UNIT_COST_INR)
+        return (RECALL_OTA_UNIT_COST_INR if fault_type in RECALL_OTA_FAULTS else physical), physical
+
+    def scope(self, fault_type, batch_id: Optional[str] = None) -> Dict:
+        """
+        Blast radius of `fault_type`, for `batch_id` or (default) the batch with the highest
+        fault rate. A batch whose (batch, fault) cell is flagged by `defects` (FDR plus
+        RECALL_MIN_CASES / RECALL_MIN_LIFT) is scoped as a batch recall; otherwise only the
+        faulted VINs are targeted.
+        """
+        self.sync()
+        with self._lock:
+            counts = self.tables["batch_id"]
+            f = self.faults.get(fault_type)
+            sizes = counts.sum(axis=1)
+            hits = counts[:, f] if f is not None else np.zeros_like(sizes)
+            fleet_size, fleet_hits = int(sizes.sum()), int(hits.sum())
+            if batch_id is None:
+                rates = np.divide(hits, sizes, out=np.zeros(len(sizes)), where=sizes > 0)
+                b = int(np.argmax(rates)) if len(rates) else None
+                batch_id = next((k for k, i in self.batches.items() if i == b), None)
+            else:
+                b = self.batches.get(batch_id)
+
+        size = int(sizes[b]) if b is not None else 0
+        faulted = int(hits[b]) if b is not None else 0
+        rate = faulted / size if size else 0.0
+        baseline = fleet_hits / fleet_size if fleet_size else 0.0
+        lift = rate / baseline if baseline else 0.0
+        is_batch = b is not None and self.defects.is_flagged("batch_id", batch_id, fault_type)
+
+        # VIN scope covers every faulted VIN, and at least the vehicle under inspection
+        remedy, physical = self.unit_cost(fault_type)
+        affected = size if is_batch else max(fleet_hits, 1)
+        targeted = affected * remedy
+        global_risk = fleet_size * physical
+        return {
+            "fault_type": fault_type, "batch_id": batch_id if is_batch else "VIN-Specific",
+            "scope": "batch" if is_batch else "vin", "affected_vins": affected,
+            "faulted_vins": faulted if is_batch else affected, "fleet_size": fleet_size,
+            "fault_rate": rate, "baseline_rate": baseline, "lift": lift,
+            "ota": fault_type in RECALL_OTA_FAULTS,
+            "global_risk_inr": global_risk, "targeted_cost_inr": targeted,
+            "savings_inr": max(global_risk - targeted, 0),
+        }
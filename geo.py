@@ -0,0 +1,117 @@
+import numpy as np
+from typing import Dict, List, Sequence
+
+from config import GEO_CELL_DEG, GEO_REGION_DEG
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = np.pi * EARTH_RADIUS_KM / 180.0
+
+# --- DISTANCE ---
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km. Broadcasts over NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def region_of(lat, lon, cell_deg=GEO_REGION_DEG) -> str:
+    """Coarse region label: the south-west corner of the `cell_deg` cell, e.g. "12N-77E"."""
+    la, lo = np.floor(lat / cell_deg) * cell_deg, np.floor(lon / cell_deg) * cell_deg
+    return f"{abs(la):g}{'N' if la >= 0 else 'S'}-{abs(lo):g}{'E' if lo >= 0 else 'W'}"
+
+# --- SPATIAL INDEX ---
+
+class WorkshopIndex:
+    """
+    Geohash-style grid index over workshop coordinates with exact haversine k-nearest queries.
+    Workshops are bucketed into `cell_deg` lat/lon cells once. A query searches rings of cells
+    around its own cell until it has k candidates, then widens the ring until no unseen cell
+    can hold anything closer than the current k-th distance.
+    Queries are batched: vehicles sharing a cell share one candidate set and one distance matrix.
+    """
+    def __init__(self, workshops: Sequence[Dict], cell_deg=GEO_CELL_DEG):
+        self.workshops = list(workshops)
+        self.lat = np.array([w["lat"] for w in self.workshops], dtype=np.float64)
+        self.lon = np.array([w["lon"] for w in self.workshops], dtype=np.float64)
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.ceil(180 / cell_deg))
+        self.n_cols = int(np.ceil(360 / cell_deg))
+
+        rows, cols = self._cell(self.lat, self.lon)
+        order = np.lexsort((cols, rows))
+        keys = rows[order] * self.n_cols + cols[order]
+        uniq, starts = np.unique(keys, return_index=True)
+        bounds = np.append(starts, len(keys))
+        self._bucket_rows, self._bucket_cols = np.divmod(uniq, self.n_cols)
+        self._bucket_ids = [order[bounds[i]:bounds[i + 1]] for i in range(len(uniq))]
+
+    def __len__(self):
+        return len(self.workshops)
+
+    def _cell(self, lat, lon):
+        rows = np.clip(((np.asarray(lat) + 90) // self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+        cols = ((np.asarray(lon) + 180) // self.cell_deg).astype(np.int64) % self.n_cols
+        return rows, cols
+
+    def _ring_candidates(self, row, col, radius):
+        """Workshop ids in all cells within `radius` cells of (row, col)."""
+        col_gap = np.abs(self._bucket_cols - col)
+        col_gap = np.minimum(col_gap, self.n_cols - col_gap)
+        hit = np.flatnonzero((np.abs(self._bucket_rows - row) <= radius) & (col_gap <= radius))
+        if hit.size == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self._bucket_ids[i] for i in hit])
+
+    def _safe_radius_km(self, row, radius):
+        """Lower bound on the distance from cell `row` to any cell outside the ring."""
+        edge_lat = min(89.9, max(abs(-90 + (row - radius) * self.cell_deg), abs(-90 + (row + radius + 1) * self.cell_deg)))
+        return radius * self.cell_deg * KM_PER_DEG * np.cos(np.radians(edge_lat))
+
+    def query(self, lats, lons, k=1):
+        """
+        k nearest workshops for each (lat, lon).
+        Returns (indices, distances_km), both shaped (N, k), sorted nearest first.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        k = min(k, len(self.workshops))
+        out_idx = np.empty((lats.size, k), dtype=np.int64)
+        out_dist = np.empty((lats.size, k), dtype=np.float64)
+        if lats.size == 0 or k == 0:
+            return out_idx, out_dist
+
+        rows, cols = self._cell(lats, lons)
+        keys = rows * self.n_cols + cols
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.searchsorted(inverse[order], np.arange(len(uniq) + 1))
+
+        for g, key in enumerate(uniq):
+            members = order[bounds[g]:bounds[g + 1]]
+            row, col = divmod(int(key), self.n_cols)
+
+            radius, cand = 0, self._ring_candidates(row, col, 0)
+            while cand.size < k:
+                radius += 1
+                cand = self._ring_candidates(row, col, radius)
+            dist = haversine_km(lats[members, None], lons[members, None], self.lat[cand], self.lon[cand])
+            kth = np.partition(dist, k - 1, axis=1)[:, k - 1].max()
+
+            # Widen until the ring provably contains every point closer than the k-th candidate
+            while self._safe_radius_km(row, radius) < kth and cand.size < len(self.workshops):
+                km_per_ring = self._safe_radius_km(row, max(radius, 1)) / max(radius, 1)
+                radius = max(radius + 1, int(np.ceil(kth / max(km_per_ring, 1e-6))))
+                cand = self._ring_candidates(row, col, radius)
+                dist = haversine_km(lats[members, None], lons[members, None], self.lat[cand], self.lon[cand])
+
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k] if k < cand.size else np.tile(np.arange(cand.size), (members.size, 1))
+            top_dist = np.take_along_axis(dist, top, axis=1)
+            srt = np.argsort(top_dist, axis=1)
+            out_idx[members] = cand[np.take_along_axis(top, srt, axis=1)]
+            out_dist[members] = np.take_along_axis(top_dist, srt, axis=1)
+        return out_idx, out_dist
+
+    def nearest(self, lat, lon, k=1) -> List[Dict]:
+        """k nearest workshops for one location, each with its haversine distance."""
+        idx, dist = self.query([lat], [lon], k)
+        return [dict(self.workshops[i], distance_km=float(d)) for i, d in zip(idx[0], dist[0])]
@@ -0,0 +1,227 @@
+"""
+AuroSys Synthetic Fleet Load Generator
+--------------------------------------
+Open-loop capacity test for the agent pipeline.
+
+N simulated vehicles emit TelematicsAgent frames with a configurable fault mix. Arrivals
+are Poisson at the offered rate and are never throttled by the pipeline (open loop), so
+latency is measured from each frame's *scheduled* time and includes queueing delay.
+The offered rate is stepped up; each step runs in several processes and reports achieved
+throughput, latency percentiles and backlog, and the first step where the queue stops
+draining is reported as the saturation point.
+
+Every step of the master target starts from fresh state: its inventory database and
+blackbox archives live in a temporary directory that is removed when the step ends, so
+stock drawn down by one step or run never changes the path the next one measures.
+
+Usage:
+    python loadgen.py --vehicles 1000 --steps 10,20,40,80 --duration 10 --procs 4
+    python loadgen.py --target edge --steps 200,400,800     # edge-only stand-in endpoint
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import numpy as np
+
+from config import LOADGEN_FAULT_MIX, LOADGEN_SATURATION_RATIO
+
+# --- WORKER (one per process) ---
+
+def _build_target(target, run_dir, db_path, vehicles):
+    """
+    Returns (handle(vid, scenario, toggles), flush()) for the chosen endpoint; flush() waits
+    for background writes so `run_dir` can be removed afterwards.
+    """
+    from agents import MasterAgent, TelematicsAgent, DriverBehaviorAgent, GenAIAgent, CommsModule
+
+    if target == "master":
+        agent = MasterAgent(db_path=db_path or os.path.join(run_dir, "aurosys_loadgen.db"),
+                            archive_dir=os.path.join(run_dir, f"blackbox-{os.getpid()}"))
+        agent.get_fleet_snapshot(vehicles)
+        return (lambda vid, scenario, toggles: agent.execute_workflow(vid, scenario, toggles, None)), agent.db.flush
+
+    # Edge-only stand-in: sensing, driver scoring, heuristic diagnosis and uplink packing
+    tele, driver, comms = TelematicsAgent(), DriverBehaviorAgent(), CommsModule()
+    diag = GenAIAgent("DiagnosisAgent", None, "")
+
+    def handle(vid, scenario, toggles):
+        t = tele.read_sensors(vid, scenario, toggles)
+        driver.analyze(t)
+        d_out = diag._heuristic(t.diagnosis_view())
+        return comms.create_payload(t, d_out)
+    return handle, lambda: None
+
+
+def _draw_frame(rng, vehicles, fault_mix):
+    vid = f"VIN-{10000 + rng.randrange(vehicles)}"
+    roll = rng.random()
+    scenario, toggles = "Normal", {}
+    for fault, p in fault_mix.items():
+        if roll < p:
+            if fault == "Rod Knock":
+                scenario = fault
+            else:
+                toggles[fault] = True
+            break
+        roll -= p
+    return vid, scenario, toggles
+
+
+def run_worker(args):
+    """Offers `rate` frames/s for `duration` s; returns latencies and queue-depth samples."""
+    rate, duration, vehicles, fault_mix, target, run_dir, db_path, threads, seed = args
+    handle, flush = _build_target(target, run_dir, db_path, vehicles)
+    rng = random.Random(seed)
+    inbox = queue.Queue()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def consume():
+        while True:
+            item = inbox.get()
+            if item is None:
+                return
+            scheduled, frame = item
+            try:
+                handle(*frame)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+            with lock:
+                latencies.append(time.perf_counter() - scheduled)
+            inbox.task_done()
+
+    workers = [threading.Thread(target=consume, daemon=True) for _ in range(threads)]
+    for w in workers:
+        w.start()
+
+    # Open-loop Poisson arrivals; queue depth sampled at every arrival
+    start = time.perf_counter()
+    next_at, offered, depth = start, 0, []
+    while True:
+        next_at += rng.expovariate(rate)
+        if next_at - start >= duration:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        inbox.put((next_at, _draw_frame(rng, vehicles, fault_mix)))
+        offered += 1
+        depth.append((next_at - start, inbox.qsize()))
+
+    # Grace period of one step for in-flight work; whatever is left is backlog
+    deadline = time.perf_counter() + duration
+    while (inbox.qsize() or inbox.unfinished_tasks > 0) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    with lock:
+        elapsed = time.perf_counter() - start
+        backlog = inbox.qsize()
+        done = list(latencies)
+    for _ in workers:
+        inbox.put(None)
+    for w in workers:
+        w.join(timeout=duration)  # frames still running would write into run_dir
+    flush()
+    return {"offered": offered, "latencies": done, "elapsed": elapsed, "errors": errors[0], "backlog": backlog, "depth": depth}
+
+
+# --- DRIVER ---
+
+def run_step(rate, opts, pool):
+    per_proc = rate / opts.procs
+    with tempfile.TemporaryDirectory(prefix="aurosys-loadgen-") as run_dir:
+        jobs = [
+            (per_proc, opts.duration, opts.vehicles, opts.fault_mix, opts.target, run_dir, opts.db_path, opts.threads, opts.seed + i)
+            for i in range(opts.procs)
+        ]
+        parts = pool.map(run_worker, jobs)
+
+    lat = np.concatenate([p["latencies"] for p in parts]) if any(p["latencies"] for p in parts) else np.zeros(0)
+    offered = sum(p["offered"] for p in parts)
+    backlog = sum(p["backlog"] for p in parts)
+    # Queue growth: depth in the last quarter of the step vs the first quarter
+    growth = 0.0
+    for p in parts:
+        d = np.array(p["depth"], dtype=np.float64).reshape(-1, 2)
+        if len(d) >= 8:
+            q = len(d) // 4
+            growth += d[-q:, 1].mean() - d[:q, 1].mean()
+    completed = lat.size
+    achieved = sum(len(p["latencies"]) / p["elapsed"] for p in parts)
+    pct = np.percentile(lat, [50, 95, 99]) * 1000 if completed else [np.nan] * 3
+    return {
+        "offered_fps": rate, "arrived_fps": round(offered / opts.duration, 1), "achieved_fps": round(achieved, 1),
+        "completed": int(completed), "offered": int(offered), "errors": sum(p["errors"] for p in parts),
+        "p50_ms": round(float(pct[0]), 1), "p95_ms": round(float(pct[1]), 1), "p99_ms": round(float(pct[2]), 1),
+        "backlog": int(backlog), "queue_growth": round(growth, 1),
+    }
+
+
+def is_saturated(step):
+    """Queue no longer drains: frames left behind, or throughput well under the arrival rate."""
+    return step["backlog"] > 0 or step["achieved_fps"] < LOADGEN_SATURATION_RATIO * step["arrived_fps"]
+
+
+def parse_mix(text):
+    if not text:
+        return dict(LOADGEN_FAULT_MIX)
+    names = {"knock": "Rod Knock", "misfire": "Misfire", "mount": "Loose Mount"}
+    mix = {}
+    for part in text.split(","):
+        key, p = part.split("=")
+        mix[names.get(key.strip().lower(), key.strip())] = float(p)
+    return mix
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Open-loop synthetic fleet load generator")
+    ap.add_argument("--vehicles", type=int, default=1000, help="simulated VINs")
+    ap.add_argument("--steps", default="10,20,40,80", help="offered frames/s per step (fleet total)")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds per step")
+    ap.add_argument("--procs", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--threads", type=int, default=1, help="consumer threads per process")
+    ap.add_argument("--fault-mix", default="", help="e.g. knock=0.05,misfire=0.03,mount=0.02")
+    ap.add_argument("--target", choices=["master", "edge"], default="master")
+    ap.add_argument("--db-path", help="inventory database to keep across steps and runs (default: a fresh one per step)")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="write the step table to this file")
+    opts = ap.parse_args(argv)
+    opts.fault_mix = parse_mix(opts.fault_mix)
+
+    steps = [float(s) for s in opts.steps.split(",")]
+    print(f"Target={opts.target} vehicles={opts.vehicles} procs={opts.procs} threads={opts.threads} mix={opts.fault_mix}")
+    print(f"{'offered/s':>10} {'arrived/s':>10} {'achieved/s':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'backlog':>8} {'q-growth':>9}")
+
+    results, saturation = [], None
+    with mp.get_context("spawn").Pool(opts.procs) as pool:
+        for rate in steps:
+            step = run_step(rate, opts, pool)
+            results.append(step)
+            print(f"{step['offered_fps']:>10.1f} {step['arrived_fps']:>10.1f} {step['achieved_fps']:>11.1f} {step['p50_ms']:>8.1f} {step['p95_ms']:>8.1f} "
+                  f"{step['p99_ms']:>8.1f} {step['backlog']:>8d} {step['queue_growth']:>9.1f}")
+            if is_saturated(step):
+                saturation = step
+                break
+
+    if saturation:
+        good = [s for s in results if not is_saturated(s)]
+        last_ok = good[-1]["offered_fps"] if good else 0.0
+        print(f"\nSaturated at {saturation['offered_fps']:.1f} frames/s offered "
+              f"(peak sustained {last_ok:.1f} frames/s, {saturation['achieved_fps']:.1f} achieved at saturation).")
+    else:
+        print(f"\nNo saturation up to {steps[-1]:.1f} frames/s; extend --steps.")
+
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump({"steps": results, "saturation_fps": saturation and saturation["offered_fps"]}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+import datetime
+import itertools
+import logging
+import sqlite3
+import threading
+import uuid
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from config import (
+    DB_PATH, SCHED_OPEN_HOUR, SCHED_CLOSE_HOUR, SCHED_SLOT_MINUTES, SCHED_HORIZON_DAYS,
+    SCHED_LEAD_TIME_HOURS, SCHED_DEFAULT_BAYS,
+    INVENTORY_SEED, INVENTORY_BACKORDER_LEAD_DAYS
+)
+
+logger = logging.getLogger(__name__)
+
+# --- WORKSHOP CALENDARS ---
+
+class WorkshopCalendar:
+    """
+    Booking calendar for one workshop.
+    Business hours are cut into fixed slots; `load[i]` counts the bays busy in slot i and every
+    booking is kept as a [start, start + length) slot interval so it can be released.
+    """
+    def __init__(self, name, bays, anchor: datetime.date, slots_per_day):
+        self.name = name
+        self.bays = bays
+        self.anchor = anchor
+        self.slots_per_day = slots_per_day
+        self.load = np.zeros(SCHED_HORIZON_DAYS * slots_per_day, dtype=np.int16)
+        self.bookings = {}  # service_id -> (start, length)
+
+    def _ensure(self, end):
+        if end > self.load.size:
+            grow = max(end - self.load.size, SCHED_HORIZON_DAYS * self.slots_per_day)
+            self.load = np.concatenate([self.load, np.zeros(grow, dtype=np.int16)])
+
+    def earliest(self, start, length=1, horizon=None) -> Optional[int]:
+        """First slot >= start with `length` consecutive free bays-slots inside one business day."""
+        horizon = horizon or SCHED_HORIZON_DAYS * self.slots_per_day
+        self._ensure(start + horizon + length)
+        free = self.load[start:start + horizon + length - 1] < self.bays
+        if length > 1:
+            free = np.lib.stride_tricks.sliding_window_view(free, length).all(axis=1)
+            same_day = (np.arange(start, start + free.size) % self.slots_per_day) + length <= self.slots_per_day
+            free &= same_day
+        hits = np.flatnonzero(free[:horizon])
+        return int(start + hits[0]) if hits.size else None
+
+    def book(self, service_id, start, length=1):
+        self._ensure(start + length)
+        self.load[start:start + length] += 1
+        self.bookings[service_id] = (start, length)
+
+    def release(self, service_id) -> bool:
+        span = self.bookings.pop(service_id, None)
+        if span is None:
+            return False
+        self.load[span[0]:span[0] + span[1]] -= 1
+        return True
+
+
+class SlotAllocator:
+    """
+    Capacity-aware slot allocation across the workshop network.
+    All calendar reads and writes happen under one lock, so concurrent workflows can never
+    book the same bay-slot twice; batch allocation takes the lock once for a whole recall.
+    A booking can carry a caller reference (the VIN): allocating again for the same reference
+    returns its upcoming booking if that workshop is still a candidate, and otherwise replaces it,
+    so a vehicle holds at most one bay.
+    """
+    def __init__(self, workshops: Sequence[Dict], now_fn=datetime.datetime.now):
+        self.now_fn = now_fn
+        self.slots_per_day = (SCHED_CLOSE_HOUR - SCHED_OPEN_HOUR) * 60 // SCHED_SLOT_MINUTES
+        self.anchor = now_fn().date()
+        self.calendars = {
+            w["name"]: WorkshopCalendar(w["name"], w.get("bays", SCHED_DEFAULT_BAYS), self.anchor, self.slots_per_day)
+            for w in workshops
+        }
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1000)
+        self._owner = {}  # service_id -> workshop name
+        self._ref_of = {}  # service_id -> caller reference
+        self._by_ref = {}  # caller reference -> service_id
+
+    def slot_index(self, when: datetime.datetime) -> int:
+        """First slot starting at or after `when`."""
+        day = (when.date() - self.anchor).days
+        minute = when.hour * 60 + when.minute + (1 if when.second or when.microsecond else 0)
+        offset = minute - SCHED_OPEN_HOUR * 60
+        if offset <= 0:
+            return max(0, day * self.slots_per_day)
+        slot = -(-offset // SCHED_SLOT_MINUTES)
+        if slot >= self.slots_per_day:
+            return (day + 1) * self.slots_per_day
+        return max(0, day * self.slots_per_day + slot)
+
+    def slot_time(self, index) -> datetime.datetime:
+        day, slot = divmod(index, self.slots_per_day)
+        start = datetime.datetime.combine(self.anchor + datetime.timedelta(days=day), datetime.time(SCHED_OPEN_HOUR))
+        return start + datetime.timedelta(minutes=slot * SCHED_SLOT_MINUTES)
+
+    def _describe(self, cal, service_id, **extra):
+        idx = cal.bookings[service_id][0]
+        return dict({
+            "workshop": cal.name, "slot": self.slot_time(idx).strftime("%Y-%m-%d %H:%M"),
+            "service_id": service_id, "bays_free": int(cal.bays - cal.load[idx])
+        }, **extra)
+
+    def _release_locked(self, service_id):
+        name = self._owner.pop(service_id, None)
+        ref = self._ref_of.pop(service_id, None)
+        if ref is not None:
+            del self._by_ref[ref]
+        return name is not None and self.calendars[name].release(service_id)
+
+    def _allocate_locked(self, candidates, start, length, ref=None):
+        held = self._by_ref.get(ref) if ref is not None else None
+        if held is not None:
+            cal = self.calendars[self._owner[held]]
+            if cal.name in candidates and cal.bookings[held][0] >= start and cal.bookings[held][1] == length:
+                return self._describe(cal, held, reused=True)
+            self._release_locked(held)  # stale slot or the vehicle moved: rebook from scratch
+
+        best = None
+        for name in candidates:
+            cal = self.calendars.get(name)
+            if cal is None:
+                continue
+            idx = cal.earliest(start, length)
+            if idx is not None and (best is None or idx < best[1]):
+                best = (cal, idx)
+        if best is None:
+            return None
+        cal, idx = best
+        service_id = f"SRV-{next(self._ids)}"
+        cal.book(service_id, idx, length)
+        self._owner[service_id] = cal.name
+        if ref is not None:
+            self._ref_of[service_id] = ref
+            self._by_ref[ref] = service_id
+        return self._describe(cal, service_id, reused=False)
+
+    def _start_index(self, earliest):
+        earliest = earliest or self.now_fn() + datetime.timedelta(hours=SCHED_LEAD_TIME_HOURS)
+        return self.slot_index(earliest)
+
+    def allocate(self, candidates: Sequence[str], earliest=None, length=1, ref=None) -> Optional[Dict]:
+        """
+        Books the earliest feasible slot across `candidates` (workshop names, nearest first;
+        ties go to the nearer workshop). Returns None if every calendar is full over the horizon.
+        With `ref`, the reference's live booking is reused (reused=True) or replaced.
+        """
+        start = self._start_index(earliest)
+        with self._lock:
+            return self._allocate_locked(candidates, start, length, ref)
+
+    def allocate_batch(self, candidate_lists: Sequence[Sequence[str]], earliest=None, length=1,
+                       refs: Optional[Sequence] = None) -> List[Optional[Dict]]:
+        """Atomically books one slot per request (e.g. every VIN of a recall), in request order."""
+        start = self._start_index(earliest)
+        refs = refs if refs is not None else [None] * len(candidate_lists)
+        with self._lock:
+            return [self._allocate_locked(c, start, length, ref) for c, ref in zip(candidate_lists, refs)]
+
+    def booking_for(self, ref) -> Optional[Dict]:
+        """The live booking held under `ref`, or None."""
+        with self._lock:
+            held = self._by_ref.get(ref)
+            return None if held is None else self._describe(self.calendars[self._owner[held]], held)
+
+    def release(self, service_id) -> bool:
+        """Frees the booking's bays. False for unknown or already released ids."""
+        with self._lock:
+            return self._release_locked(service_id)
+
+    def utilization(self) -> Dict[str, float]:
+        """Fraction of bay-slots booked over the horizon, per workshop."""
+        with self._lock:
+            return {
+                name: float(cal.load[:SCHED_HORIZON_DAYS * self.slots_per_day].sum()) / (cal.bays * SCHED_HORIZON_DAYS * self.slots_per_day)
+                for name, cal in self.calendars.items()
+            }
+
+
+# --- PARTS INVENTORY ---
+
+class InventoryStore:
+    """
+    Parts-by-warehouse stock with atomic, idempotent reservations.
+    SQLite is the source of truth; an in-memory index ((part, warehouse) -> [on_hand, reserved],
+    plus a per-part list of warehouses ordered by lead time) serves reads and is re-read from
+    the database after every write. Writes are relative and guarded (reserved = reserved + qty
+    only while on_hand - reserved still covers qty) inside one IMMEDIATE transaction, so several
+    stores or processes sharing a database cannot oversell or overwrite each other's counts.
+    A reservation can carry a caller reference (the VIN): reserving again for the same
+    reference returns the live reservation instead of stacking another. The reservations
+    table is the set of live ids; each one is released or fulfilled (sold) exactly once.
+    """
+    def __init__(self, db_path=DB_PATH, seed=INVENTORY_SEED):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._stock = {}      # (part, warehouse) -> [on_hand, reserved]
+        self._lead_time = {}  # (part, warehouse) -> days
+        self._by_part = {}    # part -> [warehouse, ...] fastest first
+        self._init_db(seed)
+        self._load()
+
+    def _get_conn(self):
+        return sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+
+    def _init_db(self, seed):
+        conn = self._get_conn()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inventory_stock (
+                    part TEXT, warehouse TEXT, on_hand INTEGER, reserved INTEGER, lead_time_days INTEGER,
+                    PRIMARY KEY (part, warehouse)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS inventory_reservations (
+                    id TEXT PRIMARY KEY, part TEXT, warehouse TEXT, qty INTEGER, created_at TEXT, ref TEXT
+                )
+            """)
+            cols = [row[1] for row in conn.execute("PRAGMA table_info(inventory_reservations)").fetchall()]
+            if "ref" not in cols:
+                conn.execute("ALTER TABLE inventory_reservations ADD COLUMN ref TEXT")
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_rsv_ref ON inventory_reservations (ref) WHERE ref IS NOT NULL")
+            conn.executemany(
+                "INSERT OR IGNORE INTO inventory_stock VALUES (?, ?, ?, 0, ?)",
+                [(p, w, qty, lead) for p, w, qty, lead in seed]
+            )
+            conn.commit()
+        except Exception as e:
+            logger.error(f"Inventory initialization error: {e}")
+        finally:
+            conn.close()
+
+    def _load(self):
+        conn = self._get_conn()
+        try:
+            rows = conn.execute("SELECT part, warehouse, on_hand, reserved, lead_time_days FROM inventory_stock").fetchall()
+        finally:
+            conn.close()
+        for part, wh, on_hand, reserved, lead in rows:
+            self._stock[(part, wh)] = [on_hand, reserved]
+            self._lead_time[(part, wh)] = lead
+            self._by_part.setdefault(part, []).append(wh)
+        for part, whs in self._by_part.items():
+            whs.sort(key=lambda w: self._lead_time[(part, w)])
+
+    def available(self, part, warehouse=None) -> int:
+        with self._lock:
+            whs = [warehouse] if warehouse else self._by_part.get(part, [])
+            return sum(self._stock[(part, w)][0] - self._stock[(part, w)][1] for w in whs if (part, w) in self._stock)
+
+    def lead_time(self, part, warehouse) -> int:
+        return self._lead_time.get((part, warehouse), INVENTORY_BACKORDER_LEAD_DAYS)
+
+    def _write(self, fn, *args):
+        """
+        Runs fn(conn, touched, *args) in one IMMEDIATE transaction (the database write lock is held from
+        the first read), then re-reads the stock rows fn added to `touched` into the in-memory index.
+        Returns fn's result, or None if the transaction failed and was rolled back.
+        """
+        touched = set()
+        conn = self._get_conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(conn, touched, *args)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            for key in touched:
+                row = conn.execute("SELECT on_hand, reserved FROM inventory_stock WHERE part = ? AND warehouse = ?", key).fetchone()
+                if row:
+                    self._stock[key] = list(row)
+            return out
+        finally:
+            conn.close()
+
+    def _reserve_tx(self, conn, touched, part, qty, ref, now):
+        if ref is not None:
+            row = conn.execute("SELECT id, part, warehouse, qty FROM inventory_reservations WHERE ref = ?", (ref,)).fetchone()
+            if row and row[1] == part and row[3] == qty:
+                touched.add((part, row[2]))
+                return {"reservation_id": row[0], "part": part, "warehouse": row[2], "qty": qty, "ref": ref, "reused": True}
+            if row:
+                # Same vehicle, different part (diagnosis changed): swap the hold
+                self._finish_tx(conn, touched, row[0], False)
+        for wh in self._by_part.get(part, []):
+            touched.add((part, wh))
+            hit = conn.execute(
+                "UPDATE inventory_stock SET reserved = reserved + ? WHERE part = ? AND warehouse = ? AND on_hand - reserved >= ?",
+                (qty, part, wh, qty)
+            )
+            if hit.rowcount == 1:
+                rid = f"RSV-{uuid.uuid4().hex[:10].upper()}"
+                conn.execute(
+                    "INSERT INTO inventory_reservations (id, part, warehouse, qty, created_at, ref) VALUES (?, ?, ?, ?, ?, ?)",
+                    (rid, part, wh, qty, now, ref)
+                )
+                return {"reservation_id": rid, "part": part, "warehouse": wh, "qty": qty, "ref": ref, "reused": False}
+        return None
+
+    def _finish_tx(self, conn, touched, reservation_id, sold) -> bool:
+        """Closes one live reservation: units go back to stock, or leave it as a sale."""
+        row = conn.execute("SELECT part, warehouse, qty FROM inventory_reservations WHERE id = ?", (reservation_id,)).fetchone()
+        if row is None or conn.execute("DELETE FROM inventory_reservations WHERE id = ?", (reservation_id,)).rowcount != 1:
+            return False
+        part, wh, qty = row
+        touched.add((part, wh))
+        if sold:
+            hit = conn.execute(
+                "UPDATE inventory_stock SET on_hand = on_hand - ?, reserved = reserved - ? WHERE part = ? AND warehouse = ? AND reserved >= ?",
+                (qty, qty, part, wh, qty)
+            )
+        else:
+            hit = conn.execute(
+                "UPDATE inventory_stock SET reserved = reserved - ? WHERE part = ? AND warehouse = ? AND reserved >= ?",
+                (qty, part, wh, qty)
+            )
+        if hit.rowcount != 1:
+            raise RuntimeError(f"Reservation {reservation_id} exceeds reserved stock of {part} @ {wh}")
+        return True
+
+    def _annotate(self, rows):
+        """Adds lead time and post-write availability to reservation dicts."""
+        for r in rows:
+            if r:
+                r["lead_time_days"] = self._lead_time[(r["part"], r["warehouse"])]
+                stock = self._stock[(r["part"], r["warehouse"])]
+                r["remaining"] = stock[0] - stock[1]
+        return rows
+
+    def reserve(self, part, qty=1, ref=None) -> Optional[Dict]:
+        """
+        Reserves `qty` units from the fastest warehouse that can cover them. None if nobody can.
+        With `ref`, a live reservation for the same ref and part is returned as is (reused=True).
+        """
+        now = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            try:
+                rsv = self._write(self._reserve_tx, part, qty, ref, now)
+            except Exception as e:
+                logger.error(f"Inventory reservation error for {part}: {e}")
+                return None
+            return self._annotate([rsv])[0]
+
+    def reserve_bulk(self, part, count, refs: Optional[Sequence] = None) -> List[Optional[Dict]]:
+        """Batch-recall path: `count` single-unit reservations (optionally one per ref) in one transaction."""
+        refs = list(refs) if refs is not None else [None] * count
+        now = datetime.datetime.utcnow().isoformat()
+
+        def bulk(conn, touched):
+            return [self._reserve_tx(conn, touched, part, 1, ref, now) for ref in refs]
+
+        with self._lock:
+            try:
+                out = self._write(bulk)
+            except Exception as e:
+                logger.error(f"Inventory bulk reservation rollback for {part}: {e}")
+                return [None] * len(refs)
+            return self._annotate(out)
+
+    def reservation_for(self, ref) -> Optional[Dict]:
+        """The live reservation held under `ref`, if any."""
+        conn = self._get_conn()
+        try:
+            row = conn.execute("SELECT id, part, warehouse, qty FROM inventory_reservations WHERE ref = ?", (ref,)).fetchone()
+        finally:
+            conn.close()
+        return None if row is None else {"reservation_id": row[0], "part": row[1], "warehouse": row[2], "qty": row[3], "ref": ref}
+
+    def _close(self, reservation_id, sold) -> bool:
+        with self._lock:
+            try:
+                return bool(self._write(self._finish_tx, reservation_id, sold))
+            except Exception as e:
+                logger.error(f"Inventory {'fulfilment' if sold else 'release'} error for {reservation_id}: {e}")
+                return False
+
+    def release(self, reservation_id) -> bool:
+        """Returns a live reservation's units to stock. False for unknown or already closed ids."""
+        return self._close(reservation_id, sold=False)
+
+    def fulfil(self, reservation_id) -> bool:
+        """Converts a live reservation into a sale (units leave on-hand stock). False for unknown or closed ids."""
+        return self._close(reservation_id, sold=True)
@@ -0,0 +1,145 @@
+from agents import GenAIAgent, FinancialAgent
+from fleet import FleetSnapshot, RecallScopeEngine, CATEGORICAL_COLUMNS
+from config import ECU_VERSIONS, RECALL_UNIT_COST_INR
+import numpy as np
+import pandas as pd
+import time
+
+RCA = GenAIAgent("RCAAgent", None, "")
+
+def make_fleet(batch, ecu, fault):
+    """Snapshot from per-VIN batch / ECU / fault codes (indexes into the category lists)."""
+    n = len(batch)
+    cat = lambda codes, col: pd.Categorical.from_codes(np.asarray(codes), categories=CATEGORICAL_COLUMNS[col])
+    fault = np.asarray(fault)
+    return FleetSnapshot(pd.DataFrame({
+        "Vehicle ID": np.char.add("VIN-", (10000 + np.arange(n)).astype(str)).astype(object),
+        "Batch ID": cat(batch, "Batch ID"), "ECU Version": cat(ecu, "ECU Version"),
+        "Region": cat(np.zeros(n, dtype=np.int8), "Region"),
+        "Health Status": cat(np.where(fault > 0, 2, 0), "Health Status"), "Fault Type": cat(fault, "Fault Type"),
+        "RMS": np.ones(n, dtype=np.float32), "Peak": np.ones(n, dtype=np.float32), "Frequency": np.ones(n, dtype=np.float32),
+    }))
+
+def levels_of(fleet, i):
+    row = fleet.page(i, i + 1).iloc[0]
+    return {"batch_id": row["Batch ID"], "ecu_version": row["ECU Version"], "region": row["Region"]}
+
+def test_repeat_diagnoses():
+    print("Test 1: One VIN Diagnosed 12 Times Is One Vehicle")
+    idx = np.arange(200)
+    fleet = make_fleet(idx % 2, idx % 3, np.zeros(200, dtype=int))
+    engine = RecallScopeEngine(fleet)
+    for _ in range(12):
+        fleet.update(["VIN-10000"], {"Health Status": ["Critical"], "Fault Type": ["Rod Knock"]})
+    evidence = engine.defects.evidence("Rod Knock", levels_of(fleet, 0))
+    rca = RCA._heuristic({"fault_type": "Rod Knock", "fleet_evidence": evidence})
+    print(f"Rod Knock vehicles: {int(engine.defects.source.crosstabs()[1]['batch_id'][0][:, 1].sum())}; "
+          f"flagged: {len(engine.defects.flagged())}; RCA: {rca['manufacturing_action']}, OTA {rca['ota_eligible']}")
+    assert engine.defects.flagged().empty and not evidence and not rca["ota_eligible"]
+
+def test_confounded(rng):
+    n = 20000
+    batch = rng.integers(0, 2, n)
+    ecu = np.where(batch == 0, 0, rng.integers(1, 3, n))  # ECU-v1.1 ships only on Batch-2023-A
+
+    print("\nTest 2: Mechanical Fault Never Maps To ECU / OTA")
+    fault = np.where(rng.random(n) < np.where(batch == 0, 0.04, 0.01), 1, 0)
+    fleet = make_fleet(batch, ecu, fault)
+    engine = RecallScopeEngine(fleet)
+    vin = int(np.flatnonzero((batch == 0) & (fault == 1))[0])
+    flagged = engine.defects.flagged()
+    evidence = engine.defects.evidence("Rod Knock", levels_of(fleet, vin))
+    rca = RCA._heuristic({"fault_type": "Rod Knock", "fleet_evidence": evidence})
+    print(flagged[["dimension", "level", "fault_type", "cases", "lift", "q_value"]].to_string(index=False))
+    print(f"evidence: {[(e['dimension'], e['level']) for e in evidence]} -> {rca['manufacturing_action']}, OTA {rca['ota_eligible']}")
+    assert ((flagged["dimension"] == "ecu_version") & (flagged["level"] == "ECU-v1.1")).any()
+    assert [e["dimension"] for e in evidence] == ["batch_id"] and not rca["ota_eligible"]
+
+    print("\nTest 3: Fully Confounded Software Fault Stays Unresolved")
+    fault = np.where(rng.random(n) < np.where(batch == 0, 0.04, 0.01), 2, 0)
+    fleet = make_fleet(batch, ecu, fault)
+    engine = RecallScopeEngine(fleet)
+    vin = int(np.flatnonzero((batch == 0) & (fault == 2))[0])
+    evidence = engine.defects.evidence("Misfire", levels_of(fleet, vin))
+    rca = RCA._heuristic({"fault_type": "Misfire", "fleet_evidence": evidence})
+    print(f"evidence: {[(e['dimension'], e['identified'], round(e['conditional_p'], 3)) for e in evidence]} -> {rca['manufacturing_action']}, OTA {rca['ota_eligible']}")
+    assert len(evidence) == 2 and not any(e["identified"] for e in evidence)
+    assert evidence[0]["dimension"] == "batch_id" and not rca["ota_eligible"]
+
+def test_conditional(rng):
+    print("\nTest 4: ECU Defect Separated From Its Batch")
+    n = 20000
+    batch = rng.integers(0, 2, n)
+    on_v12 = rng.random(n) < np.where(batch == 0, 0.7, 0.3)  # ECU-v1.2 rolled out mostly on Batch-2023-A
+    ecu = np.where(on_v12, 1, np.where(rng.random(n) < 0.5, 0, 2))
+    fault = np.where(rng.random(n) < np.where(on_v12, 0.06, 0.005), 2, 0)
+    fleet = make_fleet(batch, ecu, fault)
+    engine = RecallScopeEngine(fleet)
+    vin = int(np.flatnonzero((batch == 0) & on_v12 & (fault == 2))[0])
+    evidence = engine.defects.evidence("Misfire", levels_of(fleet, vin))
+    rca = RCA._heuristic({"fault_type": "Misfire", "fleet_evidence": evidence})
+    print("evidence:", [(e["dimension"], e["level"], e["identified"], float("%.1e" % e["conditional_p"])) for e in evidence])
+    print(f"-> {rca['manufacturing_action']} for {rca['batch_id']}, OTA {rca['ota_eligible']}")
+    assert evidence[0]["dimension"] == "ecu_version" and evidence[0]["identified"]
+    assert all(not e["identified"] for e in evidence[1:]) and rca["ota_eligible"]
+
+def test_quotes():
+    print("\nTest 5: Evidence-Backed Quotes Match The Service Cost")
+    fin = FinancialAgent()
+    batch = {"dimension": "batch_id", "level": "Batch-2023-A", "identified": True}
+    ecu = {"dimension": "ecu_version", "level": "ECU-v1.2", "identified": True}
+    quotes = {}
+    for ft, top in [("Rod Knock", batch), ("Mount Failure", batch), ("Misfire", ecu)]:
+        rca = RCA._heuristic({"fault_type": ft, "fleet_evidence": [top]})
+        quotes[ft] = fin.compute({}, rca)["total_estimate_inr"]
+    no_evidence = fin.compute({}, RCA._heuristic({"fault_type": "Rod Knock"}))["total_estimate_inr"]
+    print(quotes, "| without evidence:", no_evidence)
+    assert quotes["Rod Knock"] == no_evidence == RECALL_UNIT_COST_INR["Rod Knock"]
+    assert quotes["Mount Failure"] == RECALL_UNIT_COST_INR["Mount Failure"] and quotes["Misfire"] == 0
+
+def test_null_fleets(rng, trials=20):
+    print("\nTest 6: False Flags On Defect-Free Fleets")
+    false = 0
+    for _ in range(trials):
+        n = 5000
+        fault = np.where(rng.random(n) < 0.06, rng.integers(1, 4, n), 0)
+        engine = RecallScopeEngine(make_fleet(rng.integers(0, 2, n), rng.integers(0, 3, n), fault))
+        false += len(engine.defects.flagged())
+    print(f"{false} flagged cells over {trials} fleets of 5,000 vehicles (FDR {engine.defects.alpha:g})")
+    assert false <= 2
+
+def test_throughput(rng):
+    print("\nTest 7: Scan Cost At 500k Vehicles")
+    n = 500_000
+    fault = np.where(rng.random(n) < 0.03, rng.integers(1, 4, n), 0)
+    fleet = make_fleet(rng.integers(0, 2, n), rng.integers(0, len(ECU_VERSIONS), n), fault)
+    start = time.perf_counter()
+    engine = RecallScopeEngine(fleet)
+    build = time.perf_counter() - start
+
+    vins = fleet.vins(rng.integers(0, n, 1000))
+    start = time.perf_counter()
+    for vin in vins:
+        fleet.update([vin], {"Health Status": ["Critical"], "Fault Type": ["Rod Knock"]})
+    update = (time.perf_counter() - start) / len(vins) * 1e6
+
+    start = time.perf_counter()
+    scan = engine.defects.scan()
+    rescan = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.defects.scan()
+    cached = time.perf_counter() - start
+    start = time.perf_counter()
+    evidence = engine.defects.evidence("Rod Knock", levels_of(fleet, 0))
+    query = time.perf_counter() - start
+    print(f"build {build:.2f}s; {update:.0f} us/VIN update; sync 1,000 changes + scan {len(scan)} cells {rescan * 1e3:.1f} ms; "
+          f"cached scan {cached * 1e6:.0f} us; evidence {query * 1e3:.1f} ms ({len(evidence)} rows)")
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(7)
+    test_repeat_diagnoses()
+    test_confounded(rng)
+    test_conditional(rng)
+    test_quotes()
+    test_null_fleets(rng)
+    test_throughput(rng)
@@ -0,0 +1,76 @@
+from blackbox import BlackboxArchive
+import numpy as np
+import os
+import tempfile
+
+SAMPLES = 64
+
+def waves(n, start=0):
+    """Row i is filled with the value start + i, so any mix-up shows in the data."""
+    return [np.full(SAMPLES, start + i, dtype=np.float32) for i in range(n)]
+
+def append(archive, n, start=0, ts0=1000.0):
+    return archive.append_many([
+        {"vin": f"VIN-{(start + i) % 3}", "batch_id": "Batch-2023-A", "fault_type": "Rod Knock", "waveform": w, "ts": ts0 + start + i}
+        for i, w in enumerate(waves(n, start))
+    ])
+
+def test_append_and_read(root):
+    archive = BlackboxArchive(root, samples=SAMPLES, segment_frames=8)
+
+    print("Test 1: Append Across Segments And Read Back")
+    append(archive, 20)
+    archive.append("VIN-9", "Batch-2023-B", "Misfire", np.arange(10))                # short: NaN-padded
+    archive.append("VIN-9", "Batch-2023-B", "Misfire", np.arange(SAMPLES * 2))       # long: truncated
+    meta, data = archive.query(fault_type="Rod Knock")
+    print(archive.stats(), meta["segment"].value_counts().sort_index().to_dict())
+    assert data[:, 0].tolist() == list(range(20)) and meta["segment"].max() == 2
+    short, long = archive.query(vin="VIN-9")[1]
+    assert np.isnan(short[10:]).all() and short[:10].tolist() == list(range(10))
+    assert long.tolist() == list(range(SAMPLES)) and archive.count(vin="VIN-9") == 2
+
+def test_reopen(root):
+    print("\nTest 2: Reopen Continues Where The Last Writer Stopped")
+    archive = BlackboxArchive(root, samples=SAMPLES, segment_frames=8)
+    print(f"reopened at segment {archive._segment}, row {archive._rows}")
+    assert (archive._segment, archive._rows) == (2, 6)
+    append(archive, 5, start=100)
+    meta, data = archive.query(fault_type="Rod Knock")
+    assert data[:, 0].tolist() == list(range(20)) + list(range(100, 105))
+    assert meta[["segment", "row"]].apply(tuple, axis=1).is_unique
+
+def test_torn_tail(root):
+    print("\nTest 3: Torn Trailing Row Is Cut Off")
+    archive = BlackboxArchive(root, samples=SAMPLES, segment_frames=8)
+    path = archive._path(archive._segment)
+    before = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(np.full(SAMPLES // 2, -1, dtype=np.float32).tobytes())  # crash mid-row, never indexed
+    archive = BlackboxArchive(root, samples=SAMPLES, segment_frames=8)
+    print(f"{before} -> {before + SAMPLES * 2} bytes on disk -> {os.path.getsize(path)} after reopen")
+    assert os.path.getsize(path) == before
+    append(archive, 3, start=200)
+    meta, data = archive.query(fault_type="Rod Knock")
+    assert data[:, 0].tolist() == list(range(20)) + list(range(100, 105)) + [200, 201, 202]
+    assert not (data == -1).any()
+
+def test_newest(root):
+    print("\nTest 4: newest=True Keeps The Latest Rows In Time Order")
+    archive = BlackboxArchive(root, samples=SAMPLES, segment_frames=8)
+    archive.append_many([  # same ts: id breaks the tie
+        {"vin": "VIN-T", "batch_id": "Batch-2023-A", "fault_type": "Rod Knock", "waveform": w, "ts": 1300.0} for w in waves(3, 300)
+    ])
+    meta, data = archive.query(fault_type="Rod Knock", limit=5, newest=True)
+    oldest = archive.query(fault_type="Rod Knock", limit=2)[1]
+    print(data[:, 0].tolist(), meta["ts"].tolist())
+    assert data[:, 0].tolist() == [201, 202, 300, 301, 302] and meta["ts"].is_monotonic_increasing
+    assert oldest[:, 0].tolist() == [0, 1]
+    assert archive.query(vin="VIN-T", limit=2, newest=True)[1][:, 0].tolist() == [301, 302]
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "archive")
+        test_append_and_read(root)
+        test_reopen(root)
+        test_torn_tail(root)
+        test_newest(root)
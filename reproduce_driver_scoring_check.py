@@ -0,0 +1,55 @@
+from agents import DriverBehaviorAgent
+from core import TelemetryFrame
+import random
+import time
+import numpy as np
+
+def make_frame(i, rng):
+    return TelemetryFrame(
+        vehicle_id=f"VIN-{i}", timestamp="00:00:00",
+        rms=rng.choice([0.0, 0.5, 1.0, 1.6667, 2.5, 7.0, rng.uniform(0, 8)]), peak=0.0, raw_waveform=[],
+        rpm=rng.choice([0, 800, 3000, 3001, 3600, 6000, 7200, rng.randint(0, 8000)]),
+        speed_kmh=rng.choice([0.0, 25.0, 100.0, 100.5, 140.0, rng.uniform(0, 160)]),
+        throttle_pos=rng.choice([0.0, 10.0, 49.0, rng.uniform(0, 100)]),
+        temperature=rng.choice([40.0, 69.9, 70.0, 90.0, rng.uniform(30, 120)]),
+        coolant_temp=90.0, oil_pressure=40.0, battery_volts=12.6,
+        brake_wear_pct=rng.choice([0.0, 12.5, 25.0, 60.0, rng.uniform(0, 80)]),
+        tire_pressure=32.0, can_codes=[], batch_id="B-01", _secure_lat=0.0, _secure_lon=0.0
+    )
+
+def test_driver_batch_parity():
+    agent = DriverBehaviorAgent()
+    rng = random.Random(11)
+
+    print("Test 1: Batch vs Scalar Parity")
+    frames = [make_frame(i, rng) for i in range(20000)]
+    cols = {c: [getattr(f, c) for f in frames] for c in DriverBehaviorAgent.BATCH_COLUMNS}
+    res = agent.analyze_batch(cols)
+    for i, f in enumerate(frames):
+        scalar = agent.analyze(f)
+        assert res["safety_score"][i] == scalar["safety_score"], (f, res["safety_score"][i], scalar)
+        assert res["status"][i] == scalar["status"], (f, scalar)
+        assert DriverBehaviorAgent.tags_from_codes(res["tag_codes"][i]) == scalar["tags"], (f, scalar)
+        assert {k: int(res[k][i]) for k in scalar["dna"]} == scalar["dna"], (f, scalar)
+    print(f"{len(frames)} rows match")
+
+def test_driver_batch_throughput():
+    agent = DriverBehaviorAgent()
+    rng = np.random.default_rng(3)
+    n = 1_000_000
+
+    print("\nTest 2: Fleet Rescoring Throughput")
+    cols = {
+        "speed_kmh": rng.uniform(0, 160, n), "throttle_pos": rng.uniform(0, 100, n),
+        "rpm": rng.integers(0, 8000, n), "temperature": rng.uniform(30, 120, n),
+        "rms": rng.uniform(0, 8, n), "brake_wear_pct": rng.uniform(0, 80, n),
+    }
+    start = time.perf_counter()
+    res = agent.analyze_batch(cols)
+    elapsed = time.perf_counter() - start
+    mix = {str(k): int(v) for k, v in zip(*np.unique(res["status"], return_counts=True))}
+    print(f"{n:,} frames in {elapsed:.3f}s; status mix: {mix}")
+
+if __name__ == "__main__":
+    test_driver_batch_parity()
+    test_driver_batch_throughput()
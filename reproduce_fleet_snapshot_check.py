@@ -0,0 +1,58 @@
+from fleet import FleetSnapshot, FleetIndex, RecallScopeEngine, FLEET_COLUMNS
+import numpy as np
+import pandas as pd
+import time
+
+def test_reads_follow_writes():
+    fleet = FleetSnapshot.generate(1000, seed=3)
+    before = fleet.to_frame()
+
+    print("Test 1: Reads Reflect In-Place Writes")
+    written = fleet.update(["VIN-10001", "VIN-99999", "VIN-10002"], {
+        "Health Status": ["Critical", "Warning", "Warning"], "Fault Type": ["Misfire", "Misfire", "Gearbox Whine"],
+        "Region": ["Region (13, 78)", None, "Region (12, 77)"], "RMS": [2.5, 0.0, 1.25],
+    })
+    after = fleet.to_frame()
+    rows = after.iloc[1:3]
+    print(rows.to_string())
+    assert written == 2 and list(after.columns) == FLEET_COLUMNS
+    assert rows["Fault Type"].tolist() == ["Misfire", "Gearbox Whine"] and rows["RMS"].tolist() == [2.5, 1.25]
+    assert "Gearbox Whine" in after["Fault Type"].cat.categories and after["Fault Type"].dtype == "category"
+    assert after.drop(index=[1, 2]).equals(before.drop(index=[1, 2]).astype(after.dtypes))
+    assert fleet.page(1, 3).equals(rows) and fleet.page(1, 3).index.tolist() == [1, 2]
+    assert fleet.column("Fault Type")[2] == "Gearbox Whine" and fleet.column("RMS").dtype == np.float32
+
+    print("\nTest 2: Change Log Carries The Written Rows")
+    cursor, pos, vals = fleet.changes.since(0)
+    print(cursor, pos.tolist(), {c: v for c, v in vals.items() if c in ("Fault Type", "Region", "RMS")})
+    assert cursor == 2 and pos.tolist() == [1, 2] and vals["Fault Type"] == ["Misfire", "Gearbox Whine"]
+    assert fleet.row_versions[[1, 2]].tolist() == [1, 2]
+
+    print("\nTest 3: Index And Scope Engine Stay Consistent")
+    index, scope = FleetIndex(fleet), RecallScopeEngine(fleet)
+    fleet.update(["VIN-10004"], {"Fault Type": ["Gearbox Whine"], "Health Status": ["Warning"]})
+    cursor, tables, faults = scope.crosstabs()
+    counts = tables["batch_id"][0][:, list(faults).index("Gearbox Whine")]
+    print(cursor, counts.tolist(), len(index.get("fault_type", "Misfire")))
+    assert counts.sum() == 2 and len(index.get("fault_type", "Misfire")) == (fleet.column("Fault Type") == "Misfire").sum()
+
+def test_update_cost(sizes=(1_000, 100_000, 1_000_000, 3_000_000), n=2000):
+    print("\nTest 4: Per-VIN Update Cost By Fleet Size")
+    rng = np.random.default_rng(5)
+    costs = []
+    for size in sizes:
+        fleet = FleetSnapshot.generate(size, seed=1)
+        vins = fleet.vins(rng.integers(0, size, n))
+        fleet.positions(vins[:1])  # builds the VIN hash table once
+        start = time.perf_counter()
+        for vin in vins:
+            fleet.update([vin], {"Health Status": ["Critical"], "Fault Type": ["Rod Knock"], "RMS": [2.0]})
+        costs.append((time.perf_counter() - start) / n * 1e6)
+        start = time.perf_counter()
+        fleet.to_frame()
+        print(f"{size:>9,} VINs: {costs[-1]:6.1f} us/update; full table read {(time.perf_counter() - start) * 1e3:.1f} ms")
+    assert max(costs) < 500
+
+if __name__ == "__main__":
+    test_reads_follow_writes()
+    test_update_cost()
@@ -0,0 +1,102 @@
+from agents import GenAIAgent, HAS_GENAI_LIB
+from config import GENAI_MAX_INFLIGHT
+import logging
+import threading
+import time
+
+logging.getLogger("agents").setLevel(logging.CRITICAL)  # expected timeouts
+logging.getLogger("core").setLevel(logging.CRITICAL)
+
+DIAG = {"rms": 0.5, "can_codes": [], "burst_prominence": 1.0, "band_rms": 0.0}
+
+class StubModel:
+    """
+    Upstream that hangs while down. Like the real client with http_options.timeout, a hung
+    request gives up after the timeout it was sent with (None would hang for good).
+    """
+    def __init__(self):
+        self.up = False
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def request(self, timeout):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if not self.up:
+                time.sleep(timeout)
+                raise TimeoutError("read timed out")
+            return {"fault_detected": False, "fault_type": "Normal", "source": "model"}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+def stub_agent(model, timeout=0.3, cooldown=0.2, hedge=0.0):
+    agent = GenAIAgent("DiagnosisAgent", None, "", hedge_after_s=hedge, call_timeout_s=timeout)
+    agent._call_model = lambda inputs, api_key, t: model.request(t)
+    agent._ping = lambda api_key, t: model.request(t) is not None
+    agent.breaker.cooldown_s = cooldown
+    return agent
+
+def test_client_timeout():
+    print("Test 1: Client Carries The Deadline As Its HTTP Timeout")
+    client = GenAIAgent._client("test-key", 1.5)
+    print(client._api_client._http_options.timeout, "ms")
+    assert client._api_client._http_options.timeout == 1500
+
+def test_trip_short_circuit_close():
+    model = StubModel()
+    agent = stub_agent(model)
+
+    print("\nTest 2: Hung Upstream Trips The Breaker")
+    start = time.monotonic()
+    outs = [agent.execute(DIAG, "test-key") for _ in range(3)]
+    print(f"{time.monotonic() - start:.2f}s for 3 calls; breaker {agent.breaker.state}")
+    assert agent.breaker.state == "open" and all("source" not in o for o in outs)
+
+    print("\nTest 3: Open Breaker Short-Circuits")
+    calls, start = model.calls, time.monotonic()
+    for _ in range(20):
+        agent.execute(DIAG, "test-key")
+    took = time.monotonic() - start
+    print(f"20 calls in {took * 1e3:.1f} ms; upstream requests meanwhile: {model.calls - calls}")
+    assert took < 0.1 and agent.metrics()["short_circuits"] == 20
+
+    print("\nTest 4: Probes Stay Bounded, Breaker Closes On Recovery")
+    time.sleep(1.0)  # several probes hang and time out
+    probes = model.calls - calls
+    print(f"{probes} probes timed out while down; in flight now {model.active}")
+    assert agent.breaker.state == "open" and probes >= 2 and model.active <= 1
+    model.up = True
+    for _ in range(50):
+        if agent.breaker.allow():
+            break
+        time.sleep(0.05)
+    out = agent.execute(DIAG, "test-key")
+    print(agent.metrics())
+    assert agent.breaker.state == "closed" and out.get("source") == "model"
+
+def test_workers_freed():
+    model = StubModel()
+    agent = stub_agent(model, timeout=0.2, hedge=0.05)
+    agent.breaker.failures = 10 ** 6  # keep calling through the outage
+
+    print("\nTest 5: Abandoned Calls Free Their Workers")
+    for _ in range(12):
+        agent.execute(DIAG, "test-key")
+    time.sleep(0.3)
+    model.up = True
+    start = time.monotonic()
+    out = agent.execute(DIAG, "test-key")
+    print(f"peak in flight {model.peak} (pool {GENAI_MAX_INFLIGHT}); after recovery answered in {(time.monotonic() - start) * 1e3:.0f} ms")
+    assert model.peak <= GENAI_MAX_INFLIGHT and model.active == 0 and out.get("source") == "model"
+
+if __name__ == "__main__":
+    assert HAS_GENAI_LIB, "google-genai is required for this check"
+    test_client_timeout()
+    test_trip_short_circuit_close()
+    test_workers_freed()
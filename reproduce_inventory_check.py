@@ -0,0 +1,80 @@
+from agents import MasterAgent
+from logistics import InventoryStore
+from config import FAULT_PARTS
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sqlite3
+import tempfile
+
+KIT = FAULT_PARTS["Rod Knock"]
+HUB = "Regional Hub - Chennai"
+
+def reserved(db, part=KIT, warehouse=HUB):
+    conn = sqlite3.connect(db)
+    try:
+        return conn.execute("SELECT on_hand, reserved FROM inventory_stock WHERE part = ? AND warehouse = ?", (part, warehouse)).fetchone()
+    finally:
+        conn.close()
+
+def test_repeat_diagnoses(tmp):
+    db = os.path.join(tmp, "repeat.db")
+    agent = MasterAgent(db, os.path.join(tmp, "archive"))
+
+    print("Test 1: Repeat Diagnoses Hold One Unit")
+    for _ in range(6):
+        res = agent.execute_workflow("VIN-10002", "Rod Knock", {}, None)
+    print(res.inventory, reserved(db))
+    assert reserved(db) == (40, 1)
+    assert InventoryStore(db).reservation_for("VIN-10002")["reservation_id"] == res.inventory["reservation_id"]
+
+    print("\nTest 2: Healthy Rerun Releases The Hold")
+    agent.execute_workflow("VIN-10002", "Normal", {}, None)
+    assert reserved(db) == (40, 0)
+
+    print("\nTest 3: OTA Path Releases The Hold")
+    res = agent.execute_workflow("VIN-10003", "Normal", {"Misfire": True}, None)
+    print(res.final_rca.get("manufacturing_action"), res.inventory)
+    assert res.final_rca.get("ota_eligible") and res.inventory["reservation_id"] is None
+    assert reserved(db, FAULT_PARTS["Misfire"], "Local Dealer") == (25, 0)
+
+    print("\nTest 4: Completed Job Becomes A Sale")
+    agent.execute_workflow("VIN-10004", "Rod Knock", {}, None)
+    assert agent.complete_service("VIN-10004")
+    assert not agent.complete_service("VIN-10004")
+    assert reserved(db) == (39, 0)
+    print(reserved(db))
+
+def test_release_ids(tmp):
+    store = InventoryStore(os.path.join(tmp, "ids.db"))
+
+    print("\nTest 5: Unknown / Double Release Refused")
+    rsv = store.reserve(KIT)
+    assert not store.release("RSV-MADEUP")
+    assert store.release(rsv["reservation_id"])
+    assert not store.release(rsv["reservation_id"])
+    assert not store.fulfil(rsv["reservation_id"])
+    assert store.available(KIT, HUB) == 40
+    print("ok")
+
+def test_shared_database(tmp):
+    db = os.path.join(tmp, "shared.db")
+    stores = [InventoryStore(db) for _ in range(4)]
+    part, shop = FAULT_PARTS["Mount Failure"], "Regional Hub - Chennai"
+
+    print("\nTest 6: Stores Sharing One Database Cannot Oversell")
+    with ThreadPoolExecutor(8) as pool:
+        out = list(pool.map(lambda i: stores[i % 4].reserve(part, ref=f"VIN-{i}"), range(100)))
+    got = [r for r in out if r]
+    on_hand = sum(reserved(db, part, w)[0] for w in ("Regional Hub - Chennai", "Central Warehouse - Pune"))
+    held = sum(reserved(db, part, w)[1] for w in ("Regional Hub - Chennai", "Central Warehouse - Pune"))
+    print(f"{len(got)} reservations for {on_hand} units; reserved column {held}; {shop} {reserved(db, part, shop)}")
+    assert len(got) == held == 68 and reserved(db, part, shop) == (8, 8)
+    for r in got[:10]:
+        assert stores[3].release(r["reservation_id"])
+    assert sum(reserved(db, part, w)[1] for w in ("Regional Hub - Chennai", "Central Warehouse - Pune")) == 58
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        test_repeat_diagnoses(tmp)
+        test_release_ids(tmp)
+        test_shared_database(tmp)
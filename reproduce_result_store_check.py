@@ -0,0 +1,88 @@
+from agents import MasterAgent
+from core import ResultStore
+from dataclasses import replace
+import gc
+import os
+import tempfile
+import tracemalloc
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def sample_result(tmp):
+    agent = MasterAgent(os.path.join(tmp, "store.db"), os.path.join(tmp, "archive"))
+    return agent.execute_workflow("VIN-10002", "Rod Knock", {}, None)
+
+def run(res, vin, n):
+    """Copy of `res` for `vin`; `n` marks the run so order can be checked."""
+    return replace(res, vehicle_id=vin, data_upload_size_kb=float(n))
+
+def traced():
+    """Bytes currently allocated since tracemalloc.start()."""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def test_lru_and_cap(res):
+    entry = ResultStore._entry(res, 0.0)["bytes"]
+    store = ResultStore(per_vin=3, budget_bytes=entry * 4.5, clock=Clock())
+
+    print("Test 1: Per-VIN Cap Keeps The Newest Runs")
+    for n in range(8):
+        store.put(run(res, "VIN-A", n))
+    marks = [r.data_upload_size_kb for r in store.history("VIN-A")]
+    print(marks)
+    assert marks == [7.0, 6.0, 5.0]
+
+    print("\nTest 2: Least Recently Used Vehicle Is Evicted First")
+    store.put(run(res, "VIN-B", 0))
+    store.history("VIN-A")  # A is now more recent than B
+    store.put(run(res, "VIN-C", 0))
+    print({v: len(store.history(v)) for v in ("VIN-A", "VIN-B", "VIN-C")}, store.stats()["evicted"])
+    assert store.history("VIN-B") == [] and len(store.history("VIN-A")) == 3
+
+def test_ttl(res):
+    clock = Clock()
+    store = ResultStore(per_vin=5, budget_bytes=2**30, waveform_ttl_s=900.0, clock=clock)
+
+    print("\nTest 3: Waveforms Expire After The TTL")
+    base = traced()
+    for i in range(200):
+        store.put(run(res, f"VIN-{i}", 0))
+    full, before = store.stats()["bytes"], traced() - base
+    clock.now = 901.0
+    stats = store.stats()
+    after = traced() - base
+    print(f"counted {full:,} -> {stats['bytes']:,} bytes; held {before:,} -> {after:,} bytes; "
+          f"expired {stats['waveforms_expired']}")
+    assert stats["with_waveform"] == 0 and not store._by_age
+    assert store.history("VIN-0")[0].telemetry.raw_waveform == []
+    assert before - after > (full - stats["bytes"]) / 2
+
+def test_budget(res, budget=200_000, puts=3000):
+    store = ResultStore(per_vin=5, budget_bytes=budget, clock=Clock())
+
+    print("\nTest 4: Byte Budget Bounds Memory Actually Held")
+    base = traced()
+    store.put(run(res, "VIN-PINNED", 0))
+    for i in range(puts):
+        store.put(run(res, f"VIN-{i}", i))
+        store.history("VIN-PINNED")  # oldest entry stays most recently used
+    size = traced() - base
+    stats = store.stats()
+    print(f"{puts} puts: counted {stats['bytes']:,} / {budget:,} bytes; held {size:,} bytes; "
+          f"age queue {len(store._by_age)}; results {stats['results']}")
+    assert stats["bytes"] <= budget and store.history("VIN-PINNED")
+    assert len(store._by_age) <= 2 * stats["results"] + 1
+    assert size < 4 * budget
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        res = sample_result(tmp)
+    tracemalloc.start()
+    test_lru_and_cap(res)
+    test_ttl(res)
+    test_budget(res)
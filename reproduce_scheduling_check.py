@@ -0,0 +1,75 @@
+from agents import MasterAgent
+from logistics import SlotAllocator
+from config import WORKSHOPS
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import tempfile
+
+NOW = datetime.datetime(2026, 1, 5, 7, 0)
+SHOPS = [w["name"] for w in WORKSHOPS]
+
+def booked(agent):
+    return sum(len(cal.bookings) for cal in agent.sched.allocator.calendars.values())
+
+def test_repeat_diagnoses(tmp):
+    agent = MasterAgent(os.path.join(tmp, "sched.db"), os.path.join(tmp, "archive"))
+
+    print("Test 1: Repeat Diagnoses Hold One Bay")
+    ids = {agent.execute_workflow("VIN-10002", "Rod Knock", {}, None).scheduling["service_id"] for _ in range(5)}
+    print(ids, booked(agent))
+    assert len(ids) == 1 and booked(agent) == 1
+
+    print("\nTest 2: Normal / OTA Runs Release The Bay")
+    agent.execute_workflow("VIN-10002", "Normal", {}, None)
+    assert booked(agent) == 0 and agent.sched.allocator.booking_for("VIN-10002") is None
+    agent.execute_workflow("VIN-10003", "Rod Knock", {}, None)
+    res = agent.execute_workflow("VIN-10003", "Normal", {"Misfire": True}, None)
+    print(res.final_rca.get("manufacturing_action"), booked(agent))
+    assert res.final_rca.get("ota_eligible") and booked(agent) == 0
+
+    print("\nTest 3: Blocked Job Releases The Bay")
+    check = agent.comp.check
+    agent.comp.check = lambda d, f, s: dict(check(d, f, s), status="BLOCKED")
+    res = agent.execute_workflow("VIN-10004", "Rod Knock", {}, None)
+    agent.comp.check = check
+    print(res.scheduling["status"], booked(agent))
+    assert res.scheduling["status"] == "RELEASED" and booked(agent) == 0
+
+    print("\nTest 4: Completed Job Frees The Bay")
+    agent.execute_workflow("VIN-10005", "Rod Knock", {}, None)
+    assert agent.complete_service("VIN-10005") and booked(agent) == 0
+    print("ok")
+
+def test_rebook():
+    clock = [NOW]
+    alloc = SlotAllocator(WORKSHOPS, now_fn=lambda: clock[0])
+
+    print("\nTest 5: Stale Or Moved Bookings Are Replaced")
+    first = alloc.allocate(SHOPS[:2], ref="VIN-1")
+    moved = alloc.allocate(SHOPS[2:], ref="VIN-1")
+    clock[0] += datetime.timedelta(days=2)
+    later = alloc.allocate(SHOPS[2:], ref="VIN-1")
+    print(first["workshop"], "->", moved["workshop"], "->", later["slot"])
+    assert moved["service_id"] != first["service_id"] and not alloc.release(first["service_id"])
+    assert later["service_id"] != moved["service_id"] and not later["reused"]
+    assert sum(len(c.bookings) for c in alloc.calendars.values()) == 1
+
+def test_concurrent_refs():
+    alloc = SlotAllocator(WORKSHOPS, now_fn=lambda: NOW)
+
+    print("\nTest 6: Concurrent Repeats Book Once Per VIN")
+    with ThreadPoolExecutor(8) as pool:
+        out = list(pool.map(lambda i: alloc.allocate(SHOPS, ref=f"VIN-{i % 50}"), range(500)))
+    per_vin = {}
+    for i, b in enumerate(out):
+        per_vin.setdefault(i % 50, set()).add(b["service_id"])
+    total = sum(len(c.bookings) for c in alloc.calendars.values())
+    print(f"{len(out)} requests from 50 VINs -> {total} bookings")
+    assert total == 50 and all(len(ids) == 1 for ids in per_vin.values())
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        test_repeat_diagnoses(tmp)
+    test_rebook()
+    test_concurrent_refs()
@@ -1,5 +1,7 @@
 from agents import ComplianceAgent
 import datetime
+import random
+import numpy as np
 
 def test_compliance_agent():
     agent = ComplianceAgent()
@@ -80,5 +82,35 @@ def test_compliance_agent():
     print(res)
     assert res['status'] == "COMPLIANT"
 
+def test_compliance_batch_parity():
+    agent = ComplianceAgent()
+    rng = random.Random(7)
+
+    print("\nTest 7: Batch vs Scalar Parity")
+    rows = []
+    for _ in range(5000):
+        hour = rng.choice([0, 3, 8, 9, 12, 18, 19, 20, 23])
+        rows.append((
+            rng.choice(["Critical", "Medium", "Low", None]),
+            rng.choice([None, 0, 5000, 20000, 20001, 25000, 14000]),
+            rng.choice([None, "", "not-a-slot", f"2023-11-{rng.randint(1, 30):02d} {hour:02d}:{rng.choice([0, 30, 59]):02d}"])
+        ))
+
+    res = agent.check_batch(
+        severity=[sev for sev, _, _ in rows],
+        estimate=[np.nan if est is None else est for _, est, _ in rows],
+        slot=ComplianceAgent.parse_slots([slot for _, _, slot in rows])
+    )
+    for i, (sev, est, slot) in enumerate(rows):
+        scalar = agent.check(
+            diagnosis={"severity": sev},
+            financial=None if est is None else {"total_estimate_inr": est},
+            scheduling={"slot": slot}
+        )
+        assert res["status"][i] == scalar["status"], (rows[i], res["status"][i], scalar)
+        assert ComplianceAgent.alerts_from_codes(res["alert_codes"][i]) == scalar["ue_alerts"], (rows[i], scalar)
+    print(f"{len(rows)} rows match")
+
 if __name__ == "__main__":
     test_compliance_agent()
+    test_compliance_batch_parity()
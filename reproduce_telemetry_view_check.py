@@ -0,0 +1,59 @@
+from agents import TelematicsAgent
+from core import DIAGNOSIS_FIELDS, to_json
+from dataclasses import asdict
+import json
+import time
+
+HIDDEN = ["raw_waveform", "_secure_lat", "_secure_lon"]
+
+def legacy_inputs(t, extra):
+    out = {k: v for k, v in asdict(t).items() if k not in HIDDEN}
+    out.update(extra)
+    return out
+
+def test_view_parity():
+    tele = TelematicsAgent()
+    extra = {"burst_rate_hz": 10.0, "burst_prominence": 312.5, "rms": -1.0}
+
+    print("Test 1: View vs asdict() Parity")
+    for scenario, toggles in [("Normal", {}), ("Rod Knock", {}), ("Normal", {"Misfire": True, "Loose Mount": True})]:
+        t = tele.read_sensors("VIN-10002", scenario, toggles)
+        view = t.diagnosis_view(extra)
+        legacy = legacy_inputs(t, extra)
+        assert dict(view) == legacy, (dict(view), legacy)
+        assert len(view) == len(legacy) and all(k in view for k in legacy)
+        assert not any(k in view for k in HIDDEN)
+        assert view["can_codes"] is t.can_codes  # shared, not copied
+        assert json.loads(to_json(view)) == json.loads(json.dumps(legacy))
+    print(f"{len(DIAGNOSIS_FIELDS)} fields + extras match")
+
+def test_view_overhead():
+    tele = TelematicsAgent()
+    frames = [tele.read_sensors(f"VIN-{10000 + i}", "Rod Knock" if i % 5 == 0 else "Normal", {}) for i in range(2000)]
+    extra = {"burst_rate_hz": 10.0, "burst_prominence": 312.5, "modulation": 1.7, "band_rms": 0.77}
+    rounds = 5
+
+    print("\nTest 2: Per-Vehicle Input + Prompt Overhead")
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in frames:
+            json.dumps(legacy_inputs(t, extra))
+    legacy = (time.perf_counter() - start) / (rounds * len(frames)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in frames:
+            to_json(t.diagnosis_view(extra))
+    view = (time.perf_counter() - start) / (rounds * len(frames)) * 1e6
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in frames:
+            t.diagnosis_view(extra)
+    build = (time.perf_counter() - start) / (rounds * len(frames)) * 1e6
+    print(f"asdict + json.dumps: {legacy:.1f} us/vehicle; view + to_json: {view:.1f} us/vehicle "
+          f"({legacy / view:.0f}x); view alone: {build:.2f} us")
+
+if __name__ == "__main__":
+    test_view_parity()
+    test_view_overhead()
@@ -0,0 +1,98 @@
+from streaming import UEBAStreamDetector, WindowedCountMin
+from config import UEBA_WINDOW_MIN, UEBA_VIN_REPEAT, UEBA_VELOCITY_MIN, UEBA_HIGH_VALUE_REPEAT
+import random
+import numpy as np
+
+WINDOW_S = UEBA_WINDOW_MIN * 60
+T0 = 1_700_000_000.0
+
+def test_rebooked_vin():
+    ueba = UEBAStreamDetector()
+
+    print("Test 1: Re-Diagnosed VIN Keeping Its Booking Is Not Flagged")
+    alerts = [ueba.observe("VIN-1", "Hub-A", "SRV-1", 14000, T0 + i) for i in range(10)]
+    print(alerts[-1])
+    assert not any(alerts)
+
+    print("\nTest 2: Distinct Bookings Per VIN Are")
+    alerts = [ueba.observe("VIN-2", "Hub-A", f"SRV-{10 + i}", 14000, T0 + i) for i in range(UEBA_VIN_REPEAT)]
+    print(alerts[-1])
+    assert not any(alerts[:-1]) and any("Repeated Bookings for VIN-2" in a for a in alerts[-1])
+
+def test_duplicate_id():
+    ueba = UEBAStreamDetector()
+
+    print("\nTest 3: One Service ID On Two VINs")
+    assert not ueba.observe("VIN-1", "Hub-A", "SRV-7", 0, T0)
+    assert not ueba.observe("VIN-1", "Hub-A", "SRV-7", 0, T0 + 1)
+    alerts = ueba.observe("VIN-2", "Hub-A", "SRV-7", 0, T0 + 2)
+    print(alerts)
+    assert alerts == ["UEBA: Duplicate Service ID SRV-7"]
+
+def test_velocity():
+    ueba = UEBAStreamDetector()
+
+    print("\nTest 4: Velocity Spike After A Quiet Window")
+    for i in range(9):
+        ueba.observe(f"VIN-{i}", "Hub-A", f"SRV-{i}", 0, T0 + i * 60)
+    burst = [ueba.observe(f"VIN-B{i}", "Hub-A", f"SRV-B{i}", 0, T0 + 600 + i) for i in range(UEBA_VELOCITY_MIN)]
+    print(burst[-1])
+    assert not any(burst[:-1]) and "UEBA: Booking Velocity Spike at Hub-A" in burst[-1]
+
+def test_high_value():
+    ueba = UEBAStreamDetector()
+
+    print("\nTest 5: High-Value Window Per VIN And Per Workshop")
+    assert not ueba.observe("VIN-1", None, None, 25000, T0)
+    assert ueba.observe("VIN-1", None, None, 25000, T0 + 1) == ["UEBA: Repeated High-Value Estimates"]
+    out = [ueba.observe(f"VIN-H{i}", "Hub-H", f"SRV-H{i}", 25000, T0 + i) for i in range(UEBA_HIGH_VALUE_REPEAT)]
+    print(out[-1])
+    assert not any(out[:-1]) and out[-1] == ["UEBA: Repeated High-Value Estimates"]
+    assert not ueba.observe("VIN-1", None, None, 25000, T0 + WINDOW_S + 1)  # first one has left the window
+
+def test_expiry():
+    sketch = WindowedCountMin(WINDOW_S)
+
+    print("\nTest 6: Expired Buckets Are Evicted")
+    for i in range(10):
+        sketch.add("k", T0 + i * 60)
+    counts = [sketch.estimate("k")]
+    sketch.add("other", T0 + 10 * 60)
+    counts.append(sketch.estimate("k"))
+    sketch.add("other", T0 + 25 * 60)
+    counts.append(sketch.estimate("k"))
+    print(counts, int(sketch.tables.sum()))
+    assert counts == [10, 9, 0] and int(sketch.tables.sum()) == len(sketch.rows)  # one event left, depth cells
+    assert sketch.add("k", T0) == 0  # too old to count
+
+    ueba = UEBAStreamDetector()
+    for i in range(UEBA_VIN_REPEAT - 1):
+        ueba.observe("VIN-1", "Hub-A", f"SRV-{i}", 0, T0 + i)
+    assert not ueba.observe("VIN-1", "Hub-A", "SRV-9", 0, T0 + WINDOW_S + 60)
+    assert not ueba.observe("VIN-1", "Hub-A", "SRV-0", 0, T0 + WINDOW_S + 61)  # old pair expired too: counts as new
+    print("ok")
+
+def test_batch_parity():
+    rng = random.Random(11)
+    events, ts = [], T0
+    for _ in range(3000):
+        ts += rng.expovariate(1 / 2.0)
+        vin = f"VIN-{rng.randint(0, 40)}"
+        sid = rng.choice([None, f"SRV-{rng.randint(0, 60)}", f"SRV-{vin}"])
+        events.append((vin, rng.choice(["Hub-A", "Hub-B", None]) if sid else None, sid, rng.choice([0, 14000, 25000]), ts))
+
+    print("\nTest 7: Batch vs Scalar Parity")
+    scalar, bulk = UEBAStreamDetector(), UEBAStreamDetector()
+    alerts = [scalar.observe(*e) for e in events]
+    codes = np.concatenate([bulk.observe_batch(*map(list, zip(*events[i:i + 1]))) for i in range(len(events))])
+    flagged = sum(bool(a) for a in alerts)
+    print(f"{len(events)} events, {flagged} flagged")
+    assert flagged and all(bool(a) == bool(c) for a, c in zip(alerts, codes))
+
+if __name__ == "__main__":
+    test_rebooked_vin()
+    test_duplicate_id()
+    test_velocity()
+    test_high_value()
+    test_expiry()
+    test_batch_parity()
@@ -0,0 +1,606 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from config import (
+    UEBA_WINDOW_MIN, UEBA_BUCKETS, UEBA_SKETCH_WIDTH, UEBA_SKETCH_DEPTH,
+    UEBA_WORKSHOP_BURST, UEBA_VIN_REPEAT, UEBA_HIGH_VALUE_REPEAT,
+    UEBA_VELOCITY_FACTOR, UEBA_VELOCITY_MIN,
+    DRIVER_EWMA_HALFLIFE_S, DRIVER_TRIP_GAP_S, DRIVER_STREAM_CAPACITY,
+    BATTERY_RLS_FORGETTING, BATTERY_STREAM_CAPACITY, BATTERY_RLS_P_MAX, BATTERY_NOMINAL_V, BATTERY_EOL_V,
+    BATTERY_R_NEW_V, BATTERY_R_EOL_V, BATTERY_CHARGE_ON_V, BATTERY_CHARGE_OFF_V,
+    ANOMALY_RPM_BAND, ANOMALY_MIN_SAMPLES, ANOMALY_MAX_WEIGHT, ANOMALY_RIDGE, ANOMALY_THRESHOLD
+)
+
+# --- SLIDING-WINDOW SKETCHES ---
+
+class WindowedCountMin:
+    """
+    Count-min sketch over a sliding time window.
+    The window is a ring of `n_buckets` sketches; advancing time zeroes the expired bucket, so
+    memory is fixed (n_buckets x depth x width counters) and each event costs O(depth).
+    Estimates never undercount; collisions can only overcount.
+    """
+    def __init__(self, window_s, n_buckets=UEBA_BUCKETS, width=UEBA_SKETCH_WIDTH, depth=UEBA_SKETCH_DEPTH):
+        self.bucket_s = window_s / n_buckets
+        self.n_buckets = n_buckets
+        self.width = width
+        self.rows = np.arange(depth)
+        self.tables = np.zeros((n_buckets, depth, width), dtype=np.int32)
+        self.head = None  # absolute bucket number of the newest bucket
+
+    def _cells(self, key):
+        return self._cells_many([key])[0]
+
+    def _cells_many(self, keys):
+        """(len(keys), depth) counter columns via double hashing of Python's hash()."""
+        h = np.fromiter((hash(k) for k in keys), dtype=np.int64, count=len(keys)).view(np.uint64)
+        h1, h2 = h & np.uint64(0xFFFFFFFF), (h >> np.uint64(32)) | np.uint64(1)
+        return ((h1[:, None] + self.rows.astype(np.uint64)[None, :] * h2[:, None]) % np.uint64(self.width)).astype(np.int64)
+
+    def _advance(self, ts):
+        bucket = int(ts // self.bucket_s)
+        if self.head is None:
+            self.head = bucket
+        elif bucket > self.head:
+            for b in range(self.head + 1, min(bucket, self.head + self.n_buckets) + 1):
+                self.tables[b % self.n_buckets] = 0
+            self.head = bucket
+        return bucket
+
+    def add(self, key, ts, count=1) -> int:
+        """Counts one event; returns the key's window estimate including it (0 if too old to count)."""
+        bucket = self._advance(ts)
+        if bucket <= self.head - self.n_buckets:
+            return 0
+        cells = self._cells(key)
+        self.tables[bucket % self.n_buckets, self.rows, cells] += count
+        return self.estimate(key)
+
+    def add_many(self, keys, ts):
+        """
+        Bulk path: counts a batch of events (timestamps non-decreasing).
+        Returns (window estimate, newest-bucket count) per event, evaluated at the end of
+        the event's bucket segment, so a burst inside one batch is flagged for every member.
+        """
+        ts = np.asarray(ts, dtype=np.float64)
+        cells = self._cells_many(keys)
+        window = np.zeros(len(ts), dtype=np.int64)
+        newest = np.zeros(len(ts), dtype=np.int64)
+        buckets = (ts // self.bucket_s).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for seg in np.split(np.arange(len(ts)), bounds):
+            if seg.size == 0:
+                continue
+            bucket = self._advance(ts[seg[0]])
+            if bucket <= self.head - self.n_buckets:
+                continue
+            np.add.at(self.tables[bucket % self.n_buckets], (np.broadcast_to(self.rows, cells[seg].shape), cells[seg]), 1)
+            counts = self.tables[:, self.rows[None, :], cells[seg]]  # (n_buckets, m, depth)
+            window[seg] = counts.sum(axis=0).min(axis=1)
+            newest[seg] = counts[self.head % self.n_buckets].min(axis=1)
+        return window, newest
+
+    def add_first(self, keys, ts) -> np.ndarray:
+        """
+        Counts a time-ordered batch of events; True where the key had no event in the window
+        before (its first sighting, counting earlier events of the same batch).
+        """
+        ts = np.asarray(ts, dtype=np.float64)
+        cells = self._cells_many(keys)
+        first = ~pd.Index(keys).duplicated()
+        buckets = (ts // self.bucket_s).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(buckets)) + 1
+        for seg in np.split(np.arange(len(ts)), bounds):
+            if seg.size == 0:
+                continue
+            bucket = self._advance(ts[seg[0]])
+            if bucket <= self.head - self.n_buckets:
+                first[seg] = False
+                continue
+            first[seg] &= self.tables[:, self.rows[None, :], cells[seg]].sum(axis=0).min(axis=1) == 0
+            np.add.at(self.tables[bucket % self.n_buckets], (np.broadcast_to(self.rows, cells[seg].shape), cells[seg]), 1)
+        return first
+
+    def estimate(self, key) -> int:
+        """Events for `key` across the whole window."""
+        if self.head is None:
+            return 0
+        return int(self.tables[:, self.rows, self._cells(key)].sum(axis=0).min())
+
+    def newest(self, key) -> int:
+        """Events for `key` in the newest bucket only."""
+        if self.head is None:
+            return 0
+        return int(self.tables[self.head % self.n_buckets, self.rows, self._cells(key)].min())
+
+
+# --- STREAMING UEBA ---
+
+class UEBAStreamDetector:
+    """
+    Sliding-window UEBA over the booking/estimate event stream.
+    Keeps windowed count-min sketches per workshop, VIN and service ID and flags bursts,
+    repeated bookings (distinct service IDs per VIN), duplicate service IDs (one ID on
+    several VINs), repeated high-value estimates and velocity spikes (newest bucket far above
+    the window's per-bucket average). Memory is constant regardless of how many VINs or
+    workshops appear, and no history is re-queried.
+    A (VIN, service ID) pair already seen in the window is the same booking reported again
+    (a re-diagnosed vehicle keeps its booking), so it is not counted or alerted twice.
+    """
+    # Alert bit codes for the bulk path
+    ALERT_BURST = 1
+    ALERT_VELOCITY = 2
+    ALERT_VIN_REPEAT = 4
+    ALERT_DUPLICATE_SERVICE = 8
+    ALERT_HIGH_VALUE_REPEAT = 16
+
+    def __init__(self, window_min=UEBA_WINDOW_MIN, high_value_inr=20000):
+        window_s = window_min * 60
+        self.high_value_inr = high_value_inr
+        self.bookings_by_workshop = WindowedCountMin(window_s)
+        self.bookings_by_vin = WindowedCountMin(window_s)
+        self.bookings_by_service = WindowedCountMin(window_s)
+        self.booking_pairs = WindowedCountMin(window_s)  # (vin, service_id) sightings
+        self.high_value_by_workshop = WindowedCountMin(window_s)
+        self.high_value_by_vin = WindowedCountMin(window_s)
+        self._lock = threading.Lock()
+
+    def observe(self, vin, workshop=None, service_id=None, estimate_inr=0, ts: Optional[float] = None) -> List[str]:
+        """Feeds one event; returns the alerts it triggers (empty list if none)."""
+        ts = time.time() if ts is None else ts
+        alerts = []
+        with self._lock:
+            if service_id and self.booking_pairs.add((vin, service_id), ts) != 1:
+                return alerts
+            if workshop:
+                at_workshop = self.bookings_by_workshop.add(workshop, ts)
+                if at_workshop >= UEBA_WORKSHOP_BURST:
+                    alerts.append(f"UEBA: Booking Burst at {workshop} ({at_workshop} in {UEBA_WINDOW_MIN} min)")
+
+                newest = self.bookings_by_workshop.newest(workshop)
+                per_bucket = (at_workshop - newest) / max(1, UEBA_BUCKETS - 1)
+                if newest >= UEBA_VELOCITY_MIN and newest > UEBA_VELOCITY_FACTOR * max(per_bucket, 1.0):
+                    alerts.append(f"UEBA: Booking Velocity Spike at {workshop}")
+
+                for_vin = self.bookings_by_vin.add(vin, ts)
+                if for_vin >= UEBA_VIN_REPEAT:
+                    alerts.append(f"UEBA: Repeated Bookings for {vin} ({for_vin} in {UEBA_WINDOW_MIN} min)")
+
+            if service_id and self.bookings_by_service.add(service_id, ts) > 1:
+                alerts.append(f"UEBA: Duplicate Service ID {service_id}")
+
+            if estimate_inr and estimate_inr > self.high_value_inr:
+                hv_vin = self.high_value_by_vin.add(vin, ts)
+                hv_workshop = self.high_value_by_workshop.add(workshop, ts) if workshop else 0
+                if hv_vin > 1 or hv_workshop >= UEBA_HIGH_VALUE_REPEAT:
+                    alerts.append("UEBA: Repeated High-Value Estimates")
+        return alerts
+
+    def observe_batch(self, vins, workshops, service_ids, estimates_inr, ts):
+        """
+        Bulk path for a time-ordered batch of events (e.g. a whole fleet's bookings per tick).
+        `workshops` / `service_ids` entries may be None. Returns a uint8 alert bitmask per event.
+        """
+        vins = np.asarray(vins, dtype=object)
+        workshops = np.asarray(workshops, dtype=object)
+        service_ids = np.asarray(service_ids, dtype=object)
+        estimates = np.nan_to_num(np.asarray(estimates_inr, dtype=np.float64))
+        ts = np.asarray(ts, dtype=np.float64)
+        codes = np.zeros(len(ts), dtype=np.uint8)
+
+        with self._lock:
+            fresh = np.ones(len(ts), dtype=bool)
+            with_id = np.flatnonzero(pd.notna(service_ids))
+            if with_id.size:
+                pairs = np.empty(with_id.size, dtype=object)
+                pairs[:] = list(zip(vins[with_id], service_ids[with_id]))
+                fresh[with_id] = self.booking_pairs.add_first(pairs, ts[with_id])
+
+            booked = np.flatnonzero(pd.notna(workshops) & fresh)
+            if booked.size:
+                at_workshop, newest = self.bookings_by_workshop.add_many(workshops[booked], ts[booked])
+                per_bucket = (at_workshop - newest) / max(1, UEBA_BUCKETS - 1)
+                codes[booked] |= (at_workshop >= UEBA_WORKSHOP_BURST) * np.uint8(self.ALERT_BURST)
+                codes[booked] |= ((newest >= UEBA_VELOCITY_MIN) & (newest > UEBA_VELOCITY_FACTOR * np.maximum(per_bucket, 1.0))) * np.uint8(self.ALERT_VELOCITY)
+                for_vin, _ = self.bookings_by_vin.add_many(vins[booked], ts[booked])
+                codes[booked] |= (for_vin >= UEBA_VIN_REPEAT) * np.uint8(self.ALERT_VIN_REPEAT)
+
+            with_id = with_id[fresh[with_id]]
+            if with_id.size:
+                seen, _ = self.bookings_by_service.add_many(service_ids[with_id], ts[with_id])
+                codes[with_id] |= (seen > 1) * np.uint8(self.ALERT_DUPLICATE_SERVICE)
+
+            high = np.flatnonzero((estimates > self.high_value_inr) & fresh)
+            if high.size:
+                hv_vin, _ = self.high_value_by_vin.add_many(vins[high], ts[high])
+                hv_workshop = np.zeros(high.size, dtype=np.int64)
+                at = pd.notna(workshops[high])
+                if at.any():
+                    hv_workshop[at], _ = self.high_value_by_workshop.add_many(workshops[high][at], ts[high][at])
+                codes[high] |= ((hv_vin > 1) | (hv_workshop >= UEBA_HIGH_VALUE_REPEAT)) * np.uint8(self.ALERT_HIGH_VALUE_REPEAT)
+        return codes
+
+
+# --- PER-VIN STATE ---
+
+class VinStateTable(ABC):
+    """
+    Base for compact per-VIN online state: each VIN owns one row of the preallocated arrays
+    named in STATE. Rows are assigned on first sight and the arrays grow by doubling.
+    Subclasses implement `_alloc(capacity)` to create every array in STATE.
+    """
+    STATE = ()
+
+    def __init__(self, capacity):
+        self.slots: Dict[str, int] = {}
+        self._vin_index = None  # pd.Index over slots, rebuilt lazily for bulk lookups
+        self._lock = threading.Lock()
+        self._alloc(capacity)
+
+    @abstractmethod
+    def _alloc(self, capacity):
+        """Creates every array named in STATE with `capacity` rows."""
+
+    def _grow(self, needed):
+        old = len(getattr(self, self.STATE[0]))
+        if needed <= old:
+            return
+        state = {k: getattr(self, k) for k in self.STATE}
+        self._alloc(max(needed, old * 2))
+        for k, arr in state.items():
+            getattr(self, k)[:old] = arr
+
+    def _add_vins(self, missing):
+        base = len(self.slots)
+        self._grow(base + len(missing))
+        self.slots.update(zip(missing, range(base, base + len(missing))))
+        self._vin_index = None
+
+    def _rows(self, vins):
+        if len(vins) < 4096:
+            missing = [v for v in dict.fromkeys(vins) if v not in self.slots]
+            if missing:
+                self._add_vins(missing)
+            return np.fromiter((self.slots[v] for v in vins), dtype=np.int64, count=len(vins))
+        # Fleet-sized batches: one hashed lookup instead of a million dict hits
+        vins = np.asarray(vins, dtype=object)
+        if self._vin_index is None:
+            self._vin_index = pd.Index(list(self.slots))
+        rows = self._vin_index.get_indexer(vins)
+        if (rows < 0).any():
+            self._add_vins(list(pd.unique(vins[rows < 0])))
+            self._vin_index = pd.Index(list(self.slots))
+            rows = self._vin_index.get_indexer(vins)
+        return rows.astype(np.int64)
+
+    @staticmethod
+    def _steps(rows):
+        """Splits a batch into vectorized steps with unique rows: the k-th frame of each VIN goes in step k."""
+        order = np.argsort(rows, kind="stable")
+        starts = np.r_[0, np.flatnonzero(np.diff(rows[order])) + 1]
+        rank = np.empty(len(rows), dtype=np.int64)
+        rank[order] = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+        for k in range(int(rank.max()) + 1 if rank.size else 0):
+            yield np.flatnonzero(rank == k)
+
+
+# --- STREAMING DRIVER SCORES ---
+
+class DriverScoreStream(VinStateTable):
+    """
+    Per-VIN streaming aggregates of the driver DNA metrics.
+    Each VIN owns one row of a few preallocated arrays: a time-aware EWMA of every metric
+    (half-life `halflife_s`), plus the running sum, peak and frame count of the current trip.
+    A gap longer than `trip_gap_s` closes the trip and folds its mean safety into the
+    lifetime trip history. Updates are O(1) per frame; state is ~60 bytes per driver.
+    """
+    METRICS = ["efficiency", "aggression", "stability", "braking", "safety"]
+    STATE = ("ewma", "trip_sum", "trip_peak", "trip_frames", "trip_speeding",
+             "trip_start", "last_ts", "trips", "trip_safety_mean")
+
+    def __init__(self, halflife_s=DRIVER_EWMA_HALFLIFE_S, trip_gap_s=DRIVER_TRIP_GAP_S, capacity=DRIVER_STREAM_CAPACITY):
+        self.tau = halflife_s / np.log(2)
+        self.trip_gap_s = trip_gap_s
+        super().__init__(capacity)
+
+    def _alloc(self, capacity):
+        m = len(self.METRICS)
+        self.ewma = np.zeros((capacity, m), dtype=np.float32)
+        self.trip_sum = np.zeros((capacity, m), dtype=np.float32)
+        self.trip_peak = np.zeros((capacity, m), dtype=np.float32)
+        self.trip_frames = np.zeros(capacity, dtype=np.int32)
+        self.trip_speeding = np.zeros(capacity, dtype=np.int32)
+        self.trip_start = np.zeros(capacity, dtype=np.float64)
+        self.last_ts = np.full(capacity, -np.inf, dtype=np.float64)
+        self.trips = np.zeros(capacity, dtype=np.int32)
+        self.trip_safety_mean = np.zeros(capacity, dtype=np.float32)  # mean over completed trips
+
+    def _apply(self, rows, ts, metrics, speeding):
+        """One vectorized step; `rows` must be unique."""
+        dt = ts - self.last_ts[rows]
+        fresh = ~np.isfinite(dt)
+        closed = ~fresh & (dt > self.trip_gap_s)
+
+        # Fold finished trips into the lifetime trip mean
+        done = rows[closed]
+        if done.size:
+            trip_mean = self.trip_sum[done, -1] / np.maximum(self.trip_frames[done], 1)
+            self.trips[done] += 1
+            self.trip_safety_mean[done] += (trip_mean - self.trip_safety_mean[done]) / self.trips[done]
+
+        restart = rows[fresh | closed]
+        self.trip_sum[restart] = 0
+        self.trip_peak[restart] = 0
+        self.trip_frames[restart] = 0
+        self.trip_speeding[restart] = 0
+        self.trip_start[restart] = ts[fresh | closed]
+
+        alpha = np.where(fresh, 1.0, 1.0 - np.exp(-np.clip(dt, 0.0, None) / self.tau)).astype(np.float32)
+        self.ewma[rows] += alpha[:, None] * (metrics - self.ewma[rows])
+        self.trip_sum[rows] += metrics
+        self.trip_peak[rows] = np.maximum(self.trip_peak[rows], metrics)
+        self.trip_frames[rows] += 1
+        self.trip_speeding[rows] += speeding
+        self.last_ts[rows] = ts
+
+    def update(self, vin, metrics, speeding=False, ts: Optional[float] = None):
+        """Feeds one frame. `metrics` is ordered like METRICS."""
+        ts = time.time() if ts is None else ts
+        self.update_batch([vin], [metrics], [speeding], [ts])
+
+    def update_batch(self, vins, metrics, speeding, ts):
+        """
+        Feeds a fleet's worth of frames at once. `metrics` is (N, len(METRICS)).
+        Frames of the same VIN are applied in input order, one vectorized step per repeat.
+        """
+        metrics = np.asarray(metrics, dtype=np.float32).reshape(-1, len(self.METRICS))
+        speeding = np.asarray(speeding, dtype=np.int32)
+        ts = np.asarray(ts, dtype=np.float64)
+        with self._lock:
+            rows = self._rows(vins)
+            for sel in self._steps(rows):
+                self._apply(rows[sel], ts[sel], metrics[sel], speeding[sel])
+
+    def score(self, vin) -> Optional[Dict]:
+        """Smoothed and trip-level view of one driver, or None if never seen."""
+        with self._lock:
+            row = self.slots.get(vin)
+            if row is None:
+                return None
+            frames = int(self.trip_frames[row])
+            trip_mean = self.trip_sum[row] / max(frames, 1)
+            return {
+                "ewma": {m: round(float(v), 1) for m, v in zip(self.METRICS, self.ewma[row])},
+                "trip": {m: round(float(v), 1) for m, v in zip(self.METRICS, trip_mean)},
+                "trip_peak_aggression": round(float(self.trip_peak[row, 1]), 1),
+                "trip_frames": frames,
+                "trip_duration_s": float(self.last_ts[row] - self.trip_start[row]),
+                "speeding_share": round(float(self.trip_speeding[row]) / max(frames, 1), 3),
+                "completed_trips": int(self.trips[row]),
+                "lifetime_trip_safety": round(float(self.trip_safety_mean[row]), 1) if self.trips[row] else None,
+            }
+
+    def fleet_scores(self):
+        """(vins, smoothed safety, current-trip mean safety) for every tracked driver."""
+        with self._lock:
+            n = len(self.slots)
+            trip_mean = self.trip_sum[:n, -1] / np.maximum(self.trip_frames[:n], 1)
+            return list(self.slots), self.ewma[:n, -1].copy(), trip_mean
+
+
+# --- BATTERY STATE OF HEALTH ---
+
+class BatterySOHEstimator(VinStateTable):
+    """
+    Online per-VIN battery state of health from the voltage / load / temperature history.
+    Recursive least squares with forgetting fits V = ocv + r * load + k * (temp - 25) / 50 for
+    every VIN (3 parameters + a 3x3 covariance, ~100 bytes). Fade is the worse of the no-load
+    voltage sagging towards BATTERY_EOL_V and the full-load drop (-r) growing towards
+    BATTERY_R_EOL_V; SOH = 100 - 20 * fade, so end of life reads 80%.
+    Charge events are counted on the terminal voltage with hysteresis.
+    """
+    STATE = ("theta", "P", "frames", "charging", "charge_events")
+    PRIOR = np.array([BATTERY_NOMINAL_V, -BATTERY_R_NEW_V, 0.0])
+    PRIOR_COV = np.diag([0.5, 0.1, 0.05])
+
+    def __init__(self, forgetting=BATTERY_RLS_FORGETTING, capacity=BATTERY_STREAM_CAPACITY):
+        self.lam = forgetting
+        super().__init__(capacity)
+
+    def _alloc(self, capacity):
+        self.theta = np.tile(self.PRIOR, (capacity, 1))
+        self.P = np.tile(self.PRIOR_COV, (capacity, 1, 1))
+        self.frames = np.zeros(capacity, dtype=np.int32)
+        self.charging = np.zeros(capacity, dtype=bool)
+        self.charge_events = np.zeros(capacity, dtype=np.int32)
+
+    def _apply(self, rows, volts, x):
+        """One RLS step for unique `rows`; x is (n, 3) regressors."""
+        P = self.P[rows]
+        Px = np.einsum("nij,nj->ni", P, x)
+        gain = Px / (self.lam + np.einsum("ni,ni->n", x, Px))[:, None]
+        err = volts - np.einsum("ni,ni->n", x, self.theta[rows])
+        self.theta[rows] += gain * err[:, None]
+        P = (P - gain[:, :, None] * Px[:, None, :]) / self.lam
+        trace = np.trace(P, axis1=1, axis2=2)
+        P *= np.minimum(1.0, BATTERY_RLS_P_MAX / np.maximum(trace, 1e-12))[:, None, None]
+        self.P[rows] = P
+
+        started = ~self.charging[rows] & (volts >= BATTERY_CHARGE_ON_V)
+        self.charge_events[rows] += started
+        self.charging[rows] = np.where(started, True, self.charging[rows] & (volts > BATTERY_CHARGE_OFF_V))
+        self.frames[rows] += 1
+
+    def _apply_one(self, row, volts, x):
+        """Single-frame RLS step in plain floats (NumPy call overhead dominates at n=1)."""
+        P = self.P[row].tolist()
+        theta = self.theta[row].tolist()
+        Px = [P[i][0] * x[0] + P[i][1] * x[1] + P[i][2] * x[2] for i in range(3)]
+        denom = self.lam + x[0] * Px[0] + x[1] * Px[1] + x[2] * Px[2]
+        gain = [p / denom for p in Px]
+        err = volts - (x[0] * theta[0] + x[1] * theta[1] + x[2] * theta[2])
+        self.theta[row] = [theta[i] + gain[i] * err for i in range(3)]
+        P = [[(P[i][j] - gain[i] * Px[j]) / self.lam for j in range(3)] for i in range(3)]
+        scale = min(1.0, BATTERY_RLS_P_MAX / max(P[0][0] + P[1][1] + P[2][2], 1e-12))
+        self.P[row] = [[p * scale for p in r] for r in P]
+
+        if not self.charging[row] and volts >= BATTERY_CHARGE_ON_V:
+            self.charge_events[row] += 1
+            self.charging[row] = True
+        elif volts <= BATTERY_CHARGE_OFF_V:
+            self.charging[row] = False
+        self.frames[row] += 1
+
+    @staticmethod
+    def _regressors(load, temp):
+        load, temp = np.broadcast_arrays(np.asarray(load, dtype=np.float64), np.asarray(temp, dtype=np.float64))
+        return np.column_stack([np.ones(load.size), load.ravel(), (temp.ravel() - 25.0) / 50.0])
+
+    def update(self, vin, volts, load, temp):
+        """Feeds one frame (`load` in 0..1). Returns the VIN's current estimate."""
+        with self._lock:
+            self._apply_one(self._rows([vin])[0], float(volts), (1.0, float(load), (float(temp) - 25.0) / 50.0))
+        return self.estimate(vin)
+
+    def update_batch(self, vins, volts, load, temp):
+        """Fleet batch update; frames of the same VIN are applied in input order. Returns each row's VIN SOH % after the batch."""
+        volts = np.asarray(volts, dtype=np.float64).ravel()
+        x = self._regressors(load, temp)
+        with self._lock:
+            rows = self._rows(vins)
+            for sel in self._steps(rows):
+                self._apply(rows[sel], volts[sel], x[sel])
+            return self.soh_from(self.theta[rows])
+
+    @staticmethod
+    def soh_from(theta):
+        """SOH % from (n, 3) fitted parameters."""
+        theta = np.atleast_2d(theta)
+        fade_v = (BATTERY_NOMINAL_V - theta[:, 0]) / (BATTERY_NOMINAL_V - BATTERY_EOL_V)
+        fade_r = (-theta[:, 1] - BATTERY_R_NEW_V) / (BATTERY_R_EOL_V - BATTERY_R_NEW_V)
+        fade = np.maximum(np.maximum(fade_v, fade_r), 0.0)
+        return np.clip(100.0 - 20.0 * fade, 0.0, 100.0)
+
+    def estimate(self, vin) -> Optional[Dict]:
+        with self._lock:
+            row = self.slots.get(vin)
+            if row is None:
+                return None
+            theta = self.theta[row]
+            return {
+                "soh_percentage": round(float(self.soh_from(theta)[0]), 1),
+                "ocv_v": round(float(theta[0]), 3),
+                "load_drop_v": round(float(-theta[1]), 3),
+                "charge_events": int(self.charge_events[row]),
+                "frames": int(self.frames[row]),
+            }
+
+    def fleet_soh(self):
+        """(vins, SOH %) for every tracked vehicle."""
+        with self._lock:
+            n = len(self.slots)
+            return list(self.slots), self.soh_from(self.theta[:n])
+
+
+# --- FLEET-RELATIVE ANOMALY SCORING ---
+
+class RunningMoments:
+    """
+    Streaming mean / covariance of d-dimensional vectors (Welford, with Chan's merge for
+    batches). Once `n` reaches `max_weight` it is held there, so older frames decay
+    geometrically and the statistics track slow drift like an EWMA. O(d^2) memory.
+    """
+    def __init__(self, dim, max_weight=ANOMALY_MAX_WEIGHT):
+        self.n = 0.0
+        self.mean = np.zeros(dim)
+        self.m2 = np.zeros((dim, dim))
+        self.max_weight = max_weight
+        self._inv = None
+
+    def add(self, X):
+        X = np.atleast_2d(X)
+        if not len(X):
+            return
+        nb = float(len(X))
+        mean_b = X.mean(axis=0)
+        dev = X - mean_b
+        delta = mean_b - self.mean
+        n = self.n + nb
+        self.mean = self.mean + delta * (nb / n)
+        self.m2 = self.m2 + dev.T @ dev + np.outer(delta, delta) * (self.n * nb / n)
+        self.n = n
+        if self.n > self.max_weight:
+            self.m2 *= self.max_weight / self.n
+            self.n = float(self.max_weight)
+        self._inv = None
+
+    def inverse_covariance(self):
+        if self._inv is None:
+            cov = self.m2 / max(self.n - 1, 1)
+            ridge = ANOMALY_RIDGE * max(np.trace(cov) / len(cov), 1e-9)
+            self._inv = np.linalg.inv(cov + ridge * np.eye(len(cov)))
+        return self._inv
+
+    def mahalanobis_sq(self, X):
+        """Squared Mahalanobis distance of each row of X, vectorized."""
+        d = np.atleast_2d(X) - self.mean
+        return np.einsum("ni,ij,nj->n", d, self.inverse_covariance(), d)
+
+
+class FleetAnomalyScorer:
+    """
+    Fleet-relative anomaly scores for per-frame feature vectors (dsp.extract_features).
+    Statistics are kept per (batch, RPM band) group plus one fleet-wide set; a group with
+    fewer than ANOMALY_MIN_SAMPLES frames is scored against the fleet-wide set, and nothing
+    is scored before that has warmed up. Frames are scored before they are learned, and only
+    frames the caller marks as healthy are learned, so faults never become the baseline.
+    """
+    def __init__(self, dim, threshold=ANOMALY_THRESHOLD, rpm_band=ANOMALY_RPM_BAND):
+        self.dim = dim
+        self.threshold = threshold
+        self.rpm_band = rpm_band
+        self.fleet = RunningMoments(dim)
+        self.groups: Dict[tuple, RunningMoments] = {}
+        self._lock = threading.Lock()
+
+    def _group_keys(self, batch_ids, rpms):
+        bands = (np.asarray(rpms, dtype=np.float64) // self.rpm_band).astype(np.int64)
+        keys = pd.MultiIndex.from_arrays([np.asarray(batch_ids, dtype=object), bands])
+        codes, uniq = pd.factorize(keys)
+        return codes, list(uniq)
+
+    def score_batch(self, batch_ids, rpms, X, learn=None):
+        """
+        Scores N frames; X is (N, dim). Rows where `learn` is True (default: rows under the
+        threshold) are folded into the statistics afterwards. Returns squared distances
+        (0 while still warming up).
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        scores = np.zeros(len(X))
+        codes, keys = self._group_keys(batch_ids, rpms)
+        with self._lock:
+            fleet_ready = self.fleet.n >= ANOMALY_MIN_SAMPLES
+            for g, key in enumerate(keys):
+                rows = np.flatnonzero(codes == g)
+                stats = self.groups.get(key)
+                if stats is not None and stats.n >= ANOMALY_MIN_SAMPLES:
+                    scores[rows] = stats.mahalanobis_sq(X[rows])
+                elif fleet_ready:
+                    scores[rows] = self.fleet.mahalanobis_sq(X[rows])
+
+            learn = scores < self.threshold if learn is None else np.asarray(learn, dtype=bool) & (scores < self.threshold)
+            for g, key in enumerate(keys):
+                rows = np.flatnonzero((codes == g) & learn)
+                if rows.size:
+                    self.groups.setdefault(key, RunningMoments(self.dim)).add(X[rows])
+            self.fleet.add(X[learn])
+        return scores
+
+    def score(self, batch_id, rpm, x, learn=True):
+        """Single frame: {"score", "anomalous", "warm"}."""
+        s = float(self.score_batch([batch_id], [rpm], [x], learn=[learn])[0])
+        return {"score": round(s, 2), "anomalous": s >= self.threshold, "warm": self.fleet.n >= ANOMALY_MIN_SAMPLES}
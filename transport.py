@@ -0,0 +1,226 @@
+"""
+Zero-copy waveform hand-off between processes.
+
+Producers write (N, SAMPLES) waveform blocks into a fixed pool of shared-memory segments and
+send workers a small WaveformBlock descriptor instead of the samples. Workers map the segment
+(once per process) and read the block as a NumPy view; the producer recycles the segment as
+soon as the worker's result comes back. Only descriptors, scalar columns and results are pickled.
+
+    with EdgeTransport(procs=4) as transport:
+        futures = [transport.submit(waveforms, columns) for waveforms, columns in batches]
+        results = [f.result() for f in futures]
+"""
+
+import logging
+import os
+import queue
+import sys
+import threading
+import uuid
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import Dict, Optional
+
+from config import SAMPLES, TRANSPORT_SEGMENT_FRAMES, TRANSPORT_POOL_SEGMENTS, TRANSPORT_ACQUIRE_TIMEOUT_S
+
+logger = logging.getLogger(__name__)
+
+# --- DESCRIPTORS ---
+
+@dataclass(frozen=True)
+class WaveformBlock:
+    """Where a block lives: segment name, shape and dtype. Cheap to pickle."""
+    segment: str
+    rows: int
+    samples: int
+    dtype: str = "float64"
+
+
+# --- PRODUCER SIDE ---
+
+class SegmentPool:
+    """
+    Fixed set of shared-memory segments owned by the producer process.
+    put() copies a block into a free segment and returns its descriptor; release() recycles it.
+    When every segment is out, put() blocks (back-pressure) up to `timeout` seconds. The pool
+    alone unlinks its segments, in close(), which also runs on garbage collection.
+    """
+    def __init__(self, segments=TRANSPORT_POOL_SEGMENTS, frames=TRANSPORT_SEGMENT_FRAMES,
+                 samples=SAMPLES, dtype="float64", timeout=TRANSPORT_ACQUIRE_TIMEOUT_S):
+        self.frames = frames
+        self.samples = samples
+        self.dtype = np.dtype(dtype)
+        self.timeout = timeout
+        size = frames * samples * self.dtype.itemsize
+        prefix = f"aurosys-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._segments = {}
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        for i in range(segments):
+            shm = shared_memory.SharedMemory(name=f"{prefix}-{i}", create=True, size=size)
+            self._segments[shm.name] = shm
+            self._free.put(shm.name)
+
+    def __len__(self):
+        return len(self._segments)
+
+    def available(self) -> int:
+        return self._free.qsize()
+
+    def put(self, waveforms) -> WaveformBlock:
+        """Copies (N, samples) waveforms into a free segment. N must fit one segment."""
+        block = np.atleast_2d(np.asarray(waveforms, dtype=self.dtype))
+        if block.shape[0] > self.frames or block.shape[1] != self.samples:
+            raise ValueError(f"Block {block.shape} does not fit a ({self.frames}, {self.samples}) segment")
+        try:
+            name = self._free.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free waveform segment within {self.timeout:.0f}s") from None
+        shm = self._segments[name]
+        np.ndarray(block.shape, dtype=self.dtype, buffer=shm.buf)[:] = block
+        return WaveformBlock(name, block.shape[0], self.samples, self.dtype.str)
+
+    def view(self, desc: WaveformBlock) -> np.ndarray:
+        """Producer-side view of a block that is still out (e.g. for in-process fallbacks)."""
+        return np.ndarray((desc.rows, desc.samples), dtype=desc.dtype, buffer=self._segments[desc.segment].buf)
+
+    def release(self, desc: WaveformBlock):
+        if desc.segment in self._segments:
+            self._free.put(desc.segment)
+
+    def close(self):
+        with self._lock:
+            segments, self._segments = self._segments, {}
+        for shm in segments.values():
+            try:
+                shm.close()
+                shm.unlink()
+            except (BufferError, FileNotFoundError) as e:
+                logger.error(f"Waveform segment {shm.name} cleanup error: {e}")
+
+    def __del__(self):
+        if getattr(self, "_segments", None):
+            self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- WORKER SIDE ---
+
+_attached: Dict[str, shared_memory.SharedMemory] = {}
+_attach_lock = threading.Lock()
+
+def _open_untracked(name):
+    """Maps an existing segment without registering it with this process's resource tracker."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args, **kwargs: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def attach(desc: WaveformBlock) -> np.ndarray:
+    """
+    Read-only NumPy view of a block. Segments are mapped once per process and kept mapped.
+    Attaching does not take ownership: the segment is never registered with the worker's
+    resource tracker, so a worker exiting cannot unlink memory the producer still uses.
+    """
+    with _attach_lock:
+        shm = _attached.get(desc.segment)
+        if shm is None:
+            shm = _attached[desc.segment] = _open_untracked(desc.segment)
+    view = np.ndarray((desc.rows, desc.samples), dtype=desc.dtype, buffer=shm.buf)
+    view.flags.writeable = False
+    return view
+
+
+_edge = {}
+
+def _edge_agents():
+    if not _edge:
+        from agents import DriverBehaviorAgent, GenAIAgent
+        _edge["driver"] = DriverBehaviorAgent()
+        _edge["diag"] = GenAIAgent("DiagnosisAgent", None, "")
+    return _edge["driver"], _edge["diag"]
+
+
+def edge_worker(desc: WaveformBlock, columns: Dict) -> Dict:
+    """
+    Edge stage for one block: vibration features, waveform RMS/peak, driver scores and the
+    heuristic diagnosis (fed the envelope burst signature). `columns` carries the scalar
+    TelemetryFrame fields per row (DriverBehaviorAgent.BATCH_COLUMNS minus rms, plus
+    can_codes). Results never alias the segment.
+    """
+    from dsp import extract_features, envelope_features
+
+    driver, diag = _edge_agents()
+    x = attach(desc)
+    rms = np.sqrt(np.einsum("ns,ns->n", x, x) / desc.samples)
+    peak = np.abs(x).max(axis=1)
+    features = extract_features(x)
+
+    scores = driver.analyze_batch(dict(columns, rms=rms))
+    codes = columns.get("can_codes")
+    codes = [[] for _ in range(desc.rows)] if codes is None else codes
+    bursts = envelope_features(x)
+    diagnosis = [
+        diag._heuristic({"rms": float(r), "can_codes": c, **{k: float(v[i]) for k, v in bursts.items()}})
+        for i, (r, c) in enumerate(zip(rms, codes))
+    ]
+    return {"rms": rms, "peak": peak, "features": features, "driver": scores, "diagnosis": diagnosis}
+
+
+# --- EXECUTOR ---
+
+class EdgeTransport:
+    """
+    Process pool fed through a SegmentPool. submit() blocks only while all segments are in
+    flight; each segment returns to the pool when its future completes, failed or not.
+    """
+    def __init__(self, procs=None, pool: Optional[SegmentPool] = None, worker=edge_worker):
+        self.pool = pool or SegmentPool()
+        self.worker = worker
+        self._executor = ProcessPoolExecutor(max_workers=procs or os.cpu_count() or 1, mp_context=get_context("spawn"))
+
+    def submit(self, waveforms, columns: Dict):
+        """Schedules `worker(desc, columns)` for one block of at most one segment's frames."""
+        waveforms = np.atleast_2d(waveforms)
+        if len(waveforms) > self.pool.frames:
+            raise ValueError(f"{len(waveforms)} frames exceed the {self.pool.frames}-frame segment; use map()")
+        desc = self.pool.put(waveforms)
+        try:
+            future = self._executor.submit(self.worker, desc, columns)
+        except Exception:
+            self.pool.release(desc)
+            raise
+        future.add_done_callback(lambda _: self.pool.release(desc))
+        return future
+
+    def map(self, waveforms, columns: Dict):
+        """Whole fleet batch: one task per segment-sized slice, results in row order."""
+        waveforms = np.atleast_2d(waveforms)
+        step = self.pool.frames
+        futures = [
+            self.submit(waveforms[i:i + step], {k: v[i:i + step] for k, v in columns.items()})
+            for i in range(0, len(waveforms), step)
+        ]
+        return [f.result() for f in futures]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -6,14 +6,60 @@ import datetime
 import os
 import textwrap
 
-from core import load_asset_as_base64, calculate_oem_strategy
+from core import ASSET_CACHE, ResultStore, calculate_oem_strategy
 from ui_lib import (
     get_main_styles, get_mobile_theme_styles,
     render_fleet_scatter, render_spectrogram, render_radar_chart, render_load_matrix, render_gauge,
     render_metric_card, render_decision_trace, render_impact_factors, render_strategic_decision_card
 )
 from agents import MasterAgent
-from config import FLEET_SIZE
+from dsp import envelope_features, envelope_spectrum, is_knock
+from config import (
+    FLEET_SIZE, MOBILE_FRAME_WIDTH, FLEET_POLL_INTERVAL_S, FLEET_PAGE_ROWS, FLEET_RECENT_CHANGES,
+    DSP_KNOCK_BAND_HZ, DSP_BURST_RATE_HZ
+)
+
+# --- CACHING ---
+# Shared across all sessions of this server process. Figures are keyed by the values they
+# plot (fleet figures by change-log cursor), so a new PipelineResult naturally invalidates them.
+# Figures go through cache_data, so every caller gets its own copy of the mutable Plotly object.
+
+@st.cache_resource
+def get_master_agent():
+    """Process-wide MasterAgent (one DatabaseManager init, one fleet snapshot)."""
+    agent = MasterAgent()
+    agent.get_fleet_snapshot()
+    return agent
+
+@st.cache_resource
+def get_result_store():
+    """Process-wide per-VIN run history (bounded; see ResultStore)."""
+    return ResultStore()
+
+@st.cache_data(max_entries=16)
+def cached_fleet_scatter(_fleet, fleet_id, cursor, ranges=None):
+    return render_fleet_scatter(_fleet.to_frame(), ranges)
+
+@st.cache_data(max_entries=16)
+def cached_fleet_ranges(_fleet, fleet_id, cursor):
+    """(min, max) of RMS / Peak / Frequency for the zoom sliders."""
+    return tuple((float(c.min()), float(c.max())) for c in (_fleet.column(axis) for axis in ["RMS", "Peak", "Frequency"]))
+
+@st.cache_data(max_entries=4)
+def cached_spectrogram(fault_detected):
+    return render_spectrogram(fault_detected)
+
+@st.cache_data(max_entries=256)
+def cached_radar_chart(dna, health_val):
+    return render_radar_chart(dna, health_val)
+
+@st.cache_data(max_entries=256)
+def cached_load_matrix(speed, throttle):
+    return render_load_matrix(speed, throttle)
+
+@st.cache_data(max_entries=512)
+def cached_gauge(title, val, max_val, thresholds):
+    return render_gauge(title, val, max_val, thresholds)
 
 # --- MOBILE VIEW ---
 
@@ -44,9 +90,9 @@ def render_mobile_html(res, alert, theme, bike_asset_path):
 
     # Load bike asset
     bike_img_src = "https://freepngimg.com/thumb/motorcycle/1-motorcycle-png-image.png"
-    local_img = load_asset_as_base64(bike_asset_path)
+    local_img = ASSET_CACHE.data_uri(bike_asset_path, max_width=MOBILE_FRAME_WIDTH)
     if local_img:
-        bike_img_src = f"data:image/png;base64,{local_img}"
+        bike_img_src = local_img
 
     # !!! CRITICAL FIX: Strings are flushed left to prevent Markdown Code Block interpretation !!!
     phone_html = f"""<div class="mobile-frame phone-theme-{current_theme}">
@@ -90,7 +136,7 @@ def render_mobile_html(res, alert, theme, bike_asset_path):
         a = alert
         sched = a.get('sched') or {}
         center = sched.get('center', 'Hero Hub via GPS')
-        slot = sched.get('slot', '2023-01-01 12:00')
+        slot = sched.get('slot') or 'Waitlisted'
         
         # Format Date/Time for UI
         try:
@@ -133,14 +179,103 @@ def render_mobile_html(res, alert, theme, bike_asset_path):
 
 # --- DASHBOARD VIEW ---
 
-def render_fleet_overview(fleet_data):
-    """Renders the global fleet overview."""
-    st.subheader("🌍 Global Fleet Overview")
-    df = pd.DataFrame(fleet_data)
+def sync_fleet_view(fleet):
+    """
+    Advances this session's change-log cursor and keeps the most recently changed rows
+    (at most FLEET_RECENT_CHANGES). Sessions never hold a copy of the fleet table; if one
+    falls behind the change log window it simply skips ahead.
+    """
+    view = st.session_state.get("fleet_view")
+    if view is None or view["fleet_id"] != id(fleet):
+        view = {"fleet_id": id(fleet), "cursor": fleet.version, "recent": None, "applied": 0}
+    else:
+        cursor, positions, rows = fleet.changes.since(view["cursor"])
+        view["applied"] = len(fleet) if positions is None else len(positions)
+        if positions is not None and len(positions):
+            changed = pd.DataFrame({"Vehicle ID": fleet.vins(positions), **rows}).iloc[::-1]
+            if view["recent"] is not None:
+                changed = pd.concat([changed, view["recent"]], ignore_index=True)
+            view["recent"] = changed.drop_duplicates("Vehicle ID").head(FLEET_RECENT_CHANGES).reset_index(drop=True)
+        view["cursor"] = cursor
+    st.session_state.fleet_view = view
+    return view
+
+@st.fragment(run_every=FLEET_POLL_INTERVAL_S)
+def render_fleet_live(fleet):
+    """
+    Live fleet board: polls the change log and sends the browser one bounded page of the
+    table plus the recently changed rows, never the full table.
+    """
+    view = sync_fleet_view(fleet)
     c1, c2 = st.columns([2, 1])
-    with c1: st.dataframe(df, use_container_width=True, height=400)
+    with c1:
+        pages = max(1, -(-len(fleet) // FLEET_PAGE_ROWS))
+        page = int(st.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, key="fleet_page"))
+        start = (page - 1) * FLEET_PAGE_ROWS
+        st.dataframe(fleet.page(start, start + FLEET_PAGE_ROWS), use_container_width=True, height=300, hide_index=True)
+        st.caption(f"● Live · version {view['cursor']:,} · {view['applied']:,} rows updated this tick")
+        if view["recent"] is not None:
+            st.markdown("**Recently Changed**")
+            st.dataframe(view["recent"], use_container_width=True, height=150, hide_index=True)
     with c2:
-         st.plotly_chart(render_fleet_scatter(df), use_container_width=True)
+         with st.expander("🔍 Zoom (refines aggregation)"):
+             ranges = []
+             for axis, (lo, hi) in zip(["RMS", "Peak", "Frequency"], cached_fleet_ranges(fleet, id(fleet), view["cursor"])):
+                 ranges.append(st.slider(axis, lo, hi, (lo, hi), key=f"zoom_{axis}") if hi > lo else (lo, hi))
+         st.plotly_chart(cached_fleet_scatter(fleet, id(fleet), view["cursor"], tuple(ranges)), use_container_width=True)
+
+def render_fleet_overview(fleet, fleet_index):
+    """Renders the global fleet overview."""
+    st.subheader("🌍 Global Fleet Overview")
+    render_fleet_live(fleet)
+
+    with st.expander("🎯 Recall Scoping Query"):
+        q1, q2, q3 = st.columns(3)
+        batches = q1.multiselect("Batch ID", fleet_index.values("batch_id"))
+        faults = q2.multiselect("Fault Type", fleet_index.values("fault_type"))
+        dtcs = q3.multiselect("DTC", fleet_index.values("dtc"))
+        hits = fleet_index.query(batch_id=batches or None, fault_type=faults or None, dtc=dtcs or None)
+        st.metric("Matching VINs", f"{len(hits):,}")
+        st.dataframe(pd.DataFrame({"Vehicle ID": fleet.vins(hits.positions()[:1000])}), use_container_width=True, height=200)
+
+    with st.expander("🧪 Emerging Batch Defects (Fleet Statistics)"):
+        defects = get_master_agent().defects
+        scan = defects.scan()
+        st.metric("Flagged Clusters", int(scan["flagged"].sum()), delta=f"{len(scan)} cells tested · FDR {defects.alpha:g}", delta_color="off")
+        st.dataframe(scan.head(50).round({"rate": 4, "baseline_rate": 4, "expected": 1, "lift": 2, "chi2": 1}), use_container_width=True, height=220, hide_index=True)
+
+    with st.expander("🗄 Blackbox Waveform Archive"):
+        archive = get_master_agent().blackbox
+        b1, b2, b3 = st.columns(3)
+        fault = b1.selectbox("Fault Type", ["All", "Rod Knock", "Misfire", "Mount Failure", "Unknown Anomaly"])
+        batch = b2.selectbox("Batch", ["All"] + list(fleet_index.values("batch_id")))
+        days = b3.number_input("Last N days", min_value=1, value=7)
+        since = datetime.datetime.now() - datetime.timedelta(days=int(days))
+        filters = {"batch_id": None if batch == "All" else batch, "fault_type": None if fault == "All" else fault, "since": since}
+        st.metric("Archived Waveforms", f"{archive.count(**filters):,}", delta=f"{archive.stats()['bytes'] / 2**20:.1f} MB on disk", delta_color="off")
+        # Expander bodies run on every rerun: read only the five newest waveforms
+        meta, waves = archive.query(**filters, limit=5, newest=True)
+        if len(meta):
+            st.line_chart(pd.DataFrame(waves.T, columns=meta["vin"] + " #" + meta["id"].astype(str)))
+
+def render_run_history(vin):
+    """Recent runs of this vehicle from the shared ResultStore, plus store occupancy."""
+    store = get_result_store()
+    runs = store.history(vin)
+    with st.expander(f"🕘 Run History ({len(runs)})"):
+        st.dataframe(pd.DataFrame([{
+            "Time": r.telemetry.timestamp,
+            "Fault": r.final_diagnosis.get("fault_type", "Normal"),
+            "Confidence": r.final_diagnosis.get("confidence", 0.0),
+            "RMS (g)": r.telemetry.rms,
+            "Driver Score": (r.driver_behavior or {}).get("safety_score"),
+            "SOH %": (r.battery_health or {}).get("soh_percentage"),
+            "Upload KB": r.data_upload_size_kb,
+            "Waveform": "kept" if r.telemetry.raw_waveform else "expired",
+        } for r in runs]), use_container_width=True, hide_index=True)
+        s = store.stats()
+        st.caption(f"Store: {s['results']} runs / {s['vehicles']} vehicles · {s['bytes'] / 2**20:.1f} of "
+                   f"{s['budget_bytes'] / 2**20:.0f} MB · {s['evicted']} evicted · {s['waveforms_expired']} waveforms expired")
 
 def render_inspector_view(res):
     """Renders the detailed inspector view for a single vehicle."""
@@ -152,7 +287,7 @@ def render_inspector_view(res):
     conf = res.final_diagnosis.get("confidence", 0.0)
     
     # 1. Get Decision from Core (Logic Engine)
-    strat_decision = calculate_oem_strategy(res.vehicle_id, ft)
+    strat_decision = calculate_oem_strategy(res.vehicle_id, ft, get_master_agent().recall_scope, res.telemetry.batch_id)
     
     # 2. Render UI if Core says so (Presentation Layer)
     if strat_decision["show_card"]:
@@ -160,7 +295,8 @@ def render_inspector_view(res):
             vin=res.vehicle_id, 
             batch_id=strat_decision["batch_id"], 
             fault_type=ft, 
-            confidence=conf
+            confidence=conf,
+            scope=strat_decision.get("scope")
         )
     # --------------------------------------
     # --------------------------------------
@@ -195,14 +331,27 @@ def render_inspector_view(res):
                     kurt = np.mean((sig - mean_sig)**4) / (std_sig**4)
                 else:
                     kurt = 0
+
+                # 4. Envelope Burst Signature (knock band, Hilbert envelope)
+                burst = {k: float(v[0]) for k, v in envelope_features(sig).items()}
+                knock = bool(is_knock(burst["burst_prominence"], burst["band_rms"]))
                     
             st.markdown(render_metric_card("Dominant Freq", f"{int(dom_freq)}", "Hz", "#a855f7"), unsafe_allow_html=True)
             st.markdown(render_metric_card("Crest Factor", f"{crest:.2f}", "", "#3b82f6"), unsafe_allow_html=True)
             st.markdown(render_metric_card("Kurtosis", f"{kurt:.2f}", "", "#ef4444" if kurt > 3 else "#22c55e"), unsafe_allow_html=True)
+            if len(sig) > 0:
+                st.markdown(render_metric_card("Burst Rate", f"{burst['burst_rate_hz']:.0f}", "Hz", "#ef4444" if knock else "#22c55e"), unsafe_allow_html=True)
+                st.markdown(render_metric_card("Envelope Peak", f"{burst['burst_prominence']:.1f}", "x", "#ef4444" if knock else "#22c55e"), unsafe_allow_html=True)
 
         with c_vis:
             st.markdown("**3D Waterfall Spectrogram (Order Analysis)**")
-            st.plotly_chart(render_spectrogram(res.final_diagnosis.get("fault_detected")), use_container_width=True)
+            st.plotly_chart(cached_spectrogram(bool(res.final_diagnosis.get("fault_detected"))), use_container_width=True)
+            if len(sig) > 0:
+                lo, hi = DSP_KNOCK_BAND_HZ
+                st.markdown(f"**Envelope Spectrum ({lo}-{hi} Hz band)** - periodic impacts show as lines at the burst rate")
+                env_freqs, env_amps = envelope_spectrum(sig)
+                shown = env_freqs <= DSP_BURST_RATE_HZ[1]
+                st.area_chart(pd.DataFrame({"Envelope (g)": env_amps[0][shown]}, index=pd.Index(env_freqs[shown], name="Hz")), height=180)
 
     with tab2:
         # --- 1. Top KPI Row ---
@@ -223,13 +372,16 @@ def render_inspector_view(res):
             st.markdown("**🧬 Driver DNA Profile**")
             dna = res.driver_behavior.get('dna', {})
             health_val = res.battery_health.get('soh_percentage', 90)
-            st.plotly_chart(render_radar_chart(dna, health_val), use_container_width=True)
+            st.plotly_chart(cached_radar_chart(dna, health_val), use_container_width=True)
+            trend = res.driver_behavior.get('trend')
+            if trend:
+                st.caption(f"Trip avg safety {trend['trip']['safety']} ({trend['status']}) over {trend['trip_frames']} frames · smoothed {trend['ewma']['safety']} · peak aggression {trend['trip_peak_aggression']}")
             
             # Display Reasoning Tags
             render_impact_factors(res.driver_behavior.get('tags', []))
 
             st.markdown("**📉 Engine Load Matrix**")
-            st.plotly_chart(render_load_matrix(t.speed_kmh, t.throttle_pos), use_container_width=True)
+            st.plotly_chart(cached_load_matrix(t.speed_kmh, t.throttle_pos), use_container_width=True)
             st.caption("🟢 Green: Efficient Cruising | 🔴 Red: High Load/Struggling")
 
         with col_right:
@@ -237,17 +389,20 @@ def render_inspector_view(res):
             
             # Oil Pressure
             st.caption("🛢 Oil Pressure")
-            st.plotly_chart(render_gauge("", t.oil_pressure, 80, [20, 50]), use_container_width=True)
+            st.plotly_chart(cached_gauge("", t.oil_pressure, 80, [20, 50]), use_container_width=True)
             
             # Battery
             st.caption("🔋 Battery Voltage")
-            st.plotly_chart(render_gauge("", t.battery_volts, 16, [12.0, 14.8]), use_container_width=True)
+            st.plotly_chart(cached_gauge("", t.battery_volts, 16, [12.0, 14.8]), use_container_width=True)
             
             # Coolant
             st.caption("🌡 Coolant Temp")
-            st.plotly_chart(render_gauge("", t.coolant_temp, 130, [70, 105]), use_container_width=True)
+            st.plotly_chart(cached_gauge("", t.coolant_temp, 130, [70, 105]), use_container_width=True)
     with tab3:
         render_decision_trace(res.structured_logs)
+        render_run_history(res.vehicle_id)
+        with st.expander("🛡 GenAI Resilience (Circuit Breaker)"):
+            st.dataframe(pd.DataFrame(get_master_agent().genai_metrics()).T.fillna(0), use_container_width=True)
         with st.expander("📡 Network Packet Sniffer (JSON)"): st.json(res.transmitted_payload)
 
 # --- MAIN LAYOUT ---
@@ -256,17 +411,17 @@ def render_app():
     st.set_page_config(page_title="AuroSys Enterprise", layout="wide", page_icon="🛡")
     
     # --- 1. SESSION STATE INIT ---
-    if 'sys' not in st.session_state: st.session_state.sys = MasterAgent()
+    if 'sys' not in st.session_state: st.session_state.sys = get_master_agent()
     if 'res' not in st.session_state: st.session_state.res = None
-    if 'fleet' not in st.session_state: st.session_state.fleet = st.session_state.sys.get_fleet_data()
+    if 'fleet' not in st.session_state: st.session_state.fleet = st.session_state.sys.get_fleet_snapshot()
     if 'latest_alert' not in st.session_state: st.session_state.latest_alert = None
     if 'selected_vin' not in st.session_state: st.session_state.selected_vin = "VIN-10000"
     if 'mobile_theme' not in st.session_state: st.session_state.mobile_theme = 'dark' 
     if 'booking_success' not in st.session_state: st.session_state.booking_success = False
 
     # --- 2. CSS STYLING ---
-    st.markdown(get_main_styles(), unsafe_allow_html=True)
-    st.markdown(get_mobile_theme_styles(), unsafe_allow_html=True)
+    st.markdown(ASSET_CACHE.text("main_styles", get_main_styles), unsafe_allow_html=True)
+    st.markdown(ASSET_CACHE.text("mobile_theme_styles", get_mobile_theme_styles), unsafe_allow_html=True)
 
     # --- 3. HEADER ---
     st.markdown("""
@@ -304,6 +459,7 @@ def render_app():
              with st.spinner("Orchestrating Agents..."):
                 res = st.session_state.sys.execute_workflow(selected_vin, scen, toggles, api_key)
                 st.session_state.res = res
+                get_result_store().put(res)
                 if res.final_diagnosis.get("fault_detected"):
                     st.session_state.latest_alert = {
                         "type": res.final_diagnosis.get("fault_type"), 
@@ -380,7 +536,7 @@ def render_app():
 
     # --- 5. MAIN CONTENT ---
     if view_mode == "Fleet Overview":
-        render_fleet_overview(st.session_state.fleet)
+        render_fleet_overview(st.session_state.fleet, st.session_state.sys.fleet_index)
     elif view_mode == "Single Vehicle Inspector":
         if st.session_state.res and st.session_state.res.vehicle_id == st.session_state.selected_vin:
             render_inspector_view(st.session_state.res)
@@ -4,6 +4,7 @@ import textwrap
 import plotly.graph_objects as go
 import plotly.express as px
 import numpy as np
+from config import LOD_POINT_BUDGET, LOD_FAULT_POINT_BUDGET, LOD_VOXEL_BINS
 
 # --- STYLES ---
 
@@ -290,16 +291,77 @@ def render_gauge(title, val, max_val, thresholds):
     fig.update_layout(height=140, margin=dict(l=10, r=10, t=30, b=10))
     return fig
 
-def render_fleet_scatter(df):
-    """Renders the 3D Fleet Overview Scatter Plot."""
-    fig = px.scatter_3d(df, x="RMS", y="Peak", z="Frequency", color="Health Status", color_discrete_map={"Healthy": "green", "Critical": "red"})
-    fig.update_layout(height=400, margin=dict(l=0,r=0,b=0,t=0))
+FLEET_AXES = ["RMS", "Peak", "Frequency"]
+HEALTH_COLORS = {"Healthy": "green", "Warning": "orange", "Critical": "red"}
+
+def bin_fleet_voxels(xyz, ranges, bins=LOD_VOXEL_BINS):
+    """
+    Bins (N, 3) points into a bins^3 voxel grid spanning `ranges`.
+    Returns (centroids, counts) for the occupied voxels only.
+    """
+    lo = np.array([r[0] for r in ranges], dtype=np.float64)
+    hi = np.array([r[1] for r in ranges], dtype=np.float64)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    cell = np.clip(((xyz - lo) / span * bins).astype(np.int64), 0, bins - 1)
+    key = (cell[:, 0] * bins + cell[:, 1]) * bins + cell[:, 2]
+    _, inv, counts = np.unique(key, return_inverse=True, return_counts=True)
+    centroids = np.stack([np.bincount(inv, weights=xyz[:, k]) for k in range(3)], axis=1) / counts[:, None]
+    return centroids, counts
+
+def render_fleet_scatter(df, ranges=None, bins=LOD_VOXEL_BINS, point_budget=LOD_POINT_BUDGET, fault_point_budget=LOD_FAULT_POINT_BUDGET):
+    """
+    Renders the 3D Fleet Overview Scatter Plot with server-side level of detail.
+    `ranges` is the zoom window [(lo, hi)] * 3 over RMS / Peak / Frequency. Warning and Critical
+    vehicles are drawn individually (up to `fault_point_budget` in view); healthy vehicles beyond
+    `point_budget` are aggregated into voxels sized by count. Voxels span the points in view, so
+    zooming refines them, and every trace is capped at bins^3 markers whatever the fleet size.
+    """
+    xyz = df[FLEET_AXES].to_numpy(dtype=np.float64)
+    in_view = np.ones(len(xyz), dtype=bool)
+    for k, (lo, hi) in enumerate(ranges or []):
+        in_view &= (xyz[:, k] >= lo) & (xyz[:, k] <= hi)
+
+    status = df["Health Status"].to_numpy(dtype=object)
+    vins = df["Vehicle ID"].to_numpy(dtype=object)
+
+    fig = go.Figure()
+    for label, budget in [("Healthy", point_budget), ("Warning", fault_point_budget), ("Critical", fault_point_budget)]:
+        mask = in_view & (status == label)
+        n = int(mask.sum())
+        if n == 0:
+            continue
+        pts = xyz[mask]
+        if n > budget:
+            box = list(zip(pts.min(axis=0), pts.max(axis=0)))
+            centroids, counts = bin_fleet_voxels(pts, box, bins)
+            fig.add_trace(go.Scatter3d(
+                x=centroids[:, 0], y=centroids[:, 1], z=centroids[:, 2], mode="markers", name=f"{label} (aggregated)",
+                marker=dict(size=np.clip(3 + 2 * np.log2(counts), 3, 24), color=HEALTH_COLORS[label], opacity=0.5),
+                text=[f"{c:,} vehicles" for c in counts], hovertemplate="%{text}<extra></extra>"
+            ))
+        else:
+            fig.add_trace(go.Scatter3d(
+                x=pts[:, 0], y=pts[:, 1], z=pts[:, 2], mode="markers", name=label,
+                marker=dict(size=4, color=HEALTH_COLORS[label]), text=vins[mask]
+            ))
+
+    fig.update_layout(
+        scene=dict(xaxis_title="RMS", yaxis_title="Peak", zaxis_title="Frequency"),
+        legend_title_text="Health Status", height=400, margin=dict(l=0,r=0,b=0,t=0)
+    )
     return fig
 
-def render_strategic_decision_card(vin, batch_id="Batch-2023-A", fault_type=None, confidence=0.0):
+def format_inr(amount):
+    """₹ amounts in crore once they reach ₹1 lakh, plain rupees below."""
+    if amount >= 1e5:
+        return f"₹{amount / 1e7:,.2f} Cr"
+    return f"₹{amount:,.0f}"
+
+def render_strategic_decision_card(vin, batch_id="Batch-2023-A", fault_type=None, confidence=0.0, scope=None):
     """
     Renders the high-level Strategic Decision / Executive Summary card.
-    Dynamically updates based on fault_type.
+    Dynamically updates based on fault_type; with a recall `scope` (RecallScopeEngine.scope)
+    the evidence and costs are the live fleet numbers instead of the reference figures.
     """
     if not fault_type or "Normal" in fault_type:
         return
@@ -307,24 +369,40 @@ def render_strategic_decision_card(vin, batch_id="Batch-2023-A", fault_type=None
     # Dynamic Content Logic
     if "Knock" in fault_type:
         headline = "STRATEGIC RECOMMENDATION: TARGETED BATCH RECALL"
-        reasoning = f"The RCA Agent has correlated this Rod Knock pattern across <b>5 distinct vehicles</b> in <code>{batch_id}</code>. This indicates a supplier defect in the connecting rod bearings, not random failure."
+        remedy_note = "This indicates a supplier defect in the connecting rod bearings, not random failure."
+        reasoning = f"The RCA Agent has correlated this Rod Knock pattern across <b>5 distinct vehicles</b> in <code>{batch_id}</code>. {remedy_note}"
         risk_cost = "₹50.0 Cr"
         target_cost = "₹1.2 Cr"
         savings = "₹48.8 Cr"
     elif "Misfire" in fault_type:
         headline = "STRATEGIC RECOMMENDATION: FIRMWARE OTA ROLLOUT"
-        reasoning = f"The RCA Agent has detected a timing desync pattern common to <b>1200 units</b> in Region-North. This is a software calibration issue resolvable via OTA update."
+        remedy_note = "This is a software calibration issue resolvable via OTA update."
+        reasoning = f"The RCA Agent has detected a timing desync pattern common to <b>1200 units</b> in Region-North. {remedy_note}"
         risk_cost = "₹12.0 Cr" # Cost of physical service
         target_cost = "₹0.05 Cr" # cost of OTA
         savings = "₹11.95 Cr"
     else:
         # Fallback/Generic for Mount Failure or any other
         headline = "STRATEGIC RECOMMENDATION: PHYSICAL INSPECTION REQUIRED"
-        reasoning = f"High-frequency vibration detected (Order 2.0/4.0) consistent with <b>Engine Mount degradation</b>. Recommend immediate physical inspection of chassis mounting points."
+        remedy_note = "Recommend immediate physical inspection of chassis mounting points."
+        reasoning = f"High-frequency vibration detected (Order 2.0/4.0) consistent with <b>Engine Mount degradation</b>. {remedy_note}"
         risk_cost = "N/A" # Minimal risk to fleet
         target_cost = "₹0.02 Cr" # Cost of single replacement
         savings = "N/A"
 
+    if scope:
+        if scope["scope"] == "batch":
+            evidence = (f"Fleet scan: <b>{scope['faulted_vins']:,} of {scope['affected_vins']:,} VINs</b> in <code>{scope['batch_id']}</code> "
+                        f"show {fault_type} ({scope['fault_rate']:.1%} vs {scope['baseline_rate']:.2%} fleet baseline, {scope['lift']:.1f}x).")
+        else:
+            headline = "STRATEGIC RECOMMENDATION: " + ("TARGETED OTA UPDATE" if scope["ota"] else "VIN-SPECIFIC SERVICE")
+            evidence = (f"Fleet scan: <b>{scope['faulted_vins']:,} VIN(s)</b> of {scope['fleet_size']:,} show {fault_type} with no batch "
+                        f"concentration above the {scope['baseline_rate']:.2%} baseline.")
+        reasoning = f"{evidence} {remedy_note}"
+        risk_cost = format_inr(scope["global_risk_inr"])
+        target_cost = format_inr(scope["targeted_cost_inr"])
+        savings = format_inr(scope["savings_inr"])
+
     conf_pct = f"{confidence*100:.1f}%"
 
     st.markdown(f"""